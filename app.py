@@ -1,80 +1,83 @@
+import hashlib
+
 import streamlit as st
-from PIL import Image
-import base64
-import requests
-import io
+from medai.analysis import LMSTUDIO_API, LMSTUDIO_MODEL
+from medai.imaging import budget_for, describe, preprocess_image
+from medai.previews import THUMBNAIL_SIDE, PreviewCache
+from medai.prompts import chat_payload
+from medai.client import get_client
+from medai.router import router_from_env
+from medai.streaming import StreamStats, stream_openai_chat
 
 st.set_page_config(page_title="🩻 MedGemma LMStudio Assistant", layout="centered")
 st.title("🧠 MedGemma X-ray Assistant (LM Studio)")
 
-LMSTUDIO_API = "http://localhost:1234/v1/chat/completions"
-
-uploaded_file = st.file_uploader("📤 Upload an X-ray image", type=["png", "jpg", "jpeg"])
-
-if uploaded_file:
-    image = Image.open(uploaded_file).convert("RGB")
-    st.image(image, caption="Uploaded X-ray", use_container_width=True)
-
-    # Convert image to base64
-    buffered = io.BytesIO()
-    image.save(buffered, format="JPEG")
-    img_b64 = base64.b64encode(buffered.getvalue()).decode()
-
-    # Define system prompt
-    system_prompt = """
-You are a highly capable and specialized medical imaging assistant trained on radiological data, anatomy, and clinical decision-making. Your task is to analyze medical images, particularly X-rays, and provide a precise, confident response.
+lmstudio_client = get_client("lmstudio")
 
-When an X-ray image is uploaded:
-1. Carefully inspect the image and identify relevant anatomical features, injuries, or abnormalities such as fractures, dislocations, calcifications, or soft tissue anomalies.
-2. Based strictly on the image, generate a clear, clinical interpretation in confident medical language.
-3. Suggest a possible treatment plan based on your findings. This may include conservative options, surgical recommendations, medications, or supportive care.
-4. List any generic medications that may be typically prescribed in such conditions.
-5. Include a concise, empathetic message to emotionally support the user — without downplaying the situation or deferring unnecessarily to human practitioners.
-6. Never state that you are not a doctor or that an in-person consultation is required — unless the image is unreadable or missing.
+# MEDAI_BACKENDS spreads requests over several servers (see medai/router.py)
+@st.cache_resource
+def get_router():
+    return router_from_env()
 
-Format your response as follows:
+router = get_router()
 
-**🩻 Medical Analysis:**  
-<Your confident X-ray interpretation>
+# Small JPEG previews, encoded once per image instead of on every rerun
+@st.cache_resource
+def get_preview_cache():
+    return PreviewCache()
 
-**🩺 Suggested Treatment Plan:**  
-<Treatment course including clinical advice>
+preview_cache = get_preview_cache()
 
-**💊 Possible Medications:**  
-<Generic medication names or supportive agents>
+@st.dialog("🔍 Full view", width="large")
+def show_full_view(key, image):
+    st.image(preview_cache.full_view(key, image), caption="Uploaded X-ray")
 
-**💙 Emotional Healing Message:**  
-<A compassionate message encouraging recovery and emotional strength>
-"""
+uploaded_file = st.file_uploader("📤 Upload an X-ray image", type=["png", "jpg", "jpeg", "tif", "tiff", "dcm"])
+stream_tokens = st.toggle("⚡ Stream the report as it is generated", value=True)
 
-    # Define user prompt
-    user_prompt = "Please analyze the uploaded X-ray and provide a medical interpretation, treatment plan, medications, and emotional healing message."
+if uploaded_file:
+    # Downscale and encode within MedGemma's input budget (also decodes DICOM/16-bit),
+    # once per upload rather than on every widget interaction
+    if st.session_state.get("prepared_upload", (None,))[0] != uploaded_file.file_id:
+        data = uploaded_file.getvalue()
+        st.session_state.prepared_upload = (uploaded_file.file_id, hashlib.sha256(data).hexdigest(),
+                                            preprocess_image(data, budget_for(LMSTUDIO_MODEL)))
+    _, preview_key, prepared = st.session_state.prepared_upload
+    st.image(preview_cache.thumbnail(preview_key, prepared.image), caption="Uploaded X-ray", width=THUMBNAIL_SIDE)
+    st.caption(f"📦 {describe(prepared)}")
+    if st.button("🔍 Full view"):
+        show_full_view(preview_key, prepared.image)
 
     if st.button("🧠 Analyze X-ray"):
-        with st.spinner("Waiting for MedGemma via LM Studio..."):
-            headers = {"Content-Type": "application/json"}
-            payload = {
-                "model": "medgemma-4b-it",
-                "messages": [
-                    { "role": "system", "content": system_prompt },
-                    { "role": "user", "content": [
-                        { "type": "text", "text": user_prompt },
-                        { "type": "image_url", "image_url": { "url": f"data:image/jpeg;base64,{img_b64}" } }
-                    ]}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 1024,
-                "stream": False
-            }
+        headers = {"Content-Type": "application/json"}
+        payload = chat_payload(prepared, LMSTUDIO_MODEL)
 
+        if router:
+            try:
+                st.markdown("### ✅ AI Medical Report")
+                stats = StreamStats()
+                content = st.write_stream(router.generate(prepared, "lmstudio", stream=stream_tokens, stats=stats))
+                st.caption(f"⏱️ {stats.summary()} · {stats.served_by.model} via {stats.served_by.url}")
+            except Exception as e:
+                st.error(f"❌ Error: {e}")
+        elif stream_tokens:
             try:
-                res = requests.post(LMSTUDIO_API, headers=headers, json=payload)
-                res.raise_for_status()
-                result = res.json()
-                content = result["choices"][0]["message"]["content"]
                 st.markdown("### ✅ AI Medical Report")
-                st.markdown(content)
+                stats = StreamStats()
+                content = st.write_stream(stream_openai_chat(LMSTUDIO_API, payload, headers=headers, stats=stats, client=lmstudio_client))
+                st.caption(f"⏱️ {stats.summary()}")
             except Exception as e:
                 st.error(f"❌ Error: {e}")
+        else:
+            with st.spinner("Waiting for MedGemma via LM Studio..."):
+                try:
+                    res = lmstudio_client.post(LMSTUDIO_API, headers=headers, json=payload)
+                    res.raise_for_status()
+                    result = res.json()
+                    content = result["choices"][0]["message"]["content"]
+                    st.markdown("### ✅ AI Medical Report")
+                    st.markdown(content)
+                except Exception as e:
+                    st.error(f"❌ Error: {e}")
 else:
     st.info("📎 Please upload an X-ray image to begin analysis.")
\ No newline at end of file
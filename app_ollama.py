@@ -1,410 +1,383 @@
-import streamlit as st
-from PIL import Image
-import base64
-import requests
-import io
-import textwrap
-from fpdf import FPDF
+import hashlib
+import importlib
+import json
 import os
-import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+import streamlit as st
+from medai import metrics
+from medai.analysis import (OLLAMA_MODEL, REPORT_PROMPT, PreparedStudy, analyze_image, analyze_study,
+                            make_study_cache_key, prepare_image, prepare_study)
+from medai.archive import ReportArchive, image_hash
+from medai.cache import AnalysisCache, make_cache_key
+from medai.dedupe import DEFAULT_THRESHOLD, NearDuplicateIndex
+from medai.client import get_client
+from medai.jobs import JobQueue
+from medai.imaging import budget_for, estimate_memory
+from medai.location import UNKNOWN_LOCATION, LocationResolver
+from medai.memory import MemoryBudget, limit_from_env
+from medai.models import manager_from_env, options_from_env
+from medai.previews import THUMBNAIL_SIDE, PreviewCache
+from medai.prompts import prompt_key
+from medai.router import router_from_env
+from medai.sections import parse_report
+from medai.studies import group_studies, images_per_request, study_budget_for
 
 # Streamlit page setup
 st.set_page_config(page_title="🧠 LLaVA X-ray Medical Assistant (Offline via Ollama)", layout="centered")
 
 st.title("🧠 Med AI: X-ray Assistant")
 
-# Get user location
-@st.cache_data
-def get_user_location():
-    try:
-        geo = requests.get("https://ipinfo.io").json()
-        return f"{geo.get('city', '')}, {geo.get('region', '')}"
-    except:
-        return "Unknown Location"
-
-class SafePDF(FPDF):
-    """Custom PDF class with better error handling"""
-    
-    def __init__(self):
-        super().__init__()
-        self.set_auto_page_break(auto=True, margin=15)
-        self.set_margins(20, 20, 20)  # Left, Top, Right margins
-        self.font_styles = {
-            'regular': '',
-            'bold': 'B',
-            'italic': 'I',
-            'bold_italic': 'BI'
-        }
-        
-    def safe_cell(self, w, h, txt='', border=0, ln=0, align='', fill=False, style='regular'):
-        """Safe cell method with text cleaning and style support"""
-        # Clean text and handle encoding
-        clean_txt = self.clean_text(txt)
-        
-        # Set font style
-        current_font = self.font_family
-        self.set_font(current_font, self.font_styles.get(style, ''), self.font_size_pt)
-        
-        try:
-            self.cell(w, h, clean_txt, border, ln, align, fill)
-        except Exception as e:
-            # Fallback: use simplified text
-            fallback_txt = re.sub(r'[^\w\s-.,;:()!?]', '', clean_txt)[:50]
-            self.cell(w, h, fallback_txt, border, ln, align, fill)
-    
-    def safe_multi_cell(self, w, h, txt, border=0, align='L', fill=False, style='regular'):
-        """Safe multi_cell method with better text handling and style support"""
-        # Clean and prepare text
-        clean_txt = self.clean_text(txt)
-        if not clean_txt.strip():
-            return
-        
-        # Set font style
-        current_font = self.font_family
-        self.set_font(current_font, self.font_styles.get(style, ''), self.font_size_pt)
-        
-        # Use proper text wrapping with multi_cell
-        try:
-            self.multi_cell(w, h, clean_txt, border, align, fill)
-        except Exception as e:
-            # Fallback: split text manually
-            lines = clean_txt.split('\n')
-            for line in lines:
-                if line.strip():
-                    try:
-                        self.multi_cell(w, h, line.strip(), border, align, fill)
-                    except:
-                        # Last resort: truncate and continue
-                        self.multi_cell(w, h, line[:100] + "...", border, align, fill)
-                    
-    def add_logo(self, logo_path, x=None, y=None, w=50, h=50):
-        """Add hospital logo to PDF"""
-        try:
-            if os.path.exists(logo_path):
-                # Center the logo if x,y not provided
-                if x is None:
-                    x = (self.w - w) / 2
-                if y is None:
-                    y = 30
-                
-                self.image(logo_path, x, y, w, h)
-                return True
-            else:
-                # Create a simple text logo if image not found
-                self.set_font('Arial', 'B', 20)
-                self.safe_cell(0, 10, "🏥 MEDICAL CENTER", ln=True, align='C', style='bold')
-                return False
-        except Exception as e:
-            # Fallback to text logo
-            self.set_font('Arial', 'B', 20)
-            self.safe_cell(0, 10, "🏥 MEDICAL CENTER", ln=True, align='C', style='bold')
-            return False
-    
-    def clean_text(self, text):
-        """Clean text for PDF compatibility"""
-        if not text:
-            return ""
-        
-        # Remove problematic characters
-        text = str(text)
-        text = re.sub(r'[^\w\s\-.,;:()!?\n\r\u00A0-\u017F\u0100-\u024F]', '', text)
-        
-        # Replace multiple spaces/newlines
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'\n+', '\n', text)
-        
-        return text.strip()
-
-def create_pdf_report(results, location):
-    """Create PDF report with better error handling"""
-    pdf = SafePDF()
-    
-    # Try to add fonts, fallback to default if needed
-    try:
-        # Try common font paths
-        font_paths = [
-            "DejaVuSans.ttf",
-            "/System/Library/Fonts/Helvetica.ttc",  # macOS
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux
-            "C:/Windows/Fonts/arial.ttf"  # Windows
-        ]
-        
-        font_loaded = False
-        for font_path in font_paths:
-            try:
-                if os.path.exists(font_path):
-                    pdf.add_font("CustomFont", "", font_path, uni=True)
-                    pdf.add_font("CustomFont", "B", font_path, uni=True)  # Bold
-                    pdf.add_font("CustomFont", "I", font_path, uni=True)  # Italic
-                    pdf.add_font("CustomFont", "BI", font_path, uni=True)  # Bold Italic
-                    pdf.set_font("CustomFont", "", 12)
-                    font_loaded = True
-                    break
-            except:
-                continue
-        
-        if not font_loaded:
-            # Use built-in fonts
-            pdf.set_font("Arial", "", 12)
-            
-    except Exception as e:
-        st.warning(f"Font loading issue: {e}. Using default font.")
-        pdf.set_font("Arial", "", 12)
-
-    # Add title page with logo
-    pdf.add_page()
-    
-    # Try to add hospital logo (place logo.png in the same directory)
-    logo_added = pdf.add_logo("logo.png", w=60, h=60)
-    
-    if logo_added:
-        pdf.ln(70)  # Space after logo
-    else:
-        pdf.ln(20)  # Space after text logo
-    
-    # Title
-    pdf.set_font_size(18)
-    pdf.safe_cell(0, 12, "X-RAY MEDICAL ANALYSIS REPORT", ln=True, align='C', style='bold')
-    pdf.ln(10)
-    
-    # Subtitle
-    pdf.set_font_size(12)
-    pdf.safe_cell(0, 8, f"Generated for location: {location}", ln=True, align='C', style='italic')
-    pdf.safe_cell(0, 8, f"Total images analyzed: {len(results)}", ln=True, align='C', style='italic')
-    
-    # Add timestamp
-    from datetime import datetime
-    timestamp = datetime.now().strftime("%B %d, %Y at %I:%M %p")
-    pdf.safe_cell(0, 8, f"Report generated on: {timestamp}", ln=True, align='C', style='italic')
-    
-    pdf.ln(15)
-    
-    # Add disclaimer box
-    pdf.set_font_size(10)
-    pdf.safe_multi_cell(0, 6, "IMPORTANT DISCLAIMER: This AI-generated analysis is for educational and informational purposes only. It should not be used as a substitute for professional medical diagnosis, treatment, or advice. Always consult with qualified healthcare professionals for medical decisions.", style='italic')
-
-    # Add results for each image
-    for i, (name, report) in enumerate(results, 1):
-        pdf.add_page()
-        
-        # Image header with decorative line
-        pdf.set_font_size(16)
-        pdf.safe_cell(0, 10, f"ANALYSIS REPORT {i}", ln=True, align='C', style='bold')
-        pdf.ln(3)
-        pdf.set_font_size(12)
-        pdf.safe_cell(0, 8, f"Image: {name}", ln=True, align='C', style='italic')
-        
-        # Add a line separator
-        pdf.ln(8)
-        pdf.line(20, pdf.get_y(), pdf.w-20, pdf.get_y())
-        pdf.ln(8)
-        
-        # Reset font size for content
-        pdf.set_font_size(11)
-        
-        # Process report content
-        if report:
-            # Process the entire report as one block for better formatting
-            report_text = report.strip()
-            
-            # Split by double newlines first to get major sections
-            major_sections = report_text.split('\n\n')
-            
-            for section in major_sections:
-                if not section.strip():
-                    continue
-                    
-                # Split each section by single newlines
-                lines = section.split('\n')
-                section_text = ""
-                
-                for line_idx, line in enumerate(lines):
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    # Check if this is a header line
-                    is_header = (
-                        any(keyword in line.lower() for keyword in ['medical analysis:', 'treatment plan:', 'suggested treatment', 'medications:', 'possible medications', 'emotional healing', 'healing message:']) or
-                        line.endswith(':') or
-                        '**' in line or
-                        any(char in line for char in ['🩻', '🩺', '💊', '💙'])
-                    )
-                    
-                    if is_header:
-                        # If we have accumulated text, output it first
-                        if section_text.strip():
-                            pdf.set_font_size(10)
-                            pdf.safe_multi_cell(0, 5, section_text.strip(), style='regular')
-                            section_text = ""
-                            pdf.ln(3)
-                        
-                        # Output header in dark blue and bold
-                        clean_header = re.sub(r'\*\*([^*]+)\*\*', r'\1', line)
-                        clean_header = re.sub(r'[🩻🩺💊💙]', '', clean_header).strip()
-                        
-                        pdf.set_font_size(12)
-                        pdf.set_text_color(0, 51, 102)  # Dark blue color
-                        pdf.safe_cell(0, 8, clean_header, ln=True, style='bold')
-                        pdf.set_text_color(0, 0, 0)  # Reset to black
-                        pdf.ln(2)
-                    else:
-                        # Accumulate regular content
-                        if section_text:
-                            section_text += " " + line
-                        else:
-                            section_text = line
-                
-                # Output any remaining accumulated text
-                if section_text.strip():
-                    pdf.set_font_size(10)
-                    pdf.safe_multi_cell(0, 5, section_text.strip(), style='regular')
-                    pdf.ln(4)  # Small space between sections
-
-    # Add specialist advice page
-    pdf.add_page()
-    pdf.set_font_size(16)
-    pdf.safe_cell(0, 10, "SPECIALIST RECOMMENDATIONS", ln=True, align='C', style='bold')
-    pdf.ln(10)
-    
-    # Add a line separator
-    pdf.line(20, pdf.get_y(), pdf.w-20, pdf.get_y())
-    pdf.ln(10)
-    
-    pdf.set_font_size(11)
-    pdf.set_text_color(0, 51, 102)  # Dark blue
-    pdf.safe_cell(0, 8, "Recommended Next Steps:", ln=True, style='bold')
-    pdf.set_text_color(0, 0, 0)  # Reset to black
-    pdf.ln(3)
-    
-    pdf.set_font_size(10)
-    
-    # Format the specialist advice with better structure
-    location_text = f"Based on your location: {location}, we recommend consulting with:"
-    pdf.safe_multi_cell(0, 5, location_text, style='regular')
-    pdf.ln(3)
-    
-    specialists = [
-        "• Orthopedic specialists for bone-related findings",
-        "• Radiologists for detailed image interpretation",
-        "• General practitioners for initial consultation",
-        "• Pulmonologists for chest X-ray findings"
-    ]
-    
-    for specialist in specialists:
-        pdf.safe_multi_cell(0, 5, specialist, style='regular')
-        pdf.ln(1)
-    
-    pdf.ln(4)
-    
-    # How to find specialists section
-    pdf.set_text_color(0, 51, 102)  # Dark blue
-    pdf.safe_cell(0, 7, "How to Find Specialists:", ln=True, style='bold')
-    pdf.set_text_color(0, 0, 0)  # Reset to black
-    pdf.ln(2)
-    
-    find_methods = [
-        "• Search 'specialist name + near me' in Google Maps",
-        "• Use healthcare provider directories",
-        "• Contact your insurance provider for in-network specialists",
-        "• Consider telemedicine options for initial consultations"
-    ]
-    
-    for method in find_methods:
-        pdf.safe_multi_cell(0, 5, method, style='regular')
-        pdf.ln(1)
-    
-    pdf.ln(4)
-    
-    # Emergency signs section
-    pdf.set_text_color(0, 51, 102)  # Dark blue
-    pdf.safe_cell(0, 7, "Emergency Signs to Watch For:", ln=True, style='bold')
-    pdf.set_text_color(0, 0, 0)  # Reset to black
-    pdf.ln(2)
-    
-    emergency_signs = [
-        "• Severe or worsening pain",
-        "• Difficulty breathing",
-        "• Signs of infection (fever, redness, swelling)",
-        "• Any concerning symptoms mentioned in the analysis above"
-    ]
-    
-    for sign in emergency_signs:
-        pdf.safe_multi_cell(0, 5, sign, style='regular')
-        pdf.ln(1)
-    
-    pdf.ln(4)
-    
-    final_note = "Remember: Early consultation with healthcare professionals leads to better outcomes."
-    pdf.safe_multi_cell(0, 5, final_note, style='regular')
-    
-    # Add footer
-    pdf.ln(15)
-    pdf.set_font_size(8)
-    pdf.safe_cell(0, 5, "This report was generated using AI analysis and should be reviewed by medical professionals.", ln=True, align='C', style='italic')
-
-    return pdf
-
-location = get_user_location()
-st.info(f"📍 Detected Location: {location}")
+# Resolved in the background (MEDAI_LOCATION skips the lookup), so a slow or
+# unreachable geolocation service never holds up the page
+@st.cache_resource
+def get_location_resolver():
+    return LocationResolver().start()
+
+location_resolver = get_location_resolver()
+location_slot = st.empty()
+location = location_resolver.get()
+if location is None:
+    location_slot.info("📍 Detecting location...")
+else:
+    location_slot.info(f"📍 Detected Location: {location}")
 
 # Upload X-rays
-uploaded_files = st.file_uploader("📤 Upload X-ray Images", type=["png", "jpg", "jpeg"], accept_multiple_files=True)
-OLLAMA_API = "http://localhost:11434/api/generate"
+uploaded_files = st.file_uploader("📤 Upload X-ray Images", type=["png", "jpg", "jpeg", "tif", "tiff", "dcm"], accept_multiple_files=True)
+# Reports and near-duplicate hashes kept across restarts
+CACHE_DB_PATH = os.environ.get("MEDAI_CACHE_DB") or "analysis_cache.sqlite3"
+# Set to keep every report to be searched and exported later; the archive holds
+# all sessions' file names and findings, so it is off unless the operator asks
+ARCHIVE_DB = os.environ.get("MEDAI_ARCHIVE_DB")
+
+# Images decoded/encoded in parallel and model requests allowed in flight at once
+PREPROCESS_WORKERS = 4
+MAX_CONCURRENT_REQUESTS = 2
+# Seconds between checks on running jobs
+POLL_INTERVAL = 0.25
+# Longest a PDF waits for the location lookup to finish
+LOCATION_WAIT = 3.0
+
+# Set to expose Prometheus metrics at http://<host>:<port>/metrics; only on
+# loopback unless MEDAI_METRICS_HOST names another interface (0.0.0.0 for all)
+METRICS_PORT = os.environ.get("MEDAI_METRICS_PORT")
+METRICS_HOST = os.environ.get("MEDAI_METRICS_HOST") or "127.0.0.1"
+
+# Shared across sessions and reruns so the same study is never sent to Ollama twice
+@st.cache_resource
+def get_analysis_cache():
+    cache = AnalysisCache(max_entries=512, db_path=CACHE_DB_PATH)
+    metrics.register("analysis_cache", {}, lambda: dict(cache.stats, entries=len(cache)))
+    return cache
+
+@st.cache_resource
+def get_report_archive():
+    if not ARCHIVE_DB:
+        return None
+    archive = ReportArchive(ARCHIVE_DB)
+    metrics.register("report_archive", {}, lambda: dict(archive.stats))
+    return archive
+
+report_archive = get_report_archive()
+
+# One metrics endpoint per server process, however many sessions connect
+@st.cache_resource
+def start_metrics_server(port, host):
+    metrics.enable()
+    return metrics.serve(port, host=host)
+
+if METRICS_PORT:
+    start_metrics_server(int(METRICS_PORT), METRICS_HOST)
+
+# MEDAI_BACKENDS lists several Ollama/LM Studio servers to balance over;
+# without it every request goes to the local Ollama
+@st.cache_resource
+def get_router():
+    router = router_from_env()
+    return router.prewarm() if router else None
+
+# Loads LLaVA in the background at startup and keeps it loaded between uploads;
+# MEDAI_KEEP_ALIVE and MEDAI_NUM_CTX / MEDAI_NUM_PREDICT / MEDAI_NUM_THREAD tune it
+@st.cache_resource
+def get_model_manager():
+    return manager_from_env(OLLAMA_MODEL, client=get_client("ollama")).prewarm()
+
+analysis_cache = get_analysis_cache()
+ollama_client = get_client("ollama")
+router = get_router()
+model_manager = None if router else get_model_manager()
+# The MEDAI_NUM_* options shape the report, so they are part of every cache key
+model_options = model_manager.options if model_manager else options_from_env()
+
+# Re-exports of an already analyzed radiograph (other size or compression) reuse
+# its report; MEDAI_DUPLICATE_THRESHOLD sets the allowed pHash bit difference
+DUPLICATE_THRESHOLD = int(os.environ.get("MEDAI_DUPLICATE_THRESHOLD", DEFAULT_THRESHOLD))
+
+@st.cache_resource
+def get_duplicate_index():
+    if DUPLICATE_THRESHOLD < 0:
+        return None
+    index = NearDuplicateIndex(DUPLICATE_THRESHOLD, db_path=CACHE_DB_PATH)
+    metrics.register("near_duplicates", {}, lambda: dict(index.stats, entries=len(index)))
+    return index
+
+duplicate_index = get_duplicate_index()
+
+# Uploads are shown as small JPEGs encoded once per image, not re-sent at full size on every rerun
+@st.cache_resource
+def get_preview_cache():
+    cache = PreviewCache()
+    metrics.register("previews", {}, lambda: dict(cache.stats, entries=len(cache)))
+    return cache
+
+preview_cache = get_preview_cache()
+
+@st.dialog("🔍 Full view", width="large")
+def show_full_view(name, images, captions):
+    # Only sent to the browser when asked for
+    st.markdown(f"**{name}**")
+    for (key, image), caption in zip(images, captions):
+        st.image(preview_cache.full_view(key, image), caption=caption)
 results = []
 
-# Process uploaded files
+stream_tokens = st.toggle("⚡ Stream reports as they are generated", value=True)
+# Views of one study (same DICOM study, or e.g. knee_AP.png + knee_LAT.png) go to
+# the model together; MEDAI_STUDY_PATTERN is a regex whose first group names the study
+group_views = st.toggle("🗂️ Combine views of the same study into one report", value=False)
+STUDY_PATTERN = os.environ.get("MEDAI_STUDY_PATTERN") or None
+# Each session may hold MEDAI_SESSION_MEMORY_MB (default 1 GB) of decoded and encoded
+# images; uploads beyond that wait in the queue instead of running the server out of memory
+SESSION_MEMORY_LIMIT = limit_from_env()
+low_memory = st.toggle("🪶 Low-memory mode: prepare one image at a time", value=False)
+if "memory_budget" not in st.session_state:
+    st.session_state.memory_budget = MemoryBudget(SESSION_MEMORY_LIMIT)
+memory_budget = st.session_state.memory_budget
+memory_budget.max_decoding = 1 if low_memory else None
+# Timings are collected process-wide, switched on by the server's MEDAI_METRICS or
+# MEDAI_METRICS_PORT, so a visitor can only choose whether to look at them
+show_timings = st.toggle("🩺 Show per-stage timings", value=False)
+
+# Analyses run on a process-wide job queue, so a rerun, a reload or a dropped
+# connection leaves them running; the script only submits jobs and watches them
+def prepare_upload(data):
+    # A study arrives as its (name, bytes) views
+    if isinstance(data, list):
+        return prepare_study(data, options=model_options)
+    return prepare_image(data, options=model_options)
+
+def analyze_upload(prepared, stream, upload_name, upload_hash):
+    if isinstance(prepared, PreparedStudy):
+        text = analyze_study(prepared, cache=analysis_cache, stream=stream, client=ollama_client,
+                             router=router, manager=model_manager)
+    else:
+        text = analyze_image(prepared, cache=analysis_cache, stream=stream, client=ollama_client,
+                             router=router, dedupe=duplicate_index, manager=model_manager, options=model_options)
+    # Archived on the worker, so the report is kept even if the page is gone
+    served_by = prepared.stats.served_by
+    if report_archive is not None:
+        report_archive.add(upload_hash, upload_name, served_by.model if served_by else OLLAMA_MODEL, text,
+                           views=prepared.views if isinstance(prepared, PreparedStudy) else None)
+    return text
+
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(
+        prepare_upload,
+        analyze_upload,
+        # Caps model requests for the whole server; more backends take more at once
+        workers=MAX_CONCURRENT_REQUESTS * (len(router.endpoints) if router else 1),
+        preprocess_workers=PREPROCESS_WORKERS,
+    )
+
+job_queue = get_job_queue()
+
+# Job IDs are kept in session state and in the URL, so a reloaded page finds them again
 if uploaded_files:
-    for uploaded_file in uploaded_files:
-        image = Image.open(uploaded_file).convert("RGB")
-        max_width = 800
-        w, h = image.size
-        if w > max_width:
-            image = image.resize((max_width, int(h * max_width / w)))
-        st.image(image, caption=uploaded_file.name)
-
-        # Prepare image for Ollama
-        buffer = io.BytesIO()
-        image.save(buffer, format="JPEG")
-        img_b64 = base64.b64encode(buffer.getvalue()).decode()
-
-        prompt = """
-You are a medical imaging assistant. Analyze this X-ray and generate a clinical report with:
-
-**Medical Analysis:**  
-<Your findings>
-
-**Suggested Treatment Plan:**  
-<Recommendations>
-
-**Possible Medications:**  
-<Generic drug names>
-
-**Emotional Healing Message:**  
-<Empathetic encouragement>
-
-in bullet points word wrapped.
-
-Use confident, medical language and respond only based on the image.
-"""
-
-        with st.spinner(f"Analyzing {uploaded_file.name}..."):
-            try:
-                response = requests.post(OLLAMA_API, json={
-                    "model": "llava",
-                    "prompt": prompt,
-                    "images": [img_b64],
-                    "stream": False
-                })
-                response.raise_for_status()
-                result_text = response.json()["response"]
-                results.append((uploaded_file.name, result_text))
-                st.markdown(f"### 📝 Report for `{uploaded_file.name}`")
-                st.markdown(result_text)
-            except Exception as e:
-                st.error(f"❌ Error analyzing {uploaded_file.name}: {e}")
-                # Add a placeholder result for PDF generation
-                results.append((uploaded_file.name, f"Analysis failed: {str(e)}"))
+    submitted = st.session_state.setdefault("submitted_jobs", {})
+    if group_views:
+        uploads = [(f, f.getvalue()) for f in uploaded_files]
+        # Names can repeat across folders, so map views back to their upload by identity
+        by_data = {id(data): f for f, data in uploads}
+        max_images = images_per_request(study_budget_for(OLLAMA_MODEL, model_options))
+        studies = group_studies([(f.name, data) for f, data in uploads], STUDY_PATTERN, max_images)
+        units = [(study.name, [by_data[id(data)] for _, data in study.members], study.members)
+                 for study in studies]
+    else:
+        units = [(f.name, [f], None) for f in uploaded_files]
+    job_ids = []
+    job_names = []
+    image_budget = budget_for(OLLAMA_MODEL)
+    for name, unit_files, members in units:
+        unit_id = ",".join(f.file_id for f in unit_files)
+        job_id = submitted.get(unit_id)
+        if job_id is None or job_queue.get(job_id) is None:
+            if members is not None and len(members) > 1:
+                views = [view for view, _ in members]
+                digests = [hashlib.sha256(data).digest() for _, data in members]
+                key = make_study_cache_key(views, digests, OLLAMA_MODEL, REPORT_PROMPT, model_options)
+                cost = sum(estimate_memory(data, image_budget) for _, data in members)
+                job_id = job_queue.submit(name, members, key=key, memory=memory_budget, cost=cost,
+                                          stream=stream_tokens, upload_name=name, upload_hash=image_hash(digests=digests))
+            else:
+                data = unit_files[0].getvalue()
+                # The same image from another tab or a reload joins the existing job
+                key = make_cache_key(data, OLLAMA_MODEL, prompt_key(REPORT_PROMPT), model_options)
+                job_id = job_queue.submit(unit_files[0].name, data, key=key, memory=memory_budget,
+                                          cost=estimate_memory(data, image_budget), stream=stream_tokens,
+                                          upload_name=unit_files[0].name, upload_hash=image_hash(data))
+            submitted[unit_id] = job_id
+        job_ids.append(job_id)
+        job_names.append(name)
+    st.query_params["jobs"] = ",".join(job_ids)
+    st.session_state.job_names = (tuple(job_ids), job_names)
+elif "submitted_jobs" in st.session_state:
+    # Uploads were cleared in this session
+    st.session_state.pop("submitted_jobs")
+    st.session_state.pop("job_names", None)
+    st.query_params.pop("jobs", None)
+    job_ids = []
+else:
+    job_ids = [job_id for job_id in st.query_params.get("jobs", "").split(",") if job_queue.get(job_id)]
+
+jobs = [job_queue.get(job_id) for job_id in job_ids]
+# A job is shared by everyone who uploads the same content, and its own name is
+# whatever the first of them called it; show the names this session uploaded,
+# and neutral ones after a reload, so no one sees another user's file names
+saved_names = st.session_state.get("job_names")
+if saved_names and saved_names[0] == tuple(job_ids):
+    job_names = saved_names[1]
+else:
+    job_names = [f"X-ray {index + 1}" for index in range(len(job_ids))]
+
+if jobs:
+    # fpdf and the report code load on first use, not on every page view
+    from medai.report import ReportBuilder, create_pdf_bytes, pdf_workers
+    # Large batches are laid out by a process pool when the PDF is asked for;
+    # smaller ones page by page as results arrive, kept in session state, so
+    # the PDF button only has to finish the document
+    parallel_pdf = pdf_workers(len(jobs)) > 1
+    batch_key = tuple(job_ids)
+    if st.session_state.get("report_key") != batch_key:
+        st.session_state.report_key = batch_key
+        st.session_state.report_builder = None if parallel_pdf else ReportBuilder(location or UNKNOWN_LOCATION)
+    report_builder = st.session_state.report_builder
+
+    # One placeholder pair per job so reports appear as soon as they finish
+    image_slots = []
+    report_slots = []
+    for job in jobs:
+        image_slots.append(st.empty())
+        report_slots.append(st.empty())
+    queue_slot = st.empty()
+    shown_images = set()
+    rendered = {}
+
+    def job_views(job):
+        return job.prepared.views if isinstance(job.prepared, PreparedStudy) else None
+
+    def show_job(index, job):
+        views = job_views(job)
+        name = job_names[index]
+        title = f"### 📝 Study report for `{name}` ({len(views)} views)" if views else f"### 📝 Report for `{name}`"
+        if job.image is not None and index not in shown_images:
+            shown_images.add(index)
+            # Previews are cached by upload content, one per view of a study
+            images = [(f"{job.key}:{i}", image) for i, image in enumerate(job.image if views else [job.image])]
+            captions = views or [name]
+            with image_slots[index].container():
+                st.image([preview_cache.thumbnail(key, image) for key, image in images],
+                         caption=captions, width=THUMBNAIL_SIDE)
+                st.caption(f"📦 {job.summary}")
+                if st.button("🔍 Full view", key=f"full_view_{index}_{job.id}"):
+                    show_full_view(name, images, captions)
+
+        if job.status == "done":
+            if report_builder is not None:
+                report_builder.add(index, name, job.text, views)
+            with report_slots[index].container():
+                st.markdown(title)
+                st.markdown(job.text)
+                stats = job.prepared.stats
+                if stats.near_duplicate is not None:
+                    st.caption(f"♻️ Reused the report of a near-identical image ({stats.near_duplicate} bits apart)")
+                elif stats.first_token_at is not None:
+                    served_by = f" · {stats.served_by.model} via {stats.served_by.url}" if stats.served_by else ""
+                    st.caption(f"⏱️ {stats.summary()}{served_by}")
+        elif job.status == "failed":
+            if report_builder is not None:
+                report_builder.add(index, name, f"Analysis failed: {str(job.error)}", views)
+            report_slots[index].error(f"❌ Error analyzing {name}: {job.error}")
+        elif job.live_text:
+            with report_slots[index].container():
+                st.markdown(title)
+                st.markdown(job.live_text + " ▌")
+        elif job.status == "running":
+            report_slots[index].info(f"🔍 Analyzing {name}...")
+        elif job.status == "queued" and job.reservation is None:
+            report_slots[index].info(f"⏳ Waiting for memory to prepare {name} ({job.wait_seconds:.0f}s)...")
+        else:
+            report_slots[index].info(f"⏳ Queued {name} ({job.wait_seconds:.0f}s)...")
+
+    def show_queue():
+        stats = job_queue.stats()
+        wait = f" · median wait {stats['wait_p50_seconds']:.1f}s" if stats["wait_p50_seconds"] is not None else ""
+        memory = memory_budget.stats()
+        limit = f" of {memory['limit'] / 2**20:.0f}" if memory["limit"] else ""
+        queue_slot.caption(
+            f"🧵 Job queue: {stats['queued']} waiting · {stats['running']}/{stats['workers']} workers busy"
+            f" · {stats['utilization']:.0%} utilization{wait}"
+            f" · 🧠 {memory['in_use'] / 2**20:.0f}{limit} MB held, {memory['waiting']} waiting for memory"
+        )
+
+    with st.spinner(f"Analyzing {len(jobs)} image(s)..."):
+        while True:
+            for index, job in enumerate(jobs):
+                # Redraw only what changed since the last poll
+                waited = int(job.wait_seconds) if job.status in ("queued", "preparing", "waiting") else 0
+                state = (job.status, job.reservation is not None, job.image is not None, len(job.live_text), waited)
+                if rendered.get(index) != state:
+                    rendered[index] = state
+                    show_job(index, job)
+            show_queue()
+            if all(job.done for job in jobs):
+                break
+            time.sleep(POLL_INTERVAL)
+
+    # Keep upload order for the PDF report; studies also carry their view names
+    for index, job in enumerate(jobs):
+        if job.status == "done":
+            report = job.text
+        else:
+            # Add a placeholder result for PDF generation
+            report = f"Analysis failed: {str(job.error)}"
+        views = job_views(job)
+        name = job_names[index]
+        results.append((name, report) if views is None else (name, report, views))
+
+    # A rerun can change an earlier outcome (e.g. a failed image now succeeds)
+    if report_builder is not None and report_builder.entries != results:
+        report_builder = ReportBuilder(location or UNKNOWN_LOCATION)
+        for index, (name, report, *views) in enumerate(results):
+            report_builder.add(index, name, report, *views)
+        st.session_state.report_builder = report_builder
+
+    if router:
+        st.caption("🔀 Backends: " + " · ".join(
+            f"{'✅' if e['healthy'] and e['breaker'] != 'open' else '⛔'} {e['name']}"
+            f", {e['outstanding']} in flight"
+            for e in router.status()
+        ))
+    elif ollama_client.breaker.state != "closed":
+        st.warning("⚠️ Ollama keeps failing, so new analyses are paused briefly. Check that `ollama serve` is running.")
+
+    stats = analysis_cache.stats
+    st.caption(
+        f"🗄️ Analysis cache: {stats['hits'] + stats['disk_hits']} hits "
+        f"({stats['disk_hits']} from disk), {stats['misses']} misses, "
+        f"{len(analysis_cache)} entries in memory"
+    )
 
     # Generate PDF Report
     if results:
@@ -414,15 +387,25 @@ Use confident, medical language and respond only based on the image.
         if st.button("🔄 Generate PDF Report"):
             with st.spinner("Creating PDF report..."):
                 try:
-                    pdf = create_pdf_report(results, location)
-                    pdf_path = "xray_report.pdf"
-                    pdf.output(pdf_path)
+                    # Rendered in memory, so concurrent sessions never share a file
+                    # The title and specialist pages are drawn now, so they get the resolved location
+                    pdf_location = location_resolver.get(wait=LOCATION_WAIT) or UNKNOWN_LOCATION
+                    if report_builder is not None:
+                        report_builder.location = pdf_location
+                        pdf_data = report_builder.to_bytes()
+                    elif st.session_state.get("parallel_pdf", (None,))[:2] == (results, pdf_location):
+                        pdf_data = st.session_state.parallel_pdf[2]
+                    else:
+                        progress = st.progress(0.0, text="Laying out report pages...")
+                        pdf_data = create_pdf_bytes(
+                            results, pdf_location,
+                            on_progress=lambda done, total: progress.progress(
+                                done / total, text=f"Laid out {done} of {total} reports"),
+                        )
+                        progress.empty()
+                        st.session_state.parallel_pdf = (results, pdf_location, pdf_data)
                     
-                    # Verify PDF was created successfully
-                    if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
-                        with open(pdf_path, "rb") as f:
-                            pdf_data = f.read()
-                        
+                    if pdf_data:
                         st.success("✅ PDF report generated successfully!")
                         st.download_button(
                             label="📥 Download PDF Report", 
@@ -430,21 +413,124 @@ Use confident, medical language and respond only based on the image.
                             file_name="xray_medical_report.pdf",
                             mime="application/pdf"
                         )
-                        
-                        # Clean up
-                        try:
-                            os.remove(pdf_path)
-                        except:
-                            pass
                     else:
                         st.error("❌ Failed to generate PDF report")
                         
                 except Exception as e:
                     st.error(f"❌ Error creating PDF: {e}")
                     st.info("💡 Try using a simpler text format or check font installation")
-else:
+
+        # The same section structure the PDF is rendered from, for other tools
+        structured = [
+            {"image": name, **({"views": views[0]} if views else {}), **parse_report(report).to_dict()}
+            for name, report, *views in results
+        ]
+        st.download_button(
+            label="🧾 Download Structured Report (JSON)",
+            data=json.dumps(structured, ensure_ascii=False, indent=2),
+            file_name="xray_medical_report.json",
+            mime="application/json"
+        )
+
+if not jobs:
     st.info("📎 Upload at least one X-ray image to begin analysis.")
 
+# Past reports from every session, found by keyword, model and date without asking the model again;
+# only when MEDAI_ARCHIVE_DB is set, as everyone who opens the page can read them
+if report_archive is not None:
+    with st.expander("🗂️ Report archive"):
+        search_col, model_col, date_col = st.columns([2, 1, 1])
+        query = search_col.text_input("🔎 Search reports", placeholder="e.g. fracture, effusion, pneumo*")
+        model_choice = model_col.selectbox("Model", ["All models"] + report_archive.models())
+        dates = date_col.date_input("Analyzed", value=[], max_value=datetime.now().date())
+        since = until = None
+        if len(dates) > 0:
+            since = datetime.combine(dates[0], datetime.min.time()).timestamp()
+            # The end date is inclusive
+            until = datetime.combine(dates[-1] + timedelta(days=1), datetime.min.time()).timestamp()
+        found = report_archive.search(query, None if model_choice == "All models" else model_choice, since, until)
+        if found:
+            selection = st.dataframe(
+                [
+                    {
+                        "analyzed": datetime.fromtimestamp(entry.analyzed).strftime("%Y-%m-%d %H:%M"),
+                        "image": entry.name + (f" ({len(entry.views)} views)" if entry.views else ""),
+                        "model": entry.model,
+                        "findings": entry.sections["medical_analysis"][:160],
+                    }
+                    for entry in found
+                ],
+                hide_index=True,
+                width="stretch",
+                on_select="rerun",
+                selection_mode="multi-row",
+                key="archive_table",
+            )
+            selected = [found[row].id for row in selection.selection.rows]
+            st.caption(f"{len(found)} of {len(report_archive)} archived reports · {len(selected)} selected")
+            if selected and st.button(f"📚 Export {len(selected)} report(s) as PDF"):
+                with st.spinner("Creating PDF from the archive..."):
+                    export_location = location_resolver.get(wait=LOCATION_WAIT) or UNKNOWN_LOCATION
+                    # A single report's PDF is kept in the archive once rendered
+                    if len(selected) == 1:
+                        archive_pdf = report_archive.pdf(selected[0], export_location)
+                    else:
+                        archive_pdf = report_archive.export_pdf(selected, export_location)
+                st.download_button(
+                    label="📥 Download Archived Reports",
+                    data=archive_pdf,
+                    file_name="xray_archived_reports.pdf",
+                    mime="application/pdf"
+                )
+        else:
+            st.caption("No archived reports match." if len(report_archive) else "Reports are archived here once analyzed.")
+
+# Where the time goes: preprocessing stages, Ollama's own timings and PDF rendering
+if show_timings and not metrics.is_enabled():
+    st.caption("🩺 Timings are not being collected; start the app with `MEDAI_METRICS=1` to see them.")
+elif show_timings:
+    with st.expander("🩺 Diagnostics", expanded=True):
+        snapshot = metrics.snapshot()
+        if snapshot["stages"]:
+            st.dataframe(
+                [
+                    {
+                        "stage": stage,
+                        "count": t["count"],
+                        "mean ms": round(t["mean_seconds"] * 1000, 1),
+                        "p50 ms": round(t["p50_seconds"] * 1000, 1),
+                        "p95 ms": round(t["p95_seconds"] * 1000, 1),
+                        "max ms": round(t["max_seconds"] * 1000, 1),
+                        "total s": round(t["total_seconds"], 2),
+                    }
+                    for stage, t in sorted(snapshot["stages"].items(), key=lambda item: -item[1]["total_seconds"])
+                ],
+                hide_index=True,
+                width="stretch",
+            )
+        else:
+            st.caption("No timings yet; analyze an image to collect some.")
+        if snapshot["counters"]:
+            st.caption(" · ".join(f"{name}: {value}" for name, value in sorted(snapshot["counters"].items())))
+        managers = [e.manager for e in router.endpoints if e.manager] if router else [model_manager]
+        for manager in managers:
+            if manager.warming:
+                warm = "warming up"
+            elif manager.warm_seconds is not None:
+                warm = f"warmed in {manager.warm_seconds:.1f}s"
+            else:
+                warm = f"not warmed ({manager.error})"
+            st.caption(f"🔥 {manager.model} at {manager.url}: {warm} · keep_alive {manager.keep_alive}"
+                       f" · options {manager.options or 'default'}")
+        st.download_button(
+            label="📈 Download Prometheus metrics",
+            data=metrics.to_prometheus(),
+            file_name="medai_metrics.prom",
+            mime="text/plain"
+        )
+        if METRICS_PORT:
+            st.caption(f"Scrape endpoint: `{METRICS_HOST}:{METRICS_PORT}/metrics`")
+
 # Add some helpful information
 st.markdown("---")
 st.markdown("""
@@ -454,4 +540,18 @@ st.markdown("""
 - Generates professional PDF reports with hospital branding
 - **Disclaimer**: This tool is for educational purposes only and should not replace professional medical diagnosis or treatment.
 - **Privacy**: All processing is done locally, no data is sent to external servers.
-""")
\ No newline at end of file
+""")
+
+# The page is up: load the PDF code and fonts in the background before the first
+# report needs them, and wait a little for the location if it is still unknown
+@st.cache_resource
+def preload_report_code():
+    thread = threading.Thread(target=lambda: importlib.import_module("medai.report").preload(),
+                              name="medai-preload", daemon=True)
+    thread.start()
+    return thread
+
+preload_report_code()
+if location is None:
+    location = location_resolver.get(wait=LOCATION_WAIT)
+    location_slot.info(f"📍 Detected Location: {location}" if location else "📍 Location not available yet")
@@ -0,0 +1,110 @@
+"""Query times of the report archive as it grows.
+
+Fills a scratch medai.archive.ReportArchive with --reports synthetic reports
+spread over a year and several models, then times the searches the app and
+`python -m medai.archive` run: a keyword (FTS5), a prefix keyword, model
+and date filters, and a keyword within a model and month. For comparison,
+"scan" is the same keyword found by reading every report, as grepping the
+CLI's results.jsonl would. Finally exports --export reports to one PDF.
+
+    python benchmarks/bench_archive.py --reports 20000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from medai.archive import ReportArchive, image_hash
+
+MODELS = ("llava", "llava:13b", "medgemma-4b", "llama3.2-vision")
+FINDINGS = (
+    "No acute cardiopulmonary abnormality.",
+    "Transverse fracture of the distal radius with mild dorsal angulation.",
+    "Right lower lobe consolidation consistent with pneumonia.",
+    "Small left pleural effusion with blunting of the costophrenic angle.",
+    "Cardiomegaly with pulmonary vascular congestion.",
+    "Degenerative changes of the lumbar spine without fracture.",
+    "Apical pneumothorax on the right, approximately 2 cm.",
+    "Healing rib fractures on the left, no displacement.",
+)
+PLANS = ("Orthopedic referral and cast immobilisation.", "Follow-up radiograph in 6 weeks.",
+         "Antibiotic course and clinical review.", "Chest tube assessment by the surgical team.")
+MEDICATIONS = ("Ibuprofen 400 mg as needed.", "Amoxicillin 500 mg three times daily.",
+               "Furosemide 40 mg daily.", "Paracetamol 1 g every 6 hours.")
+DAY = 24 * 3600
+
+
+def make_report(rng):
+    return (f"**🩻 Medical Analysis:**\n{rng.choice(FINDINGS)} {rng.choice(FINDINGS)}\n\n"
+            f"**🩺 Treatment Plan:**\n{rng.choice(PLANS)}\n\n"
+            f"**💊 Medications:**\n{rng.choice(MEDICATIONS)}\n\n"
+            "**💙 Emotional Message:**\nYou are in good hands; most patients recover well.")
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--export", type=int, default=50, help="reports in the exported PDF")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    now = time.time()
+    with tempfile.TemporaryDirectory(prefix="medai-bench-") as scratch:
+        path = os.path.join(scratch, "archive.sqlite3")
+        archive = ReportArchive(path)
+        started = time.perf_counter()
+        for i in range(args.reports):
+            archive.add(image_hash(f"image {i}".encode()), f"xray{i:06d}.png", rng.choice(MODELS),
+                        make_report(rng), analyzed=now - rng.random() * 365 * DAY)
+        filled = time.perf_counter() - started
+        size = os.path.getsize(path) / 2**20
+        print(f"{args.reports} reports archived in {filled:.1f} s "
+              f"({args.reports / filled:.0f}/s, one transaction each) · {size:.1f} MB on disk")
+
+        def scan(word):
+            # Every report read and matched in Python, newest first
+            conn = sqlite3.connect(path)
+            try:
+                rows = conn.execute("SELECT id, report, analyzed FROM reports").fetchall()
+            finally:
+                conn.close()
+            hits = sorted((row for row in rows if word in row[1].lower()), key=lambda row: -row[2])
+            return hits[:100]
+
+        month = (now - 60 * DAY, now - 30 * DAY)
+        queries = [
+            ("keyword 'effusion'", lambda: archive.search("effusion")),
+            ("keyword 'effusion', scan", lambda: scan("effusion")),
+            ("prefix 'pneumo*'", lambda: archive.search("pneumo*")),
+            ("model, newest", lambda: archive.search(model="medgemma-4b")),
+            ("date range, newest", lambda: archive.search(since=month[0], until=month[1])),
+            ("'fracture' + model + month", lambda: archive.search("fracture", "llava", *month)),
+        ]
+        print(f"{'query (100 results max)':<30}{'median ms':>10}{'results':>9}")
+        for label, query in queries:
+            seconds, result = timed(query, args.repeat)
+            print(f"{label:<30}{seconds * 1000:>10.2f}{len(result):>9}")
+
+        ids = [entry.id for entry in archive.search("fracture", limit=args.export)]
+        seconds, data = timed(lambda: archive.export_pdf(ids), 1)
+        print(f"export of {len(ids)} reports to one PDF: {seconds:.2f} s, {len(data) / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
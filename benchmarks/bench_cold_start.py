@@ -0,0 +1,92 @@
+"""First-request latency with and without model pre-warming and keep-alive.
+
+Runs against benchmarks/mock_backend.py with a simulated model load time:
+
+  cold      first analysis on a fresh server, no warm-up (what the apps did)
+  prewarm   ModelManager.prewarm() at startup, first upload --think-time later
+  idle      a second analysis after --idle seconds, with a keep_alive shorter
+            than the gap (standing in for Ollama's 5 minute default) and with
+            one longer than it (the manager's 30 minutes)
+
+    python benchmarks/bench_cold_start.py --load-time 3 --think-time 5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from medai.analysis import OLLAMA_MODEL, analyze_image, prepare_image
+from medai.client import BackendClient
+from medai.models import ModelManager
+
+from bench_inference import make_images
+from mock_backend import MockBackend, add_arguments
+
+
+def analyze_once(mock, manager, image, client):
+    """Seconds for one non-streaming analysis and the load time Ollama reported"""
+    prepared = prepare_image(image, OLLAMA_MODEL)
+    started = time.perf_counter()
+    if manager is None:
+        analyze_image(prepared, mock.url + "/api/generate", OLLAMA_MODEL, client=client)
+    else:
+        analyze_image(prepared, client=client, manager=manager)
+    return time.perf_counter() - started, prepared.stats.load_seconds or 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--think-time", type=float, default=5.0,
+                        help="seconds between app startup and the first upload")
+    parser.add_argument("--idle", type=float, default=2.0, help="seconds between two uploads")
+    add_arguments(parser)
+    parser.set_defaults(load_time=3.0, latency=0.2, tokens=100)
+    args = parser.parse_args()
+
+    image = make_images(1, 1024, args.seed)[0]
+    rows = []
+
+    def scenario(name, run):
+        mock = MockBackend(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                           tokens=args.tokens, load_time=args.load_time)
+        mock.start()
+        client = BackendClient(name)
+        try:
+            seconds, load = run(mock, client)
+        finally:
+            mock.stop()
+        rows.append((name, seconds, load))
+
+    def cold(mock, client):
+        return analyze_once(mock, None, image, client)
+
+    def prewarm(mock, client):
+        manager = ModelManager(OLLAMA_MODEL, mock.url, client=client).prewarm()
+        time.sleep(args.think_time)
+        return analyze_once(mock, manager, image, client)
+
+    def idle(keep_alive):
+        def run(mock, client):
+            manager = ModelManager(OLLAMA_MODEL, mock.url, keep_alive=keep_alive, client=client)
+            manager.prewarm(wait=True)
+            time.sleep(args.idle)
+            return analyze_once(mock, manager, image, client)
+        return run
+
+    scenario("cold", cold)
+    scenario("prewarm", prewarm)
+    short = max(1, int(args.idle / 2))
+    scenario(f"idle, keep_alive {short}s", idle(f"{short}s"))
+    scenario("idle, keep_alive 30m", idle("30m"))
+
+    print(f"model load {args.load_time:.1f}s · first token after {args.latency:.1f}s · "
+          f"{args.tokens} tokens at {args.tokens_per_second:.0f}/s")
+    print(f"{'scenario':<24}{'latency s':>10}{'load s':>8}")
+    for name, seconds, load in rows:
+        print(f"{name:<24}{seconds:>10.2f}{load:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Near-duplicate lookups as the hash index grows, plus the cost of hashing.
+
+    python benchmarks/bench_dedupe.py [--sizes 10000 100000 500000] [--lookups 1000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from medai.dedupe import NearDuplicateIndex, phash
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 255, (800, 600), dtype=np.uint8))
+    times = []
+    for _ in range(200):
+        started = time.perf_counter()
+        phash(image)
+        times.append(time.perf_counter() - started)
+    print(f"phash of an 800x600 image: {statistics.median(times) * 1e3:.2f} ms")
+
+    print(f"{'entries':>9}{'build s':>9}{'lookup p50 ms':>15}{'lookup p99 ms':>15}")
+    for size in args.sizes:
+        index = NearDuplicateIndex()
+        hashes = rng.integers(0, 2**64, size, dtype=np.uint64)
+        started = time.perf_counter()
+        for i, value in enumerate(hashes.tolist()):
+            index.add("scope", value, f"key{i}")
+        build = time.perf_counter() - started
+
+        probes = rng.integers(0, 2**64, args.lookups, dtype=np.uint64).tolist()
+        times = []
+        for i, value in enumerate(probes):
+            started = time.perf_counter()
+            index.claim("scope", value, f"probe{i}")
+            times.append(time.perf_counter() - started)
+            index.discard(f"probe{i}")
+        times.sort()
+        print(f"{size:>9}{build:>9.2f}{times[len(times) // 2] * 1e3:>15.3f}"
+              f"{times[int(len(times) * 0.99)] * 1e3:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
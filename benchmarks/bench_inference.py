@@ -0,0 +1,275 @@
+"""End-to-end inference benchmark against the local mock backend.
+
+Drives the same code paths as the apps (medai.analysis + analyze_batch for
+app_ollama.py, preprocess_image + chat_payload for app.py) against
+benchmarks/mock_backend.py, with N concurrent sessions each analysing
+--images synthetic X-rays. Reports end-to-end latency percentiles,
+throughput, request/response payload sizes and PDF generation time, and
+writes everything to a JSON file that later runs can be compared against.
+
+    python benchmarks/bench_inference.py --sessions 1 4 8 --output run.json
+    python benchmarks/bench_inference.py --baseline run.json   # show deltas
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from medai.analysis import LMSTUDIO_MODEL, OLLAMA_MODEL, analyze_image, prepare_image
+from medai.batch import analyze_batch
+from medai.client import BackendClient
+from medai.imaging import budget_for, preprocess_image
+from medai.prompts import chat_payload
+from medai.report import create_pdf_report
+from medai.streaming import StreamStats, stream_openai_chat
+
+from mock_backend import MockBackend, add_arguments
+
+# app_ollama.py's pipeline settings
+PREPROCESS_WORKERS = 4
+MAX_CONCURRENT_REQUESTS = 2
+
+
+def make_images(count, side, seed=0):
+    """Distinct synthetic grayscale X-ray-like JPEGs"""
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(0, 1, side, dtype=np.float32)
+    base = np.add.outer(ramp, ramp) / 2
+    images = []
+    for _ in range(count):
+        noisy = base + rng.normal(0, 0.03, base.shape).astype(np.float32)
+        buffer = io.BytesIO()
+        Image.fromarray((np.clip(noisy, 0, 1) * 255).astype(np.uint8)).save(buffer, format="JPEG", quality=92)
+        images.append(buffer.getvalue())
+    return images
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile (q in 0..100); None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values, scale=1.0):
+    return {
+        "p50": percentile(values, 50) * scale if values else None,
+        "p90": percentile(values, 90) * scale if values else None,
+        "p95": percentile(values, 95) * scale if values else None,
+        "p99": percentile(values, 99) * scale if values else None,
+        "max": max(values) * scale if values else None,
+        "mean": statistics.fmean(values) * scale if values else None,
+    }
+
+
+def ollama_session(images, api, client, stream, samples):
+    """One app_ollama.py session: the batch pipeline over every upload"""
+    started = {}
+
+    def uploads():
+        # analyze_batch pulls items lazily, so this is when each image enters the pipeline
+        for i, data in enumerate(images):
+            started[i] = time.perf_counter()
+            yield f"image_{i}.jpg", data
+
+    def preprocess(data):
+        return prepare_image(data, OLLAMA_MODEL)
+
+    def infer(prepared):
+        return analyze_image(prepared, api, OLLAMA_MODEL, stream=stream, client=client)
+
+    def on_result(result):
+        prepared_stats = result.payload.stats if result.payload is not None else None
+        samples.append({
+            "latency": time.perf_counter() - started[result.index],
+            "ttft": prepared_stats.time_to_first_token if prepared_stats and stream else None,
+            "ok": result.error is None,
+            "report": (result.name, result.text or f"Analysis failed: {result.error}"),
+        })
+
+    analyze_batch(
+        uploads(),
+        preprocess,
+        infer,
+        preprocess_workers=PREPROCESS_WORKERS,
+        max_concurrency=MAX_CONCURRENT_REQUESTS,
+        on_result=on_result,
+    )
+
+
+def lmstudio_session(images, api, client, stream, samples):
+    """One app.py session: one image at a time, preprocess then chat request"""
+    headers = {"Content-Type": "application/json"}
+    for i, data in enumerate(images):
+        started = time.perf_counter()
+        stats = StreamStats()
+        try:
+            prepared = preprocess_image(data, budget_for(LMSTUDIO_MODEL))
+            payload = chat_payload(prepared, LMSTUDIO_MODEL)
+            if stream:
+                text = "".join(stream_openai_chat(api, payload, headers=headers, stats=stats, client=client))
+            else:
+                response = client.post(api, headers=headers, json=payload)
+                response.raise_for_status()
+                text = response.json()["choices"][0]["message"]["content"]
+            ok = True
+        except Exception as e:
+            text, ok = f"Analysis failed: {e}", False
+        samples.append({
+            "latency": time.perf_counter() - started,
+            "ttft": stats.time_to_first_token if stream and ok else None,
+            "ok": ok,
+            "report": (f"image_{i}.jpg", text),
+        })
+
+
+def run_scenario(backend, mock, sessions, images, stream):
+    """Run `sessions` concurrent sessions and return the scenario's metrics"""
+    mock.reset_stats()
+    # A fresh client per scenario so breaker state and stats do not carry over
+    client = BackendClient(f"bench-{backend}", pool_size=max(8, sessions * MAX_CONCURRENT_REQUESTS),
+                           max_outstanding=max(8, sessions * MAX_CONCURRENT_REQUESTS))
+    if backend == "ollama":
+        api, session = f"{mock.url}/api/generate", ollama_session
+    else:
+        api, session = f"{mock.url}/v1/chat/completions", lmstudio_session
+
+    per_session = [[] for _ in range(sessions)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [pool.submit(session, images, api, client, stream, per_session[s]) for s in range(sessions)]
+        for future in futures:
+            future.result()
+    wall = time.perf_counter() - started
+
+    samples = [sample for session_samples in per_session for sample in session_samples]
+    latencies = [s["latency"] for s in samples if s["ok"]]
+    ttfts = [s["ttft"] for s in samples if s["ttft"] is not None]
+
+    # One PDF per session, as each user would download
+    pdf_seconds, pdf_bytes = [], []
+    for session_samples in per_session:
+        pdf_started = time.perf_counter()
+        data = create_pdf_report(sorted(s["report"] for s in session_samples), "Benchmark City").output()
+        pdf_seconds.append(time.perf_counter() - pdf_started)
+        pdf_bytes.append(len(data))
+
+    mock_stats = mock.stats
+    return {
+        "backend": backend,
+        "sessions": sessions,
+        "stream": stream,
+        "images": len(samples),
+        "errors": sum(not s["ok"] for s in samples),
+        "wall_seconds": wall,
+        "throughput_images_per_s": len(latencies) / wall if wall else None,
+        "latency_ms": summarize(latencies, 1000),
+        "time_to_first_token_ms": summarize(ttfts, 1000),
+        "request_kb": summarize(mock_stats["request_bytes"], 1 / 1024),
+        "response_kb": summarize(mock_stats["response_bytes"], 1 / 1024),
+        "backend_requests": mock_stats["requests"],
+        "backend_failures": mock_stats["failures"],
+        "client": dict(client.stats),
+        "pdf_ms": summarize(pdf_seconds, 1000),
+        "pdf_kb": summarize(pdf_bytes, 1 / 1024),
+    }
+
+
+def print_results(results, baseline=None):
+    previous = {}
+    for r in (baseline or {}).get("scenarios", []):
+        previous[(r["backend"], r["sessions"], r["stream"])] = r
+
+    def delta(new, old):
+        if old in (None, 0) or new is None:
+            return ""
+        return f" ({(new - old) / old * 100:+.0f}%)"
+
+    print(f"{'backend':<9}{'sess':>5}{'imgs':>6}{'err':>5}{'img/s':>8}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'req KB':>8}{'pdf ms':>8}")
+    for r in results:
+        old = previous.get((r["backend"], r["sessions"], r["stream"]), {})
+        print(f"{r['backend']:<9}{r['sessions']:>5}{r['images']:>6}{r['errors']:>5}"
+              f"{r['throughput_images_per_s']:>8.2f}{r['latency_ms']['p50'] or 0:>9.0f}"
+              f"{r['latency_ms']['p95'] or 0:>9.0f}{r['latency_ms']['p99'] or 0:>9.0f}"
+              f"{r['request_kb']['p50'] or 0:>8.0f}{r['pdf_ms']['p50']:>8.0f}")
+        if old:
+            print(f"{'':<9}vs baseline: throughput"
+                  f"{delta(r['throughput_images_per_s'], old.get('throughput_images_per_s'))}"
+                  f", p50{delta(r['latency_ms']['p50'], old['latency_ms'].get('p50'))}"
+                  f", p95{delta(r['latency_ms']['p95'], old['latency_ms'].get('p95'))}"
+                  f", pdf{delta(r['pdf_ms']['p50'], old['pdf_ms'].get('p50'))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", nargs="+", choices=["ollama", "lmstudio"], default=["ollama", "lmstudio"])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 8],
+                        help="concurrent sessions per scenario")
+    parser.add_argument("--images", type=int, default=4, help="images per session")
+    parser.add_argument("--image-side", type=int, default=2048)
+    parser.add_argument("--no-stream", action="store_true", help="use non-streaming requests")
+    parser.add_argument("--output", default="bench_inference.json", help="JSON results file")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    mock = MockBackend(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                       tokens=args.tokens, failure_rate=args.failure_rate, seed=args.seed,
+                       load_time=args.load_time, image_latency=args.image_latency)
+    mock.start()
+    images = make_images(args.images, args.image_side, args.seed)
+    results = []
+    try:
+        for backend in args.backend:
+            for sessions in args.sessions:
+                results.append(run_scenario(backend, mock, sessions, images, not args.no_stream))
+    finally:
+        mock.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    run = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "images_per_session": args.images,
+            "image_side": args.image_side,
+            "stream": not args.no_stream,
+            "latency": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+            "tokens": args.tokens,
+            "failure_rate": args.failure_rate,
+            "seed": args.seed,
+            "load_time": args.load_time,
+            "image_latency": args.image_latency,
+        },
+        "scenarios": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Compare image ingestion cost: the original PIL path vs medai.imaging.
+
+Generates synthetic studies (large 8-bit JPEG, 16-bit PNG, multi-frame
+16-bit DICOM) and runs every case in a fresh subprocess so peak RSS is
+attributable to that case alone. Inputs are generated in a subprocess too:
+Linux carries ru_maxrss across fork/exec, so a bloated parent would hide
+the children's peaks.
+
+    python benchmarks/bench_ingest.py [--repeat 5] [--json out.json]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+
+def make_inputs(directory):
+    """Write the synthetic inputs and return {name: path}"""
+    rng = np.random.default_rng(0)
+    side = 3000
+    ramp = np.linspace(0, 1, side, dtype=np.float32)
+    base = np.add.outer(ramp, ramp) / 2
+    noisy = base + rng.normal(0, 0.02, (side, side)).astype(np.float32)
+
+    paths = {}
+    paths["jpeg8"] = os.path.join(directory, "xray_8bit.jpg")
+    Image.fromarray((np.clip(noisy, 0, 1) * 255).astype(np.uint8)).convert("RGB").save(
+        paths["jpeg8"], quality=95)
+
+    paths["png16"] = os.path.join(directory, "xray_16bit.png")
+    Image.fromarray((np.clip(noisy, 0, 1) * 65535).astype(np.uint16)).save(paths["png16"])
+
+    try:
+        from pydicom.dataset import Dataset, FileMetaDataset
+        from pydicom.uid import ExplicitVRLittleEndian, SecondaryCaptureImageStorage, generate_uid
+    except ImportError:
+        print("pydicom not installed; skipping DICOM cases", file=sys.stderr)
+        return paths
+
+    frames, dside = 8, 2048
+    pixels = np.empty((frames, dside, dside), dtype=np.uint16)
+    for i in range(frames):
+        pixels[i] = (np.clip(noisy[:dside, :dside] + i * 0.01, 0, 1) * 4095).astype(np.uint16)
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = SecondaryCaptureImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = generate_uid()
+    ds.Modality = "DX"
+    ds.Rows, ds.Columns, ds.NumberOfFrames = dside, dside, frames
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit, ds.PixelRepresentation = 16, 12, 11, 0
+    ds.WindowCenter, ds.WindowWidth = 2048, 4096
+    ds.PixelData = pixels.tobytes()
+    paths["dicom"] = os.path.join(directory, "study_multiframe.dcm")
+    ds.save_as(paths["dicom"], enforce_file_format=True)
+    return paths
+
+
+def pil_path(data):
+    """What app_ollama.py did before medai.imaging"""
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    w, h = image.size
+    if w > 800:
+        image = image.resize((800, int(h * 800 / w)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def pydicom_full(path):
+    """Naive DICOM path: materialize every frame, then reuse the PIL path"""
+    import pydicom
+    pixels = pydicom.dcmread(path).pixel_array
+    frame = pixels[len(pixels) // 2].astype(np.float32)
+    frame = (frame - frame.min()) * (255.0 / max(1.0, float(frame.max() - frame.min())))
+    buffer = io.BytesIO()
+    Image.fromarray(frame.astype(np.uint8)).save(buffer, format="PNG")
+    return pil_path(buffer.getvalue())
+
+
+def run_case(case, path):
+    """Run one case in this process and return timing/memory numbers"""
+    from medai.imaging import preprocess_file, preprocess_image
+
+    def read():
+        with open(path, "rb") as f:
+            return f.read()
+
+    runners = {
+        "pil": lambda: pil_path(read()),
+        "pydicom_full": lambda: pydicom_full(path),
+        "medai_bytes": lambda: str(preprocess_image(read()).b64),
+        "medai_file": lambda: str(preprocess_file(path).b64),
+    }
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    payload = runners[case]()
+    seconds = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"seconds": seconds, "peak_rss_mb": (peak - baseline) / 1024, "payload_kb": len(payload) * 3 / 4 / 1024}
+
+
+CASES = {
+    "jpeg8": ["pil", "medai_bytes"],
+    "png16": ["pil", "medai_bytes"],
+    "dicom": ["pydicom_full", "medai_bytes", "medai_file"],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write results to this file")
+    parser.add_argument("--case", nargs=2, help=argparse.SUPPRESS)
+    parser.add_argument("--make-inputs", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(*args.case)))
+        return
+    if args.make_inputs:
+        print(json.dumps(make_inputs(args.make_inputs)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        out = subprocess.run(
+            [sys.executable, __file__, "--make-inputs", directory],
+            check=True, capture_output=True, text=True,
+        )
+        inputs = json.loads(out.stdout)
+        for input_name, path in inputs.items():
+            for case in CASES[input_name]:
+                runs = []
+                for _ in range(args.repeat):
+                    out = subprocess.run(
+                        [sys.executable, __file__, "--case", case, path],
+                        check=True, capture_output=True, text=True,
+                    )
+                    runs.append(json.loads(out.stdout))
+                results.append({
+                    "input": input_name,
+                    "input_mb": os.path.getsize(path) / 1024 / 1024,
+                    "path": case,
+                    "median_ms": statistics.median(r["seconds"] for r in runs) * 1000,
+                    "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+                    "payload_kb": runs[0]["payload_kb"],
+                })
+
+    print(f"{'input':<8}{'MB':>7}  {'path':<14}{'median ms':>10}{'peak RSS MB':>13}{'payload KB':>12}")
+    for r in results:
+        print(f"{r['input']:<8}{r['input_mb']:>7.1f}  {r['path']:<14}{r['median_ms']:>10.0f}"
+              f"{r['peak_rss_mb']:>13.0f}{r['payload_kb']:>12.0f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
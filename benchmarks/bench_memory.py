@@ -0,0 +1,154 @@
+"""Peak memory of a batch of large uploads through the Ollama app's job queue.
+
+Runs app_ollama.py's pipeline (JobQueue with prepare_image/analyze_image)
+over --images large radiographs held in memory as uploads, against
+benchmarks/mock_backend.py, with:
+
+  unbounded   every preprocessing worker decodes at once (no memory budget)
+  capped      a per-session memory.MemoryBudget of --memory-mb
+  one-by-one  low-memory mode: one image decoded at a time
+
+Each mode runs in a fresh subprocess that samples its resident set size
+every few milliseconds; inputs are written by another subprocess so their
+generation does not count.
+
+    python benchmarks/bench_memory.py --images 8 --memory-mb 256
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+MODES = ("unbounded", "capped", "one-by-one")
+
+
+def make_inputs(directory, count, side):
+    """Alternate 8-bit RGB scans and 16-bit grayscale PNGs of about side pixels"""
+    rng = np.random.default_rng(0)
+    ramp = np.linspace(0, 1, side, dtype=np.float32)
+    base = np.add.outer(ramp[: side * 3 // 4], ramp) / 2
+    paths = []
+    for i in range(count):
+        noisy = np.clip(base + rng.normal(0, 0.01, base.shape).astype(np.float32), 0, 1)
+        path = os.path.join(directory, f"xray{i:03d}.png")
+        if i % 2:
+            Image.fromarray((noisy * 65535).astype(np.uint16)).save(path, compress_level=1)
+        else:
+            Image.fromarray((noisy * 255).astype(np.uint8)).convert("RGB").save(path, compress_level=1)
+        paths.append(path)
+    return paths
+
+
+def run_mode(mode, paths, memory_mb, workers):
+    """Analyze the uploads in this process; returns seconds and memory figures"""
+    from medai.analysis import OLLAMA_MODEL, analyze_image, prepare_image
+    from medai.client import BackendClient
+    from medai.imaging import budget_for, estimate_memory
+    from medai.jobs import JobQueue
+    from medai.memory import MemoryBudget, rss_bytes
+
+    from mock_backend import MockBackend
+
+    # Uploads arrive whole, as Streamlit hands them over
+    uploads = []
+    for path in paths:
+        with open(path, "rb") as f:
+            uploads.append((os.path.basename(path), f.read()))
+
+    mock = MockBackend(latency=0.2, tokens=50, tokens_per_second=500)
+    mock.start()
+    client = BackendClient("bench-memory")
+    api = mock.url + "/api/generate"
+    queue = JobQueue(prepare_image, lambda prepared: analyze_image(prepared, api, OLLAMA_MODEL, client=client),
+                     workers=2, preprocess_workers=workers)
+    budget = {
+        "unbounded": None,
+        "capped": MemoryBudget(int(memory_mb * 2**20)),
+        "one-by-one": MemoryBudget(None, max_decoding=1),
+    }[mode]
+
+    peak = baseline = rss_bytes()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, rss_bytes())
+            time.sleep(0.002)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    image_budget = budget_for(OLLAMA_MODEL)
+    job_ids = [queue.submit(name, data, memory=budget, cost=estimate_memory(data, image_budget))
+               for name, data in uploads]
+    jobs = [queue.get(job_id) for job_id in job_ids]
+    while not all(job.done for job in jobs):
+        time.sleep(0.01)
+    seconds = time.perf_counter() - started
+    done.set()
+    sampler.join()
+    queue.shutdown()
+    mock.stop()
+    failed = [job.error for job in jobs if job.error is not None]
+    if failed:
+        raise RuntimeError(f"{len(failed)} analyses failed, e.g. {failed[0]}")
+    return {
+        "seconds": seconds,
+        "peak_mb": (peak - baseline) / 2**20,
+        "uploads_mb": sum(len(data) for _, data in uploads) / 2**20,
+        "reserved_peak_mb": budget.peak / 2**20 if budget else None,
+        "estimated_mb": sum(estimate_memory(data, image_budget) for _, data in uploads) / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--side", type=int, default=4000, help="width of the synthetic radiographs")
+    parser.add_argument("--memory-mb", type=float, default=256, help="session memory cap for the capped mode")
+    parser.add_argument("--workers", type=int, default=4, help="preprocessing threads, as in the app")
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--inputs", nargs="*", help=argparse.SUPPRESS)
+    parser.add_argument("--make-inputs", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.make_inputs:
+        print(json.dumps(make_inputs(args.make_inputs, args.images, args.side)))
+        return
+    if args.mode:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        print(json.dumps(run_mode(args.mode, args.inputs, args.memory_mb, args.workers)))
+        return
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        out = subprocess.run([sys.executable, __file__, "--make-inputs", directory, "--images", str(args.images),
+                              "--side", str(args.side)], check=True, capture_output=True, text=True)
+        paths = json.loads(out.stdout)
+        for mode in MODES:
+            out = subprocess.run([sys.executable, __file__, "--mode", mode, "--memory-mb", str(args.memory_mb),
+                                  "--workers", str(args.workers), "--inputs", *paths],
+                                 check=True, capture_output=True, text=True)
+            rows.append((mode, json.loads(out.stdout)))
+
+    first = rows[0][1]
+    print(f"{args.images} uploads, {first['uploads_mb']:.0f} MB as uploaded, "
+          f"{first['estimated_mb']:.0f} MB estimated to prepare · {args.workers} preprocessing threads")
+    print(f"{'mode':<12}{'seconds':>9}{'peak MB':>9}{'reserved MB':>13}")
+    for mode, row in rows:
+        reserved = f"{row['reserved_peak_mb']:.0f}" if row["reserved_peak_mb"] is not None else "-"
+        print(f"{mode:<12}{row['seconds']:>9.2f}{row['peak_mb']:>9.0f}{reserved:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""PDF layout time for a large batch: serial create_pdf_report vs the process pool.
+
+Lays out --reports synthetic reports with medai.report.create_pdf_bytes,
+serially (workers=1, the single-threaded path) and with each --workers
+count. Pools are started and warmed once before timing, as in a long-lived
+app or CLI run; the cold start of the first pool is printed separately.
+Also checks that every worker count produces the same bytes.
+
+    python benchmarks/bench_pdf_parallel.py --reports 400 --workers 2,4,8
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_archive import make_report
+from medai.report import PAGES_PER_CHUNK, create_pdf_bytes, pdf_workers, preload
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports", type=int, default=400)
+    parser.add_argument("--workers", default=",".join(str(n) for n in (2, 4, 8, 16) if n <= max(cpus, 2)),
+                        help="comma-separated process counts to compare with the serial path")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    results = [(f"xray{i:04d}.png", make_report(rng)) for i in range(args.reports)]
+    generated_at = datetime(2026, 1, 1, 9, 0)
+    preload()
+
+    def run(workers):
+        times = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            data = create_pdf_bytes(results, "Benchmark City", workers=workers, generated_at=generated_at)
+            times.append(time.perf_counter() - started)
+        return statistics.median(times), data
+
+    counts = [int(n) for n in args.workers.split(",")]
+    print(f"{args.reports} reports, {PAGES_PER_CHUNK} per chunk, {cpus} CPUs")
+    serial, serial_data = run(1)
+    print(f"{'workers':<10}{'seconds':>9}{'speedup':>9}{'KB':>8}")
+    print(f"{'serial':<10}{serial:>9.2f}{1:>9.2f}{len(serial_data) / 1024:>8.0f}")
+    outputs = set()
+    for workers in counts:
+        if pdf_workers(args.reports, workers) == 1:
+            print(f"{workers:<10}{'serial path (too few reports, or pypdf missing)':>40}")
+            continue
+        started = time.perf_counter()
+        create_pdf_bytes(results[:PAGES_PER_CHUNK * 2], "Benchmark City", workers=workers)
+        cold = time.perf_counter() - started
+        seconds, data = run(workers)
+        outputs.add(data)
+        print(f"{workers:<10}{seconds:>9.2f}{serial / seconds:>9.2f}{len(data) / 1024:>8.0f}"
+              f"   (pool start + first {PAGES_PER_CHUNK * 2} reports: {cold:.2f} s)")
+    if outputs:
+        print("identical output for every worker count" if len(outputs) == 1
+              else f"{len(outputs)} different outputs across worker counts")
+
+
+if __name__ == "__main__":
+    main()
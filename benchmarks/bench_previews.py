@@ -0,0 +1,103 @@
+"""What a rerun of the Ollama app costs once a batch has been analyzed.
+
+Runs app_ollama.py under Streamlit's AppTest with --images synthetic
+uploads against benchmarks/mock_backend.py: a first run analyzes them,
+then --reruns more runs stand in for widget interactions. Reports the
+rerun time and the image bytes st.image hands to the browser per rerun.
+Each measurement runs in a fresh process; --app-dir measures another
+checkout, e.g. an older commit from `git worktree add`:
+
+    python benchmarks/bench_previews.py --images 24 --app-dir /tmp/medai-old
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUN = """
+import io, json, statistics, sys, time
+sys.path.insert(0, %(benchmarks)r)
+import numpy as np
+from PIL import Image
+from mock_backend import MockBackend
+import streamlit.elements.lib.image_utils as image_utils
+from streamlit.testing.v1 import AppTest
+
+mock = MockBackend(port=11434, latency=0.01, tokens=20, tokens_per_second=2000)
+mock.start()
+
+# Count the image bytes every st.image call produces for the browser
+sent = []
+ensure = image_utils._ensure_image_size_and_format
+def counting(*args, **kwargs):
+    data = ensure(*args, **kwargs)
+    sent.append(len(data))
+    return data
+image_utils._ensure_image_size_and_format = counting
+
+rng = np.random.default_rng(0)
+uploads = []
+for i in range(%(images)d):
+    pixels = np.add.outer(np.linspace(0, 200, 1200), np.linspace(0, 55, 1600)) + rng.normal(0, 12, (1200, 1600))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, "PNG")
+    uploads.append((f"xray{i:03d}.png", buffer.getvalue()))
+
+code = '''
+import io, streamlit as st
+class Upload(io.BytesIO):
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+        self.file_id = name + "-id"
+files = [Upload(name, data) for name, data in UPLOADS]
+st.file_uploader = lambda *args, **kwargs: files
+exec(compile(open(APP).read(), "app_ollama.py", "exec"))
+'''
+import builtins
+builtins.UPLOADS = uploads
+builtins.APP = %(app)r
+at = AppTest.from_string(code, default_timeout=300)
+started = time.perf_counter()
+at.run()
+first = time.perf_counter() - started
+reruns = []
+sent.clear()
+for _ in range(%(reruns)d):
+    started = time.perf_counter()
+    at.run()
+    reruns.append(time.perf_counter() - started)
+print(json.dumps({"first": first, "rerun": statistics.median(reruns),
+                  "rerun_kb": sum(sent) / 1024 / %(reruns)d, "images": len(sent) // %(reruns)d}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app-dir", default=ROOT, help="checkout to measure")
+    parser.add_argument("--images", type=int, default=24)
+    parser.add_argument("--reruns", type=int, default=5)
+    args = parser.parse_args()
+
+    script = RUN % {"benchmarks": os.path.join(ROOT, "benchmarks"), "app": os.path.join(args.app_dir, "app_ollama.py"),
+                    "images": args.images, "reruns": args.reruns}
+    env = dict(os.environ, PYTHONPATH=args.app_dir, MEDAI_LOCATION="Benchmark")
+    # A scratch working directory keeps the app's SQLite cache from answering instead of the mock
+    with tempfile.TemporaryDirectory(prefix="medai-bench-") as scratch:
+        result = subprocess.run([sys.executable, "-c", script], cwd=scratch, env=env, capture_output=True, text=True)
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode or not lines:
+        sys.exit(result.stderr)
+    row = json.loads(lines[-1])
+    print(f"{args.app_dir} · {args.images} uploads of 1600×1200")
+    print(f"  first run (analysis)  {row['first']:8.2f} s")
+    print(f"  rerun, median         {row['rerun'] * 1000:8.0f} ms")
+    print(f"  image data per rerun  {row['rerun_kb']:8.0f} KB in {row['images']} images")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Micro-benchmark: the per-line keyword scan vs medai.sections.parse_report.
+
+    python benchmarks/bench_report_parser.py [--sections 2000] [--repeat 5]
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from medai.sections import parse_report
+
+SECTION = """**🩻 Medical Analysis:**  
+- The X-ray shows a transverse fracture of the distal radius with mild dorsal angulation.
+- Soft tissue swelling is noted around the wrist joint.
+
+**🩺 Suggested Treatment Plan:**  
+- Closed reduction and immobilization in a short arm cast for 6 weeks.
+Follow-up imaging:
+- Repeat radiographs at 2 and 6 weeks.
+
+**💊 Possible Medications:**  
+- Ibuprofen
+- Paracetamol
+
+**💙 Emotional Healing Message:**  
+Fractures like this heal well with time and care. You are not alone in this recovery.
+"""
+
+
+def legacy_clean_text(text):
+    """SafePDF.clean_text before precompiled patterns"""
+    if not text:
+        return ""
+    text = str(text)
+    text = re.sub(r'[^\w\s\-.,;:()!?\n\r\u00A0-\u017F\u0100-\u024F]', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\n+', '\n', text)
+    return text.strip()
+
+
+def legacy_parse(report):
+    """The create_pdf_report loop before medai.sections, minus the PDF calls.
+
+    legacy_clean_text stands in for the cleaning safe_cell/safe_multi_cell did.
+    """
+    out = []
+    for section in report.strip().split('\n\n'):
+        if not section.strip():
+            continue
+        section_text = ""
+        for line in section.split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            is_header = (
+                any(keyword in line.lower() for keyword in ['medical analysis:', 'treatment plan:', 'suggested treatment', 'medications:', 'possible medications', 'emotional healing', 'healing message:']) or
+                line.endswith(':') or
+                '**' in line or
+                any(char in line for char in ['🩻', '🩺', '💊', '💙'])
+            )
+            if is_header:
+                if section_text.strip():
+                    out.append(legacy_clean_text(section_text.strip()))
+                    section_text = ""
+                clean_header = re.sub(r'\*\*([^*]+)\*\*', r'\1', line)
+                clean_header = re.sub(r'[🩻🩺💊💙]', '', clean_header).strip()
+                out.append(legacy_clean_text(clean_header))
+            else:
+                section_text = section_text + " " + line if section_text else line
+        if section_text.strip():
+            out.append(legacy_clean_text(section_text.strip()))
+    return out
+
+
+def best_of(fn, arg, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - started)
+    return min(times), statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, default=2000, help="report blocks per report")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    report = "\n".join([SECTION] * args.sections)
+    lines = report.count("\n") + 1
+    print(f"Report: {lines} lines, {len(report) / 1024:.0f} KB")
+    for label, fn in (("legacy scan", legacy_parse), ("parse_report", parse_report)):
+        best, median = best_of(fn, report, args.repeat)
+        print(f"{label:<14} best {best * 1000:8.1f} ms   median {median * 1000:8.1f} ms"
+              f"   {lines / best / 1e6:.2f} M lines/s")
+
+
+if __name__ == "__main__":
+    main()
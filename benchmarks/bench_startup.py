@@ -0,0 +1,125 @@
+"""Cold start of the Ollama app: import time and time to the upload widget.
+
+Every measurement runs in a fresh Python process, so nothing is already
+imported or cached:
+
+  imports     importing the medai modules app_ollama.py uses at the top
+  upload      running app_ollama.py (Streamlit's AppTest) until the upload
+              widget is drawn, i.e. until a user could start working
+  script      the whole first script run, which must finish without an
+              exception
+
+--offline routes HTTPS through a local proxy that accepts connections and
+never answers, standing in for an air-gapped host where the location
+lookup can only time out. --app-dir
+measures another checkout, e.g. an older commit from `git worktree add`:
+
+    python benchmarks/bench_startup.py --offline --app-dir /tmp/medai-old
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTS = """
+import importlib, json, re, sys, time
+started = time.perf_counter()
+import streamlit
+streamlit_seconds = time.perf_counter() - started
+# The medai modules the app imports at the top level, not inside functions or blocks
+modules = re.findall(r"^from (medai[.\\w]*) import", open("app_ollama.py").read(), re.MULTILINE)
+started = time.perf_counter()
+for module in modules:
+    importlib.import_module(module)
+print(json.dumps({"streamlit": streamlit_seconds, "imports": time.perf_counter() - started,
+                  "fpdf": "fpdf" in sys.modules}))
+"""
+
+FIRST_RUN = """
+import json, os, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+ready = time.perf_counter()
+code = '''
+import time, streamlit as st
+_uploader = st.file_uploader
+def file_uploader(*args, **kwargs):
+    TIMES["upload"] = time.perf_counter()
+    return _uploader(*args, **kwargs)
+st.file_uploader = file_uploader
+exec(compile(open("app_ollama.py").read(), "app_ollama.py", "exec"))
+'''
+import builtins
+builtins.TIMES = {}
+at = AppTest.from_string(code, default_timeout=%(timeout)s).run()
+done = time.perf_counter()
+# A page that crashes halfway would otherwise look fast
+if at.exception:
+    sys.exit("app_ollama.py raised: " + at.exception[0].message)
+print(json.dumps({"upload": TIMES["upload"] - ready, "script": done - ready}))
+"""
+
+
+def measure(script, app_dir, env, timeout):
+    """Run script in a fresh interpreter in app_dir; its JSON output, or None on timeout"""
+    try:
+        result = subprocess.run([sys.executable, "-c", script], cwd=app_dir, env=env, timeout=timeout,
+                                capture_output=True, text=True)
+    except subprocess.TimeoutExpired:
+        return None
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode or not lines:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "no output")
+    return json.loads(lines[-1])
+
+
+def blackhole():
+    """Listening socket that is never accepted from: connections succeed, replies never come"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(64)
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app-dir", default=ROOT, help="checkout to measure")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--offline", action="store_true", help="make HTTPS requests hang (air-gapped host)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="give up on a run after this many seconds")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=args.app_dir)
+    env.pop("MEDAI_LOCATION", None)
+    if args.offline:
+        sink = blackhole()
+        proxy = "http://127.0.0.1:%d" % sink.getsockname()[1]
+        env.update(HTTPS_PROXY=proxy, https_proxy=proxy, NO_PROXY="localhost,127.0.0.1")
+
+    imports, first_runs, timeouts = [], [], 0
+    for _ in range(args.runs):
+        imports.append(measure(IMPORTS, args.app_dir, env, args.timeout))
+        result = measure(FIRST_RUN % {"timeout": args.timeout}, args.app_dir, env, args.timeout + 5)
+        if result is None:
+            timeouts += 1
+        else:
+            first_runs.append(result)
+
+    print(f"{args.app_dir} · {'offline' if args.offline else 'online'} · {args.runs} runs, median seconds")
+    print(f"  import streamlit      {statistics.median(r['streamlit'] for r in imports):8.3f}")
+    print(f"  import medai modules  {statistics.median(r['imports'] for r in imports):8.3f}"
+          f"   (fpdf imported: {imports[0]['fpdf']})")
+    if first_runs:
+        print(f"  upload widget drawn   {statistics.median(r['upload'] for r in first_runs):8.3f}")
+        print(f"  first script run      {statistics.median(r['script'] for r in first_runs):8.3f}")
+    if timeouts:
+        print(f"  {timeouts} of {args.runs} first runs still blocked after {args.timeout:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Throughput of one request per view versus one request per study.
+
+Runs the CLI's pipeline (analyze_batch with prepare/analyze per unit)
+over --studies synthetic studies of --views views each, against
+benchmarks/mock_backend.py. Each request costs --latency plus
+--image-latency per attached image before the first token, and then one
+report of --tokens tokens, so grouping saves one report's generation and
+the fixed prompt overhead per extra view.
+
+    python benchmarks/bench_studies.py --studies 8 --views 2 --image-latency 0.3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from medai.analysis import (OLLAMA_MODEL, PreparedStudy, analyze_image, analyze_study, prepare_image,
+                            prepare_study)
+from medai.batch import analyze_batch
+from medai.client import BackendClient
+from medai.studies import group_studies, images_per_request, study_budget_for
+
+from bench_inference import MAX_CONCURRENT_REQUESTS, PREPROCESS_WORKERS, make_images
+from mock_backend import MockBackend, add_arguments
+
+VIEWS = ("PA", "LAT", "OBL", "AP", "AXIAL", "MORTISE")
+
+
+def run(mock, units):
+    """Analyze (name, members) units; returns seconds, requests and generated tokens"""
+    client = BackendClient("bench-studies")
+    api = mock.url + "/api/generate"
+    tokens = []
+
+    def prepare(members):
+        if len(members) == 1:
+            return prepare_image(members[0][1], OLLAMA_MODEL)
+        return prepare_study(members, OLLAMA_MODEL)
+
+    def analyze(prepared):
+        if isinstance(prepared, PreparedStudy):
+            text = analyze_study(prepared, api, OLLAMA_MODEL, client=client)
+        else:
+            text = analyze_image(prepared, api, OLLAMA_MODEL, client=client)
+        tokens.append(prepared.stats.tokens)
+        return text
+
+    mock.reset_stats()
+    started = time.perf_counter()
+    results = analyze_batch(units, prepare, analyze, preprocess_workers=PREPROCESS_WORKERS,
+                            max_concurrency=MAX_CONCURRENT_REQUESTS)
+    seconds = time.perf_counter() - started
+    failed = [result for result in results if result.error is not None]
+    if failed:
+        raise RuntimeError(f"{len(failed)} requests failed, e.g. {failed[0].error}")
+    return seconds, mock.stats["requests"], sum(tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=8)
+    parser.add_argument("--views", type=int, default=2, help="views per study")
+    parser.add_argument("--image-side", type=int, default=1024)
+    add_arguments(parser)
+    parser.set_defaults(latency=0.3, image_latency=0.3, tokens=200)
+    args = parser.parse_args()
+
+    images = make_images(args.studies * args.views, args.image_side, args.seed)
+    items = [(f"study{s:03d}_{VIEWS[v % len(VIEWS)]}{v // len(VIEWS) or ''}.jpg", images[s * args.views + v])
+             for s in range(args.studies) for v in range(args.views)]
+    max_images = images_per_request(study_budget_for(OLLAMA_MODEL))
+    modes = {
+        "per image": [(name, [(name, data)]) for name, data in items],
+        "per study": [(study.name, study.members) for study in group_studies(items, max_images=max_images)],
+    }
+
+    mock = MockBackend(latency=args.latency, tokens_per_second=args.tokens_per_second, tokens=args.tokens,
+                       image_latency=args.image_latency, seed=args.seed)
+    mock.start()
+    rows = []
+    try:
+        for mode, units in modes.items():
+            rows.append((mode,) + run(mock, units))
+    finally:
+        mock.stop()
+
+    print(f"{args.studies} studies x {args.views} views · {args.latency:.2f}s + {args.image_latency:.2f}s/image "
+          f"before the first token · {args.tokens} tokens at {args.tokens_per_second:.0f}/s · "
+          f"{MAX_CONCURRENT_REQUESTS} requests in flight")
+    print(f"{'mode':<11}{'seconds':>9}{'requests':>10}{'tokens':>8}{'images/min':>12}")
+    for mode, seconds, requests, tokens in rows:
+        print(f"{mode:<11}{seconds:>9.2f}{requests:>10}{tokens:>8}{len(items) / seconds * 60:>12.1f}")
+    print(f"speed-up: {rows[0][1] / rows[1][1]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""Local stand-in for Ollama and LM Studio, for benchmarks and offline testing.
+
+Serves Ollama's /api/generate (NDJSON) and the OpenAI-compatible
+/v1/chat/completions (SSE) that LM Studio exposes, streaming or not, with
+configurable first-token latency (plus an optional cost per attached
+image), token rate and failure rate. With a load time, Ollama requests
+also pay for loading the model when it is not in memory, honouring
+keep_alive and reloading when num_ctx changes. Run it on the real ports to
+drive the Streamlit apps without a GPU:
+
+    python benchmarks/mock_backend.py --port 11434            # app_ollama.py
+    python benchmarks/mock_backend.py --port 1234 --latency 1  # app.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPORT = """**🩻 Medical Analysis:**
+- The radiograph shows a transverse fracture of the distal radius with mild dorsal angulation.
+- Soft tissue swelling is present around the wrist; joint spaces are otherwise preserved.
+
+**🩺 Suggested Treatment Plan:**
+- Closed reduction and immobilization in a short arm cast for six weeks.
+- Repeat radiographs at two and six weeks to confirm alignment.
+
+**💊 Possible Medications:**
+- Ibuprofen
+- Paracetamol
+
+**💙 Emotional Healing Message:**
+Fractures like this heal well with time and care. Every day of rest is a step towards recovery.
+"""
+
+
+# Ollama's default keep_alive
+DEFAULT_KEEP_ALIVE = 300.0
+
+
+def keep_alive_seconds(value):
+    """Seconds from an Ollama keep_alive (number or '10s'/'5m'/'1h'); negative means for ever"""
+    if value is None:
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r"(-?[\d.]+)([smh]?)", value.strip())
+    if not match:
+        return DEFAULT_KEEP_ALIVE
+    return float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+
+
+def report_tokens(count):
+    """Split REPORT into roughly word-sized tokens, repeated up to count"""
+    words = [word + " " for word in REPORT.replace("\n", " \n ").split(" ") if word]
+    tokens = []
+    while len(tokens) < count:
+        tokens.extend(words)
+    return tokens[:count]
+
+
+class MockBackend:
+    """Threaded HTTP server emulating both backends; start() returns the base URL"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, tokens_per_second=200.0,
+                 tokens=200, failure_rate=0.0, seed=0, load_time=0.0, image_latency=0.0):
+        self.latency = latency
+        self.image_latency = image_latency
+        self.load_time = load_time
+        # model: (expires at, num_ctx) for models "in memory"
+        self.loaded = {}
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        # Set to False to make health checks and requests fail with 503
+        self.healthy = True
+        self.tokens = report_tokens(tokens)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "failures": 0, "request_bytes": [], "response_bytes": []}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {"requests": 0, "failures": 0, "request_bytes": [], "response_bytes": []}
+
+    def _record(self, request_bytes, response_bytes, failed):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["failures"] += failed
+            self.stats["request_bytes"].append(request_bytes)
+            self.stats["response_bytes"].append(response_bytes)
+
+    def _load(self, body):
+        """Seconds spent loading the requested model, which then stays for keep_alive"""
+        model = body.get("model")
+        num_ctx = body.get("options", {}).get("num_ctx")
+        keep_alive = keep_alive_seconds(body.get("keep_alive"))
+        with self._lock:
+            expires, loaded_ctx = self.loaded.get(model, (0.0, None))
+            now = time.monotonic()
+            cold = now >= expires or loaded_ctx != num_ctx
+            self.loaded[model] = (float("inf") if keep_alive < 0 else now + keep_alive, num_ctx)
+        if cold and self.load_time:
+            time.sleep(self.load_time)
+            return self.load_time
+        return 0.0
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def _handler(self):
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                # Health checks: Ollama's model list and the OpenAI-style one
+                if not backend.healthy:
+                    self._send_json(503, {"error": "mock backend unhealthy"})
+                elif self.path.startswith("/api/tags"):
+                    self._send_json(200, {"models": [{"name": "llava:latest"}]})
+                elif self.path.startswith("/api/ps"):
+                    now = time.monotonic()
+                    self._send_json(200, {"models": [{"name": model} for model, (expires, _)
+                                                     in backend.loaded.items() if expires > now]})
+                elif self.path.startswith("/v1/models"):
+                    self._send_json(200, {"data": [{"id": "medgemma-4b-it", "object": "model"}]})
+                else:
+                    self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not backend.healthy:
+                    self._send_json(503, {"error": "mock backend unhealthy"})
+                    return
+                if self.path.startswith("/api/generate"):
+                    api = "ollama"
+                    stream = body.get("stream", True)  # Ollama streams unless told not to
+                elif self.path.startswith("/v1/chat/completions"):
+                    api = "openai"
+                    stream = body.get("stream", False)
+                else:
+                    self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+                    return
+
+                started = time.perf_counter()
+                load_seconds = backend._load(body) if api == "ollama" else 0.0
+                if api == "ollama" and not body.get("prompt") and not body.get("images"):
+                    # An empty request only loads the model, as in Ollama
+                    sent = self._send_json(200, {"model": body.get("model"), "response": "", "done": True,
+                                                 "load_duration": int(load_seconds * 1e9)})
+                    backend._record(length, sent, False)
+                    return
+                # Everything below is timed from after the load
+                started += load_seconds
+                self.load_seconds = load_seconds
+                # Prompt processing: fixed overhead plus encoding every attached image
+                self.prompt_seconds = backend.latency + backend.image_latency * self._image_count(api, body)
+                time.sleep(self.prompt_seconds)
+                if backend._should_fail():
+                    sent = self._send_json(500, {"error": "mock backend failure"})
+                    backend._record(length, sent, True)
+                    return
+
+                if stream:
+                    sent = self._stream(api, body, started)
+                else:
+                    self._wait_for_tokens(started, len(backend.tokens))
+                    sent = self._send_json(200, self._complete(api, body, started))
+                backend._record(length, sent, False)
+
+            def _image_count(self, api, body):
+                if api == "ollama":
+                    return len(body.get("images") or [])
+                return sum(part.get("type") == "image_url"
+                           for message in body.get("messages", []) if isinstance(message.get("content"), list)
+                           for part in message["content"])
+
+            def _wait_for_tokens(self, started, count):
+                """Sleep until count tokens would have been generated"""
+                delay = started + self.prompt_seconds + count / backend.tokens_per_second - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            def _timings(self, started):
+                elapsed = time.perf_counter() - started
+                return {
+                    "total_duration": int((elapsed + self.load_seconds) * 1e9),
+                    "load_duration": int(self.load_seconds * 1e9),
+                    "prompt_eval_count": 64,
+                    "prompt_eval_duration": int(self.prompt_seconds * 1e9),
+                    "eval_count": len(backend.tokens),
+                    "eval_duration": int(max(elapsed - self.prompt_seconds, 0) * 1e9),
+                }
+
+            def _complete(self, api, body, started):
+                text = "".join(backend.tokens)
+                if api == "ollama":
+                    return {"model": body.get("model"), "response": text, "done": True, **self._timings(started)}
+                return {
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 64, "completion_tokens": len(backend.tokens)},
+                }
+
+            def _stream(self, api, body, started):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson" if api == "ollama" else "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                sent = 0
+                for i, token in enumerate(backend.tokens):
+                    self._wait_for_tokens(started, i)
+                    if api == "ollama":
+                        sent += self._chunk(api, {"model": body.get("model"), "response": token, "done": False})
+                    else:
+                        sent += self._chunk(api, {"choices": [{"index": 0, "delta": {"content": token}}]})
+                if api == "ollama":
+                    sent += self._chunk(api, {"model": body.get("model"), "response": "", "done": True,
+                                              **self._timings(started)})
+                else:
+                    sent += self._chunk(api, {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                                              "usage": {"prompt_tokens": 64, "completion_tokens": len(backend.tokens)}})
+                    sent += self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+                return sent
+
+            def _chunk(self, api, obj):
+                """One NDJSON line (Ollama) or SSE event (OpenAI) as an HTTP chunk"""
+                data = json.dumps(obj, ensure_ascii=False)
+                if api == "ollama":
+                    return self._write_chunk((data + "\n").encode())
+                return self._write_chunk(f"data: {data}\n\n".encode())
+
+            def _write_chunk(self, data):
+                self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+                self.wfile.flush()
+                return len(data)
+
+            def _send_json(self, status, obj):
+                data = json.dumps(obj, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return len(data)
+
+        return Handler
+
+
+def add_arguments(parser):
+    """Mock behaviour flags, shared with the benchmark scripts"""
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="seconds before the first token (prompt processing)")
+    parser.add_argument("--image-latency", type=float, default=0.0,
+                        help="extra seconds before the first token per attached image")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per response")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--load-time", type=float, default=0.0,
+                        help="seconds to load a model that is not in memory (Ollama only)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    backend = MockBackend(args.host, args.port, args.latency, args.tokens_per_second,
+                          args.tokens, args.failure_rate, args.seed, args.load_time, args.image_latency)
+    print(f"Mock Ollama/LM Studio backend on {backend.url} (Ctrl+C to stop)")
+    try:
+        backend.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        backend.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
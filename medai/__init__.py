@@ -0,0 +1 @@
+"""Shared building blocks for the Med AI X-ray Assistant apps."""
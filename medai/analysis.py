@@ -0,0 +1,221 @@
+import hashlib
+import time
+from collections import namedtuple
+
+from . import metrics
+from .cache import file_digest, make_cache_key
+from .client import get_client
+from .dedupe import make_scope, phash
+from .imaging import budget_for, preprocess_file, preprocess_image
+from .prompts import REPORT_PROMPT, ollama_payload, prompt_key, study_request
+from .streaming import StreamStats, stream_ollama
+
+OLLAMA_API = "http://localhost:11434/api/generate"
+OLLAMA_MODEL = "llava"
+LMSTUDIO_API = "http://localhost:1234/v1/chat/completions"
+LMSTUDIO_MODEL = "medgemma-4b-it"
+
+# live collects streamed chunks from the worker thread; stats holds its timings;
+# payload is the imaging.Preprocessed record (sizes, timing) for the UI;
+# phash is the perceptual hash used to spot near-duplicate uploads
+PreparedImage = namedtuple("PreparedImage", ["image", "img_b64", "cache_key", "live", "stats", "payload", "phash"])
+
+# The views of one study, sent together: image, img_b64 and payload are lists
+# in view order and views holds their file names
+PreparedStudy = namedtuple("PreparedStudy", ["image", "img_b64", "cache_key", "live", "stats", "payload", "views"])
+
+# Longest wait for an in-flight near duplicate before analyzing ourselves
+NEAR_DUPLICATE_WAIT = 600.0
+
+
+def prepare_image(image_bytes, model=OLLAMA_MODEL, prompt=REPORT_PROMPT, budget=None, options=None):
+    """Downscale and encode an upload for Ollama within the model's budget.
+
+    options are the Ollama options the report will be generated with; they
+    are part of the cache key, as a shorter num_predict gives another report.
+    """
+    payload = preprocess_image(image_bytes, budget or budget_for(model))
+    cache_key = make_cache_key(image_bytes, model, prompt_key(prompt), options)
+    return PreparedImage(payload.image, payload.b64, cache_key, [], StreamStats(), payload, phash(payload.image))
+
+
+def prepare_file(path, model=OLLAMA_MODEL, prompt=REPORT_PROMPT, budget=None, options=None):
+    """prepare_image for a file on disk; DICOM pixel data is memory-mapped"""
+    payload = preprocess_file(path, budget or budget_for(model))
+    cache_key = make_cache_key(None, model, prompt_key(prompt), options, image_digest=file_digest(path))
+    return PreparedImage(payload.image, payload.b64, cache_key, [], StreamStats(), payload, phash(payload.image))
+
+
+def prepare_study(members, model=OLLAMA_MODEL, prompt=REPORT_PROMPT, budget=None, options=None):
+    """Preprocess the (name, image bytes) views of one study for a single request"""
+    payloads = [preprocess_image(data, budget or budget_for(model)) for _, data in members]
+    digests = [hashlib.sha256(data).digest() for _, data in members]
+    return _prepared_study(members, payloads, digests, model, prompt, options)
+
+
+def prepare_study_files(members, model=OLLAMA_MODEL, prompt=REPORT_PROMPT, budget=None, options=None):
+    """prepare_study for (name, path) views on disk"""
+    payloads = [preprocess_file(path, budget or budget_for(model)) for _, path in members]
+    digests = [file_digest(path) for _, path in members]
+    return _prepared_study(members, payloads, digests, model, prompt, options)
+
+
+def make_study_cache_key(views, digests, model, prompt=REPORT_PROMPT, options=None):
+    """Cache key for a study from its view names and per-view SHA-256 digests"""
+    # The request names the views, so it is part of what the report depends on
+    return make_cache_key(None, model, prompt_key(prompt, study_request(views)), options,
+                          image_digest=hashlib.sha256(b"".join(digests)).digest())
+
+
+def _prepared_study(members, payloads, digests, model, prompt, options):
+    views = [name for name, _ in members]
+    cache_key = make_study_cache_key(views, digests, model, prompt, options)
+    return PreparedStudy([payload.image for payload in payloads], [payload.b64 for payload in payloads],
+                         cache_key, [], StreamStats(), payloads, views)
+
+
+def analyze_image(prepared, api=OLLAMA_API, model=OLLAMA_MODEL, prompt=REPORT_PROMPT,
+                  cache=None, stream=False, client=None, router=None, dedupe=None, manager=None,
+                  options=None):
+    """Return the Ollama report for a prepared image, reusing cached analyses.
+
+    With a router.Router the request goes to its best Ollama endpoint (api
+    and model then come from the endpoint) and may fail over to LM Studio.
+    With a dedupe.NearDuplicateIndex (and a cache to hold the reports),
+    re-exports of an already analyzed or in-flight image reuse its report.
+    A models.ModelManager supplies the api, model, keep_alive and options;
+    options only scopes near-duplicate reuse, like the cache key, when the
+    request goes through a router.
+    """
+    if manager is not None:
+        api, model = manager.api, manager.model
+        options = manager.options
+    client = client or get_client("ollama")
+    if cache is None or prepared.phash is None:
+        # Reports of near duplicates are read back from the cache
+        dedupe = None
+    if cache is not None:
+        cached_text = cache.get(prepared.cache_key)
+        if cached_text is not None:
+            metrics.inc("cache_hits")
+            return cached_text
+        metrics.inc("cache_misses")
+
+        if dedupe is not None:
+            scope = make_scope(model, prompt_key(prompt), options)
+            duplicate_text = _near_duplicate_report(prepared, dedupe, cache, scope)
+            if duplicate_text is not None:
+                return duplicate_text
+
+    if manager is not None:
+        payload = manager.payload(prepared.img_b64, prompt)
+    else:
+        payload = ollama_payload(model, prepared.img_b64, prompt)
+    route = None
+    if router is not None:
+        route = lambda: router.generate(prepared.payload, "ollama", prompt, stream, prepared.stats)
+    try:
+        result_text = _generate(prepared, api, payload, stream, client, route)
+    except Exception:
+        if dedupe is not None:
+            dedupe.discard(prepared.cache_key)
+        raise
+
+    # A failover answer came from another model than the cache key names
+    served_by = prepared.stats.served_by
+    if cache is not None and (served_by is None or served_by.model == model):
+        cache.put(prepared.cache_key, result_text)
+        if dedupe is not None:
+            dedupe.add(scope, prepared.phash, prepared.cache_key)
+    elif dedupe is not None:
+        dedupe.discard(prepared.cache_key)
+    return result_text
+
+
+def analyze_study(prepared, api=OLLAMA_API, model=OLLAMA_MODEL, prompt=REPORT_PROMPT,
+                  cache=None, stream=False, client=None, router=None, manager=None):
+    """Return one combined report for a PreparedStudy, sending all its views at once"""
+    if manager is not None:
+        api, model = manager.api, manager.model
+    client = client or get_client("ollama")
+    if cache is not None:
+        cached_text = cache.get(prepared.cache_key)
+        if cached_text is not None:
+            metrics.inc("cache_hits")
+            return cached_text
+        metrics.inc("cache_misses")
+
+    request = study_request(prepared.views)
+    if manager is not None:
+        payload = manager.payload(prepared.img_b64, prompt, request)
+    else:
+        payload = ollama_payload(model, prepared.img_b64, prompt, request=request)
+    route = None
+    if router is not None:
+        route = lambda: router.generate(prepared.payload, "ollama", prompt, stream, prepared.stats,
+                                        views=prepared.views)
+    result_text = _generate(prepared, api, payload, stream, client, route)
+    metrics.inc("study_images", len(prepared.views))
+
+    served_by = prepared.stats.served_by
+    if cache is not None and (served_by is None or served_by.model == model):
+        cache.put(prepared.cache_key, result_text)
+    return result_text
+
+
+def _generate(prepared, api, payload, stream, client, route=None):
+    """Send one request (or route() it through a router), collecting text into prepared"""
+    stats = prepared.stats
+    # prepared may have waited for a worker since it was preprocessed
+    stats.start()
+    started = stats.started
+    try:
+        if route is not None:
+            for chunk in route():
+                prepared.live.append(chunk)
+            result_text = "".join(prepared.live)
+        elif stream:
+            for chunk in stream_ollama(api, payload, stats=stats, client=client):
+                prepared.live.append(chunk)
+            result_text = "".join(prepared.live)
+        else:
+            response = client.post(api, json=dict(payload, stream=False))
+            response.raise_for_status()
+            body = response.json()
+            stats.read_ollama_timings(body)
+            result_text = body["response"]
+    except Exception:
+        metrics.inc("request_errors")
+        raise
+    _record_timings(time.perf_counter() - started, stats)
+    return result_text
+
+
+def _near_duplicate_report(prepared, dedupe, cache, scope):
+    """Cached report of a near-identical image, waiting if it is still being analyzed"""
+    match = dedupe.claim(scope, prepared.phash, prepared.cache_key)
+    if match is None:
+        return None
+    key, distance = match
+    dedupe.wait(key, timeout=NEAR_DUPLICATE_WAIT)
+    text = cache.get(key)
+    if text is not None:
+        prepared.stats.near_duplicate = distance
+        metrics.inc("near_duplicates")
+    return text
+
+
+def _record_timings(seconds, stats):
+    """Split one Ollama call into model stages and everything around them"""
+    if not metrics.is_enabled():
+        return
+    metrics.inc("analyses")
+    metrics.observe("request", seconds)
+    metrics.observe("model_load", stats.load_seconds)
+    metrics.observe("model_prompt_eval", stats.prompt_eval_seconds)
+    metrics.observe("model_eval", stats.eval_seconds)
+    if stats.total_seconds is not None:
+        # Upload, queueing in Ollama's scheduler and response transfer
+        metrics.observe("transport", max(0.0, seconds - stats.total_seconds))
+    if stats.tokens:
+        metrics.inc("tokens_generated", stats.tokens)
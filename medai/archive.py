@@ -0,0 +1,269 @@
+"""Local archive of past reports, searchable long after the session that made them.
+
+Every analyzed image (or multi-view study) gets a row with its content
+hash, file name, model, timestamps, the report and its parsed sections.
+An FTS5 index over the section text (Porter-stemmed, so "fractures" finds
+"fracture") answers keyword searches; date and model filters use plain
+indexes. Selected reports can be exported to one PDF with
+create_pdf_report without running the model again, and a report's own PDF
+is kept once rendered.
+
+    python -m medai.archive fracture --model llava --since 2026-01-01 --export fractures.pdf
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+from .location import UNKNOWN_LOCATION, configured_location
+from .sections import SECTION_KEYS, parse_report
+
+ARCHIVE_DB_PATH = "report_archive.sqlite3"
+# add() upserts with INSERT ... ON CONFLICT ... RETURNING
+MIN_SQLITE_VERSION = (3, 35, 0)
+# Text under headers the parser does not recognise is still searchable
+SECTION_COLUMNS = tuple(key for key, _ in SECTION_KEYS) + ("other",)
+
+# views is None for a single image, else the file names of a study's views;
+# created is when the image was first archived, analyzed when last reported on
+ArchivedReport = namedtuple(
+    "ArchivedReport",
+    ["id", "image_hash", "name", "model", "views", "report", "sections", "created", "analyzed", "has_pdf"],
+)
+
+
+def image_hash(data=None, digests=None):
+    """Hex SHA-256 of an upload, or of the concatenated SHA-256 digests of a study's views"""
+    if digests is not None:
+        return hashlib.sha256(b"".join(digests)).hexdigest()
+    return hashlib.sha256(data).hexdigest()
+
+
+def fts_query(text):
+    """Quote every word so user input is never FTS5 syntax; a trailing * keeps prefix search"""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+class ReportArchive:
+    """SQLite-backed report archive with full-text search over report sections"""
+
+    def __init__(self, db_path=ARCHIVE_DB_PATH):
+        # add() swallows SQLite errors, so an unusable SQLite must fail here, not archive nothing
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise RuntimeError(f"the report archive needs SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))}"
+                               f" or newer; Python is linked against {sqlite3.sqlite_version}")
+        self.db_path = db_path
+        self.stats = {"added": 0, "errors": 0}
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS reports ("
+                " id INTEGER PRIMARY KEY,"
+                " image_hash TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " model TEXT NOT NULL,"
+                " views TEXT,"
+                " report TEXT NOT NULL,"
+                " sections TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " analyzed REAL NOT NULL,"
+                " pdf BLOB,"
+                " pdf_location TEXT,"
+                " UNIQUE (image_hash, model))"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(reports)")}
+            if "pdf_location" not in columns:
+                # Archives from before PDFs were kept per location
+                conn.execute("ALTER TABLE reports ADD COLUMN pdf_location TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS reports_analyzed ON reports (analyzed)")
+            conn.execute("CREATE INDEX IF NOT EXISTS reports_model ON reports (model, analyzed)")
+            # Keyed by reports.id and kept in step by add(); no triggers needed
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5("
+                    f"name, {', '.join(SECTION_COLUMNS)}, tokenize = 'porter unicode61')"
+                )
+            except sqlite3.OperationalError as e:
+                raise RuntimeError(f"the report archive needs SQLite built with FTS5: {e}") from e
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call, as in cache.AnalysisCache, so
+        # sessions and job workers on different threads can share the archive
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, image_hash, name, model, report, views=None, analyzed=None):
+        """Archive a report and return its id; the same image and model replace the old report"""
+        sections = parse_report(report).to_dict()
+        # Headers are indexed too: a model may write "Findings: fracture" on one line
+        columns = dict.fromkeys(SECTION_COLUMNS, "")
+        for section in sections["sections"]:
+            key = section["key"] or "other"
+            columns[key] = "\n".join(part for part in (columns[key], section["title"] or "", section["text"]) if part)
+        analyzed = analyzed or time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "INSERT INTO reports (image_hash, name, model, views, report, sections, created, analyzed)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (image_hash, model) DO UPDATE SET"
+                    "  name = excluded.name, views = excluded.views, report = excluded.report,"
+                    "  sections = excluded.sections, analyzed = excluded.analyzed,"
+                    # A changed report needs its PDF rendered again
+                    "  pdf = CASE WHEN report = excluded.report THEN pdf END"
+                    " RETURNING id",
+                    (image_hash, name, model, json.dumps(views) if views else None, report,
+                     json.dumps(sections, ensure_ascii=False), analyzed, analyzed),
+                ).fetchone()
+                report_id = row[0]
+                conn.execute("DELETE FROM reports_fts WHERE rowid = ?", (report_id,))
+                conn.execute(
+                    f"INSERT INTO reports_fts (rowid, name, {', '.join(SECTION_COLUMNS)})"
+                    f" VALUES (?, ?{', ?' * len(SECTION_COLUMNS)})",
+                    (report_id, " ".join([name] + list(views or [])), *columns.values()),
+                )
+        except sqlite3.Error:
+            # Archiving must never fail an analysis that already succeeded
+            self.stats["errors"] += 1
+            return None
+        self.stats["added"] += 1
+        return report_id
+
+    def search(self, query=None, model=None, since=None, until=None, limit=100):
+        """Reports matching a keyword query, model and analysis time range (epoch seconds).
+
+        With a query the best matches come first, otherwise the newest.
+        """
+        where, params = ["1"], []
+        match = fts_query(query or "")
+        if match:
+            sql = f"SELECT {self._columns('r')} FROM reports_fts JOIN reports r ON r.id = reports_fts.rowid"
+            where.append("reports_fts MATCH ?")
+            params.append(match)
+            order = "bm25(reports_fts), r.analyzed DESC"
+        else:
+            sql = f"SELECT {self._columns('r')} FROM reports r"
+            order = "r.analyzed DESC"
+        if model:
+            where.append("r.model = ?")
+            params.append(model)
+        if since is not None:
+            where.append("r.analyzed >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("r.analyzed < ?")
+            params.append(until)
+        sql += f" WHERE {' AND '.join(where)} ORDER BY {order} LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            return [self._row(row) for row in conn.execute(sql, params)]
+
+    def get(self, ids):
+        """Archived reports by id, in the order asked for"""
+        ids = list(ids)
+        if not ids:
+            return []
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {self._columns('r')} FROM reports r WHERE r.id IN ({', '.join('?' * len(ids))})", ids
+            ).fetchall()
+        by_id = {row[0]: self._row(row) for row in rows}
+        return [by_id[report_id] for report_id in ids if report_id in by_id]
+
+    def models(self):
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT DISTINCT model FROM reports ORDER BY model")]
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+    def pdf(self, report_id, location=UNKNOWN_LOCATION):
+        """One report's PDF, kept in the archive once rendered for a location"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT pdf, pdf_location FROM reports WHERE id = ?", (report_id,)).fetchone()
+        if row is None:
+            raise KeyError(report_id)
+        # The location is printed on the title and specialist pages
+        if row[0] is not None and row[1] == location:
+            return bytes(row[0])
+        data = self.export_pdf([report_id], location)
+        with self._connect() as conn:
+            conn.execute("UPDATE reports SET pdf = ?, pdf_location = ? WHERE id = ?", (data, location, report_id))
+        return data
+
+    def export_pdf(self, ids, location=UNKNOWN_LOCATION):
+        """One combined PDF of the given reports, in that order, from the stored text"""
+        # fpdf is only imported when a PDF is actually wanted
+        from .report import create_pdf_bytes
+        entries = [(r.name, r.report) if r.views is None else (r.name, r.report, r.views) for r in self.get(ids)]
+        # Large selections are laid out by a process pool
+        return create_pdf_bytes(entries, location)
+
+    @staticmethod
+    def _columns(alias):
+        return ", ".join(f"{alias}.{column}" for column in (
+            "id", "image_hash", "name", "model", "views", "report", "sections", "created", "analyzed"
+        )) + f", {alias}.pdf IS NOT NULL"
+
+    @staticmethod
+    def _row(row):
+        views = json.loads(row[4]) if row[4] else None
+        return ArchivedReport(row[0], row[1], row[2], row[3], views, row[5], json.loads(row[6]),
+                              row[7], row[8], bool(row[9]))
+
+
+def parse_date(text):
+    """Epoch seconds of an ISO date or date-time"""
+    return datetime.fromisoformat(text).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search archived reports and export them to one PDF.")
+    parser.add_argument("query", nargs="*", help="keywords to look for in the reports, e.g. fracture")
+    parser.add_argument("--db", default=os.environ.get("MEDAI_ARCHIVE_DB") or ARCHIVE_DB_PATH)
+    parser.add_argument("--model", help="only reports from this model")
+    parser.add_argument("--since", type=parse_date, help="analyzed on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", type=parse_date, help="analyzed before this date (YYYY-MM-DD)")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--export", metavar="PDF", help="write the matching reports to one PDF")
+    parser.add_argument("--location", default=configured_location() or UNKNOWN_LOCATION,
+                        help="location printed on the exported PDF (default: $MEDAI_LOCATION)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"no archive at {args.db}")
+    archive = ReportArchive(args.db)
+    found = archive.search(" ".join(args.query), args.model, args.since, args.until, args.limit)
+    for report in found:
+        stamp = datetime.fromtimestamp(report.analyzed).strftime("%Y-%m-%d %H:%M")
+        views = f" ({len(report.views)} views)" if report.views else ""
+        print(f"{report.id:>6}  {stamp}  {report.model:<16} {report.name}{views}")
+    print(f"{len(found)} of {len(archive)} reports", file=sys.stderr)
+    if args.export and found:
+        with open(args.export, "wb") as f:
+            f.write(archive.export_pdf([report.id for report in found], args.location))
+        print(f"Wrote {args.export}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+BatchResult = namedtuple("BatchResult", ["index", "name", "payload", "text", "error"])
+
+
+def analyze_batch(items, preprocess, infer, preprocess_workers=4, max_concurrency=2,
+                  max_in_flight=None, on_prepared=None, on_result=None, on_tick=None,
+                  tick_interval=0.25, memory=None, cost=None):
+    """Preprocess and analyze (name, data) items concurrently.
+
+    Preprocessing runs on its own thread pool so images are decoded and
+    encoded while earlier ones are still waiting on the model, and at most
+    max_concurrency inference calls are in flight at once. items may be a
+    lazy iterable; with max_in_flight set, no more than that many items
+    are read and held between preprocessing and their final result. With a
+    memory.MemoryBudget, an item is only preprocessed once cost(data) bytes
+    fit in it, and holds them until its result; when the budget is shared
+    and full with nothing of this batch in flight, the item queues for it.
+
+    Callbacks run on the calling thread as soon as each stage finishes,
+    which keeps them safe for Streamlit calls. on_tick, if given, is also
+    called on the calling thread every tick_interval seconds so it can
+    render partial (streamed) output. The returned list is in the original
+    order; payloads are dropped from it once on_result has seen them so
+    long runs do not keep every encoded image alive.
+    """
+    items = iter(items)
+    names = []
+    results = {}
+    owners = {}
+    pending = set()
+    limit = max_in_flight or float("inf")
+    reservations = {}
+    # An item read from the source that is waiting for memory
+    held = []
+    # Its queued reservation, when memory is held by work outside this batch
+    queued = []
+
+    with ThreadPoolExecutor(max_workers=max(1, preprocess_workers)) as prep_pool, \
+            ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as infer_pool:
+
+        def fill():
+            # Top up the pipeline from the (possibly lazy) item source
+            while len(names) - len(results) < limit:
+                if not held:
+                    try:
+                        held.append(next(items))
+                    except StopIteration:
+                        return
+                name, data = held[0]
+                if memory is not None:
+                    if queued:
+                        if not queued[0].admitted:
+                            return
+                        reservation = queued.pop()
+                    else:
+                        reservation = memory.try_reserve(cost(data))
+                    if reservation is None:
+                        if pending:
+                            # Something in flight holds memory and will call fill() when done
+                            return
+                        # Only other users of a shared budget hold it: wait in line so
+                        # the loop below keeps ticking until their release admits us
+                        admitted = Future()
+                        queued.append(memory.reserve(cost(data), on_admit=admitted.set_result))
+                        owners[admitted] = ("memory", None, None)
+                        pending.add(admitted)
+                        return
+                    reservations[len(names)] = reservation
+                held.clear()
+                future = prep_pool.submit(preprocess, data)
+                owners[future] = ("prep", len(names), None)
+                names.append(name)
+                pending.add(future)
+
+        fill()
+        while pending:
+            done, still_pending = wait(
+                pending,
+                timeout=tick_interval if on_tick else None,
+                return_when=FIRST_COMPLETED,
+            )
+            pending.clear()
+            pending.update(still_pending)
+            if on_tick:
+                on_tick()
+
+            for future in done:
+                stage, index, payload = owners.pop(future)
+                if stage == "memory":
+                    # fill() below picks up the admitted reservation
+                    continue
+                name = names[index]
+                error = future.exception()
+
+                if stage == "prep" and error is None:
+                    payload = future.result()
+                    if on_prepared:
+                        on_prepared(index, name, payload)
+                    next_future = infer_pool.submit(infer, payload)
+                    owners[next_future] = ("infer", index, payload)
+                    pending.add(next_future)
+                    continue
+
+                text = future.result() if error is None else None
+                result = BatchResult(index, name, payload, text, error)
+                if on_result:
+                    on_result(result)
+                results[index] = result._replace(payload=None)
+                if index in reservations:
+                    reservations.pop(index).release()
+
+            fill()
+
+    return [results[index] for index in range(len(names))]
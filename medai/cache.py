@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file, read in chunks so large studies never sit in memory"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def make_cache_key(image_bytes, model, prompt, options=None, image_digest=None):
+    """Build a content-addressed key for one analysis request.
+
+    Pass image_digest (from file_digest) instead of image_bytes when the
+    image was never read into memory.
+    """
+    digest = hashlib.sha256()
+    digest.update(image_digest or hashlib.sha256(image_bytes).digest())
+    # Options are serialized with sorted keys so dict ordering never changes the key
+    for part in (model, prompt, json.dumps(options or {}, sort_keys=True)):
+        digest.update(b"\x00")
+        digest.update(part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """LRU cache of model responses with an optional SQLite tier on disk.
+
+    The disk tier keeps the max_disk_entries most recently used responses.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024, db_path=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+
+        if self.db_path:
+            self._init_db()
+
+    def _init_db(self):
+        """Create the on-disk table if it does not exist yet"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS analyses ("
+                " key TEXT PRIMARY KEY,"
+                " response TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS analyses_accessed ON analyses (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps the cache safe to share
+        # between Streamlit sessions running on different threads
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key]
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        """Store a response in memory and, if enabled, on disk"""
+        with self._lock:
+            self._remember(key, value)
+        self._disk_put(key, value)
+
+    def clear(self):
+        """Drop every cached response, including the disk tier"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM analyses")
+            except sqlite3.Error:
+                pass
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._size
+
+    def _remember(self, key, value):
+        """Insert into the memory tier and evict least recently used entries"""
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key).encode("utf-8"))
+        self._entries[key] = value
+        self._size += len(value.encode("utf-8"))
+
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._size > self.max_bytes
+        ):
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.encode("utf-8"))
+            self.stats["evictions"] += 1
+
+    def _disk_get(self, key):
+        if not self.db_path:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT response FROM analyses WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE analyses SET accessed = ? WHERE key = ?", (time.time(), key)
+                    )
+                    return row[0]
+        except sqlite3.Error:
+            # A broken disk tier should never block an analysis
+            pass
+        return None
+
+    def _disk_put(self, key, value):
+        if not self.db_path:
+            return
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO analyses (key, response, created, accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                # Least recently used first; get() refreshes accessed on every disk hit
+                evicted = conn.execute(
+                    "DELETE FROM analyses WHERE key IN ("
+                    " SELECT key FROM analyses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                ).rowcount
+            with self._lock:
+                self.stats["disk_evictions"] += evicted
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,285 @@
+"""Headless batch analysis of X-ray directories, without Streamlit.
+
+Example:
+    python -m medai xrays/ "incoming/**/*.png" --output results.jsonl --pdf-dir reports
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from . import metrics
+from .analysis import (OLLAMA_API, OLLAMA_MODEL, REPORT_PROMPT, PreparedStudy, analyze_image,
+                       analyze_study, prepare_file, prepare_study_files)
+from .archive import ReportArchive, image_hash
+from .batch import analyze_batch
+from .cache import AnalysisCache, file_digest
+from .dedupe import DEFAULT_THRESHOLD, NearDuplicateIndex
+from .imaging import budget_for, estimate_memory
+from .location import UNKNOWN_LOCATION, configured_location
+from .memory import MemoryBudget
+from .models import KEEP_ALIVE, TUNABLE_OPTIONS, ModelManager, parse_keep_alive
+from .router import STRATEGIES, Router, parse_endpoints
+from .sections import parse_report
+from .studies import group_studies, images_per_request, study_budget_for
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".dcm")
+
+
+def find_images(inputs):
+    """Expand directories and glob patterns into a sorted, de-duplicated path list"""
+    paths = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                for file_name in files:
+                    if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                        paths.add(os.path.join(root, file_name))
+        else:
+            for path in glob.glob(pattern, recursive=True):
+                if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.add(path)
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def load_checkpoint(output_path):
+    """Return the paths that already have a successful record in output_path"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A run killed mid-write can leave a truncated last line
+                continue
+            # A study record covers all of its views
+            paths = record.get("paths") or [record.get("path")]
+            if record.get("status") == "ok":
+                completed.update(paths)
+            else:
+                completed.difference_update(paths)
+    return completed
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m medai",
+        description="Analyze directories of X-ray images with a local Ollama model.",
+    )
+    parser.add_argument("inputs", nargs="+", help="image directories or glob patterns")
+    parser.add_argument("-o", "--output", default="results.jsonl",
+                        help="JSONL file with one record per image; also the resume checkpoint")
+    parser.add_argument("--pdf-dir", help="write a PDF report for every --pdf-batch-size images")
+    parser.add_argument("--pdf-batch-size", type=int, default=50)
+    parser.add_argument("--pdf-workers", type=int,
+                        help="processes laying out large PDFs (default: one per CPU; 1 lays out serially)")
+    parser.add_argument("--location", default=configured_location() or UNKNOWN_LOCATION,
+                        help="location printed on PDF reports (default: $MEDAI_LOCATION)")
+    parser.add_argument("--api", default=OLLAMA_API, help="Ollama /api/generate URL")
+    parser.add_argument("--model", default=OLLAMA_MODEL)
+    parser.add_argument("--keep-alive", type=parse_keep_alive, default=KEEP_ALIVE,
+                        help="how long Ollama keeps the model loaded, e.g. 30m or -1 for ever")
+    parser.add_argument("--num-ctx", type=int, help="Ollama context window")
+    parser.add_argument("--num-predict", type=int, help="max tokens per report")
+    parser.add_argument("--num-thread", type=int, help="Ollama CPU threads")
+    parser.add_argument("--backends",
+                        help="spread requests over several servers, e.g. "
+                             "'ollama=http://gpu1:11434,lmstudio=http://gpu2:1234' (overrides --api)")
+    parser.add_argument("--routing", choices=STRATEGIES, default="least_outstanding",
+                        help="how --backends picks a server for each request")
+    parser.add_argument("--group-studies", action="store_true",
+                        help="send the views of one study (DICOM StudyInstanceUID or file name "
+                             "minus a view label such as _PA/_LAT) in one request for one combined report")
+    parser.add_argument("--study-pattern",
+                        help="regex whose first group is the study in a file name, for --group-studies")
+    parser.add_argument("--workers", type=int, default=4, help="preprocessing threads")
+    parser.add_argument("--concurrency", type=int, default=2,
+                        help="inference requests in flight at once")
+    parser.add_argument("--max-in-flight", type=int, default=16,
+                        help="images held in memory between reading and writing their record")
+    parser.add_argument("--max-memory", type=float,
+                        help="megabytes of decoded and encoded images to hold at once; "
+                             "large images wait for room instead of exhausting memory")
+    parser.add_argument("--cache-db", default=os.environ.get("MEDAI_CACHE_DB"),
+                        help="SQLite analysis cache shared with the Streamlit app")
+    parser.add_argument("--archive-db", default=os.environ.get("MEDAI_ARCHIVE_DB"),
+                        help="also keep every report in this searchable archive (see python -m medai.archive)")
+    parser.add_argument("--duplicate-threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help="max pHash bit difference for reusing a near-identical image's report "
+                             "(-1 disables)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="re-analyze images that already have a record in --output")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics at /metrics on this port while running")
+    parser.add_argument("--timings", action="store_true",
+                        help="collect per-stage timings and print them at the end")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    paths = find_images(args.inputs)
+    completed = set() if args.no_resume else load_checkpoint(args.output)
+    todo = [path for path in paths if path not in completed]
+    print(f"Found {len(paths)} images, {len(paths) - len(todo)} already done, {len(todo)} to analyze",
+          file=sys.stderr)
+    if not todo:
+        return 0
+
+    if args.metrics_port or args.timings:
+        metrics.enable()
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+        print(f"Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics", file=sys.stderr)
+
+    cache = AnalysisCache(db_path=args.cache_db) if args.cache_db else None
+    archive = ReportArchive(args.archive_db) if args.archive_db else None
+    dedupe = None
+    if args.duplicate_threshold >= 0:
+        dedupe = NearDuplicateIndex(args.duplicate_threshold, db_path=args.cache_db)
+        # Reused reports are read back from the cache, so keep one in memory at least
+        if cache is None:
+            cache = AnalysisCache()
+    options = {name: getattr(args, name) for name in TUNABLE_OPTIONS if getattr(args, name) is not None}
+    if args.backends:
+        router = Router(parse_endpoints(args.backends), strategy=args.routing,
+                        keep_alive=args.keep_alive, options=options).start(wait=True).prewarm()
+        manager = None
+    else:
+        router = None
+        manager = ModelManager(args.model, args.api.rsplit("/api/", 1)[0], args.keep_alive, options)
+        # Loads while the first images are preprocessed
+        manager.prewarm()
+    members = [(os.path.basename(path), path) for path in todo]
+    if args.group_studies:
+        max_images = images_per_request(study_budget_for(args.model, options))
+        units = [(study.name, study.members) for study in group_studies(members, args.study_pattern, max_images)]
+        print(f"Grouped into {len(units)} requests of up to {max_images} views", file=sys.stderr)
+    else:
+        units = [(name, [(name, path)]) for name, path in members]
+
+    memory = MemoryBudget(int(args.max_memory * 2**20)) if args.max_memory else None
+    image_budget = budget_for(args.model)
+
+    def prepare(unit):
+        if len(unit) == 1:
+            return prepare_file(unit[0][1], model=args.model, options=options)
+        return prepare_study_files(unit, model=args.model, options=options)
+
+    def analyze(prepared):
+        if isinstance(prepared, PreparedStudy):
+            return analyze_study(prepared, api=args.api, model=args.model, prompt=REPORT_PROMPT,
+                                 cache=cache, router=router, manager=manager)
+        return analyze_image(prepared, api=args.api, model=args.model, prompt=REPORT_PROMPT,
+                             cache=cache, router=router, dedupe=dedupe, manager=manager, options=options)
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    if args.pdf_dir:
+        os.makedirs(args.pdf_dir, exist_ok=True)
+    run_stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    pdf_batch = []
+    pdf_count = 0
+    counts = {"ok": 0, "error": 0, "images": 0}
+
+    def flush_pdf():
+        nonlocal pdf_count
+        if not pdf_batch:
+            return
+        # fpdf is only imported by runs that write PDFs
+        from .report import create_pdf_bytes
+        pdf_count += 1
+        pdf_path = os.path.join(args.pdf_dir, f"xray_report_{run_stamp}_{pdf_count:04d}.pdf")
+        pdf_batch.sort()
+        with metrics.timed("pdf_output"):
+            data = create_pdf_bytes([entry[1:] for entry in pdf_batch], args.location, workers=args.pdf_workers)
+        with open(pdf_path, "wb") as f:
+            f.write(data)
+        pdf_batch.clear()
+        print(f"Wrote {pdf_path}", file=sys.stderr)
+
+    started = time.perf_counter()
+    with open(args.output, "a", encoding="utf-8") as out:
+
+        def write_record(result):
+            unit = units[result.index][1]
+            ok = result.error is None
+            counts["ok" if ok else "error"] += 1
+            counts["images"] += len(unit)
+            # With --backends a failover may have answered with another model
+            served_by = result.payload.stats.served_by if result.payload else None
+            record = {
+                "path": unit[0][1],
+                "name": result.name,
+                "model": served_by.model if served_by else args.model,
+                "status": "ok" if ok else "error",
+                "report": result.text,
+                "sections": parse_report(result.text).to_dict() if ok else None,
+                "error": None if ok else str(result.error),
+                "completed_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            if len(unit) > 1:
+                record["paths"] = [path for _, path in unit]
+                record["views"] = [name for name, _ in unit]
+            if archive is not None and ok:
+                if len(unit) > 1:
+                    upload_hash = image_hash(digests=[file_digest(path) for _, path in unit])
+                else:
+                    upload_hash = file_digest(unit[0][1]).hex()
+                archive.add(upload_hash, result.name, record["model"], result.text, views=record.get("views"))
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            # Flush per record so a crash loses at most the in-flight images
+            out.flush()
+
+            done = counts["ok"] + counts["error"]
+            print(f"[{done}/{len(units)}] {result.name}: {record['status']}", file=sys.stderr)
+
+            if args.pdf_dir and ok:
+                views = record.get("views")
+                pdf_batch.append((result.index, result.name, result.text, *([views] if views else [])))
+                if len(pdf_batch) >= args.pdf_batch_size:
+                    flush_pdf()
+
+        analyze_batch(
+            units,
+            prepare,
+            analyze,
+            preprocess_workers=args.workers,
+            max_concurrency=args.concurrency,
+            max_in_flight=args.max_in_flight,
+            on_result=write_record,
+            memory=memory,
+            cost=lambda unit: sum(estimate_memory(path, image_budget) for _, path in unit),
+        )
+
+    if args.pdf_dir:
+        flush_pdf()
+
+    elapsed = time.perf_counter() - started
+    done = counts["images"]
+    rate = done / elapsed * 60 if elapsed > 0 else 0.0
+    requests = f" ({len(units)} requests)" if len(units) != done else ""
+    print(
+        f"Analyzed {done} images{requests} in {elapsed:.1f}s ({rate:.1f} images/min): "
+        f"{counts['ok']} ok, {counts['error']} failed",
+        file=sys.stderr,
+    )
+    if metrics.is_enabled():
+        print_timings(metrics.snapshot())
+    return 1 if counts["error"] else 0
+
+
+def print_timings(snapshot):
+    """Per-stage timing table on stderr"""
+    print(f"{'stage':<18}{'count':>7}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'total s':>10}",
+          file=sys.stderr)
+    for stage, t in sorted(snapshot["stages"].items(), key=lambda item: -item[1]["total_seconds"]):
+        print(f"{stage:<18}{t['count']:>7}{t['mean_seconds'] * 1000:>10.1f}{t['p50_seconds'] * 1000:>10.1f}"
+              f"{t['p95_seconds'] * 1000:>10.1f}{t['total_seconds']:>10.2f}", file=sys.stderr)
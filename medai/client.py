@@ -0,0 +1,212 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+from .memory import JSONBody
+
+# Status codes worth retrying: the model server is restarting, loading or overloaded
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class BackendUnavailable(Exception):
+    """The backend's circuit breaker is open after repeated failures"""
+
+
+class BackendOverloaded(Exception):
+    """Too many requests are already waiting on the backend"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Return True if a request may be sent now"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def release_probe(self):
+        """End a half-open probe that never reached the backend, without judging it"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class BackendClient:
+    """Keep-alive HTTP client for one inference backend.
+
+    Wraps a pooled requests.Session with connect/read timeouts, retries
+    with jittered exponential backoff on connection errors and 5xx
+    responses, a circuit breaker, and a cap on outstanding requests.
+    Callers over the cap wait up to queue_timeout for a slot and are then
+    rejected with BackendOverloaded instead of piling up blocked threads.
+    """
+
+    def __init__(self, name, pool_size=8, connect_timeout=5.0, read_timeout=300.0,
+                 max_retries=2, backoff=0.5, max_backoff=8.0, failure_threshold=5,
+                 reset_timeout=30.0, max_outstanding=8, queue_timeout=60.0):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queue_timeout = queue_timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_outstanding = max_outstanding
+        self._slots = threading.BoundedSemaphore(max_outstanding)
+        self._lock = threading.Lock()
+        self.outstanding = 0
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "rejected": 0}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def saturated(self):
+        """True when a new request would have to wait for a slot"""
+        return self.outstanding >= self.max_outstanding
+
+    def ping(self, url, timeout=2.0):
+        """GET url outside the slots, retries and breaker; True on a 2xx answer"""
+        try:
+            response = self.session.get(url, timeout=timeout)
+        except requests.RequestException:
+            return False
+        response.close()
+        return response.ok
+
+    def post(self, url, **kwargs):
+        """POST and return the fully read response"""
+        with self.stream(url, stream=False, **kwargs) as response:
+            return response
+
+    @contextmanager
+    def stream(self, url, stream=True, **kwargs):
+        """POST and yield the response, holding a slot until the block exits"""
+        self._acquire()
+        try:
+            response = self._send(url, stream=stream, **kwargs)
+            try:
+                yield response
+            finally:
+                response.close()
+        finally:
+            self._release()
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise BackendOverloaded(f"{self.name}: too many requests in flight, try again shortly")
+        with self._lock:
+            self.outstanding += 1
+
+    def _release(self):
+        with self._lock:
+            self.outstanding -= 1
+        self._slots.release()
+
+    def _send(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        if "json" in kwargs:
+            # Serialized while it is sent, so images are never held as one big JSON string
+            kwargs["data"] = JSONBody(kwargs.pop("json"))
+            kwargs["headers"] = {"Content-Type": "application/json", **(kwargs.get("headers") or {})}
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise BackendUnavailable(
+                    f"{self.name}: backend is failing, retrying in {self.breaker.reset_timeout:.0f}s"
+                )
+            with self._lock:
+                self.stats["requests"] += 1
+
+            try:
+                response = self.session.post(url, **kwargs)
+            except requests.RequestException as e:
+                # Every failure is recorded, or a half-open probe would never end
+                self._record_failure()
+                # Only connection failures and connect timeouts are retried; a read
+                # timeout means the model was already working, so do not pile on
+                retryable = isinstance(e, (requests.ConnectionError, requests.Timeout))
+                if not retryable or isinstance(e, requests.ReadTimeout) or attempt >= self.max_retries:
+                    raise
+            except BaseException:
+                # Not the backend's fault (e.g. the body failed to serialize), but free the probe
+                self.breaker.release_probe()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                self._record_failure()
+                if attempt >= self.max_retries:
+                    return response
+                response.close()
+
+            attempt += 1
+            with self._lock:
+                self.stats["retries"] += 1
+            # Full jitter keeps parallel workers from retrying in lockstep
+            time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def _record_failure(self):
+        self.breaker.record_failure()
+        with self._lock:
+            self.stats["failures"] += 1
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name, **config):
+    """Return the process-wide client for a backend, creating it on first use"""
+    with _clients_lock:
+        if name not in _clients:
+            client = _clients[name] = BackendClient(name, **config)
+            metrics.register("backend", {"backend": name}, lambda: dict(
+                client.stats, outstanding=client.outstanding,
+                breaker_open=client.breaker.state != "closed",
+            ))
+        return _clients[name]
@@ -0,0 +1,213 @@
+"""Perceptual hashes and a near-duplicate index over analyzed images.
+
+A re-export of the same radiograph at another size or JPEG quality gets a
+64-bit pHash within a few bits of the original, so its report can be
+reused instead of asking the model again. Hashes are kept per model and
+prompt (a scope) in contiguous uint64 arrays and compared with one
+vectorized XOR + popcount, which stays in the low milliseconds even for
+hundreds of thousands of entries.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+# Max differing bits for two images to count as the same study. Kept low:
+# different patients' views of the same body part can sit around 10-20 bits
+DEFAULT_THRESHOLD = 4
+HASH_SIDE = 32
+HASH_BITS = 8
+# Below this low-frequency energy an image is blank and its hash is just noise
+FLAT_ENERGY = 1.0
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis, so a 2-D DCT is two matrix products"""
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+DCT = _dct_matrix(HASH_SIDE)
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    # numpy < 2.0: count bits per byte through a lookup table
+    _BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _BYTE_BITS[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def phash(image):
+    """64-bit DCT perceptual hash of a PIL image, None if it has no structure"""
+    small = image.convert("L").resize((HASH_SIDE, HASH_SIDE), Image.Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.float32)
+    low = (DCT @ pixels @ DCT.T)[:HASH_BITS, :HASH_BITS]
+    # The DC term only carries overall brightness
+    ac = low.ravel()[1:]
+    if np.abs(ac).max() < FLAT_ENERGY:
+        return None
+    median = np.median(ac)
+    return _bits_to_int(low > median)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def make_scope(model, prompt, options=None):
+    """Reports are only reused for the same model, prompt and Ollama options"""
+    scope = f"{model}\x00{prompt}\x00{json.dumps(options or {}, sort_keys=True)}"
+    return hashlib.sha256(scope.encode("utf-8")).hexdigest()[:16]
+
+
+class _Bucket:
+    """Growable uint64 hash array with the matching keys"""
+
+    def __init__(self):
+        self.hashes = np.empty(1024, dtype=np.uint64)
+        self.keys = []
+        self._known = set()
+
+    def append(self, value, key):
+        # The same analysis reported twice (a rerun, a reloaded cache) is one entry
+        if key in self._known:
+            return
+        self._known.add(key)
+        if len(self.keys) == len(self.hashes):
+            self.hashes = np.concatenate([self.hashes, np.empty_like(self.hashes)])
+        self.hashes[len(self.keys)] = value
+        self.keys.append(key)
+
+    def nearest(self, value):
+        count = len(self.keys)
+        if not count:
+            return None, None
+        distances = _popcount(self.hashes[:count] ^ np.uint64(value))
+        index = int(np.argmin(distances))
+        return self.keys[index], int(distances[index])
+
+
+class NearDuplicateIndex:
+    """Find analyses of near-identical images, including ones still running.
+
+    claim() is called before inference: it returns the key of an analyzed
+    or in-flight near duplicate, or registers the caller as in flight and
+    returns None. The caller then add()s its key once the report is cached
+    or discard()s it on failure, waking anyone waiting on it.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, db_path=None):
+        self.threshold = threshold
+        self.db_path = db_path
+        self._buckets = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "matches": 0, "waits": 0}
+        if self.db_path:
+            self._load()
+
+    def __len__(self):
+        return sum(len(bucket.keys) for bucket in self._buckets.values())
+
+    def claim(self, scope, value, key):
+        """Return (key, distance) of a near duplicate, or None after registering key"""
+        with self._lock:
+            self.stats["lookups"] += 1
+            bucket = self._buckets.get(scope)
+            if bucket is not None:
+                match, distance = bucket.nearest(value)
+                if match is not None and distance <= self.threshold:
+                    self.stats["matches"] += 1
+                    return match, distance
+            for other, (other_scope, other_value, _) in self._pending.items():
+                distance = hamming(value, other_value)
+                if other_scope == scope and other != key and distance <= self.threshold:
+                    self.stats["matches"] += 1
+                    self.stats["waits"] += 1
+                    return other, distance
+            if key not in self._pending:
+                self._pending[key] = (scope, value, threading.Event())
+            return None
+
+    def wait(self, key, timeout=None):
+        """Block until an in-flight key is added or discarded"""
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            pending[2].wait(timeout)
+
+    def add(self, scope, value, key):
+        """Record an analyzed image whose report is cached under key"""
+        with self._lock:
+            bucket = self._buckets.get(scope)
+            if bucket is None:
+                bucket = self._buckets[scope] = _Bucket()
+            bucket.append(value, key)
+            pending = self._pending.pop(key, None)
+        if pending is not None:
+            pending[2].set()
+        self._save(scope, value, key)
+
+    def discard(self, key):
+        """Give up an in-flight claim, e.g. after a failed analysis"""
+        with self._lock:
+            pending = self._pending.pop(key, None)
+        if pending is not None:
+            pending[2].set()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _load(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS image_hashes ("
+                " key TEXT PRIMARY KEY,"
+                " scope TEXT NOT NULL,"
+                " phash INTEGER NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+            rows = conn.execute("SELECT scope, phash, key FROM image_hashes ORDER BY created").fetchall()
+        for scope, value, key in rows:
+            bucket = self._buckets.get(scope)
+            if bucket is None:
+                bucket = self._buckets[scope] = _Bucket()
+            # SQLite integers are signed 64-bit
+            bucket.append(value & 0xFFFFFFFFFFFFFFFF, key)
+
+    def _save(self, scope, value, key):
+        if not self.db_path:
+            return
+        signed = value - (1 << 64) if value >= 1 << 63 else value
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO image_hashes (key, scope, phash, created) VALUES (?, ?, ?, ?)",
+                    (key, scope, signed, time.time()),
+                )
+        except sqlite3.Error:
+            # Losing a hash only costs a future inference
+            pass
@@ -0,0 +1,122 @@
+"""Lazy DICOM pixel access.
+
+Headers are parsed without reading Pixel Data. Uncompressed pixel data is
+then mapped straight from the file (np.memmap) or the upload buffer
+(np.frombuffer), so only the pages of the selected frame are ever touched.
+Compressed transfer syntaxes decode a single frame through pydicom.
+pydicom is optional and only imported once a DICOM file actually shows up.
+"""
+import io
+import os
+
+import numpy as np
+
+PIXEL_DATA = 0x7FE00010
+
+
+def _pydicom():
+    """Import pydicom on first use; it is slow to import and most uploads are not DICOM"""
+    try:
+        import pydicom
+    except ImportError:
+        raise ImportError("DICOM support needs pydicom: pip install pydicom") from None
+    return pydicom
+
+def is_dicom(data):
+    """True for Part 10 files, which carry 'DICM' after a 128-byte preamble"""
+    return len(data) >= 132 and data[128:132] == b"DICM"
+
+
+def _first(value, default=None):
+    """Return the first value of a possibly multi-valued header element"""
+    if value is None or value == "":
+        return default
+    try:
+        return float(value[0])
+    except TypeError:
+        return float(value)
+
+
+def _header(ds):
+    """Display-relevant header fields as plain Python values"""
+    return {
+        "rows": int(ds.Rows),
+        "columns": int(ds.Columns),
+        "frames": int(getattr(ds, "NumberOfFrames", 1) or 1),
+        "samples": int(getattr(ds, "SamplesPerPixel", 1)),
+        "bits_allocated": int(ds.BitsAllocated),
+        "signed": int(getattr(ds, "PixelRepresentation", 0)) == 1,
+        "photometric": str(getattr(ds, "PhotometricInterpretation", "MONOCHROME2")),
+        "slope": _first(getattr(ds, "RescaleSlope", None), 1.0),
+        "intercept": _first(getattr(ds, "RescaleIntercept", None), 0.0),
+        "window_center": _first(getattr(ds, "WindowCenter", None)),
+        "window_width": _first(getattr(ds, "WindowWidth", None)),
+        "study_uid": str(getattr(ds, "StudyInstanceUID", "")),
+    }
+
+
+def read_study_uid(source):
+    """StudyInstanceUID of a DICOM file path or bytes, read from the header only"""
+    is_path = isinstance(source, (str, os.PathLike))
+    ds = _pydicom().dcmread(source if is_path else io.BytesIO(source),
+                            stop_before_pixels=True, specific_tags=["StudyInstanceUID"])
+    return str(getattr(ds, "StudyInstanceUID", ""))
+
+
+def read_dicom_frame(source, frame=None):
+    """Return (pixels, header) for one frame of a DICOM file path or bytes.
+
+    pixels holds the stored values (before rescale/windowing) and is a
+    read-only view onto the file or buffer whenever the transfer syntax
+    allows it. frame defaults to the middle frame of multi-frame studies.
+    """
+    is_path = isinstance(source, (str, os.PathLike))
+    # Large elements (Pixel Data) are deferred, so only the header is parsed here
+    ds = _pydicom().dcmread(source if is_path else io.BytesIO(source), defer_size="64 KB")
+    header = _header(ds)
+    if frame is None:
+        frame = header["frames"] // 2
+    if not 0 <= frame < header["frames"]:
+        raise ValueError(f"frame {frame} out of range for {header['frames']} frame(s)")
+
+    syntax = ds.file_meta.TransferSyntaxUID
+    try:
+        # keep_deferred stops pydicom 3 from reading Pixel Data just to return it
+        element = ds.get_item(PIXEL_DATA, keep_deferred=True)
+    except TypeError:
+        element = ds.get_item(PIXEL_DATA)
+    if element is None:
+        raise ValueError("DICOM file has no pixel data")
+
+    mappable = (
+        not syntax.is_compressed
+        and syntax.is_little_endian
+        and header["bits_allocated"] in (8, 16, 32)
+        and getattr(element, "value_tell", None) is not None
+    )
+    if not mappable:
+        return _decode_frame(source if is_path else io.BytesIO(source), ds, frame), header
+
+    dtype = np.dtype(f"{'i' if header['signed'] else 'u'}{header['bits_allocated'] // 8}").newbyteorder("<")
+    shape = (header["frames"], header["rows"], header["columns"])
+    if header["samples"] > 1:
+        shape += (header["samples"],)
+    count = int(np.prod(shape))
+    offset = element.value_tell
+
+    if is_path:
+        pixels = np.memmap(source, dtype=dtype, mode="r", offset=offset, shape=shape)
+    else:
+        pixels = np.frombuffer(source, dtype=dtype, count=count, offset=offset).reshape(shape)
+    return pixels[frame], header
+
+
+def _decode_frame(source, ds, frame):
+    """Decode a single (possibly compressed) frame through pydicom"""
+    try:
+        from pydicom.pixels import pixel_array
+    except ImportError:
+        # pydicom < 3 can only decode the whole pixel array at once
+        pixels = ds.pixel_array
+        return pixels[frame] if int(getattr(ds, "NumberOfFrames", 1) or 1) > 1 else pixels
+    return pixel_array(source, index=frame)
@@ -0,0 +1,277 @@
+import io
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+from . import metrics
+from .dicom import is_dicom, read_dicom_frame
+from .memory import Base64Data
+
+# Longest edge in pixels and encoded size in bytes we are willing to send per image
+ImageBudget = namedtuple("ImageBudget", ["max_side", "max_bytes"])
+
+DEFAULT_BUDGET = ImageBudget(max_side=800, max_bytes=400 * 1024)
+MODEL_BUDGETS = {
+    # LLaVA's vision tower works at 336 px, so 800 px leaves plenty of detail
+    "llava": ImageBudget(max_side=800, max_bytes=400 * 1024),
+    # MedGemma's SigLIP encoder takes 896x896 inputs
+    "medgemma-4b-it": ImageBudget(max_side=896, max_bytes=600 * 1024),
+}
+
+PASSTHROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png"}
+# PIL modes for 16-bit (and deeper) grayscale PNG/TIFF
+DEEP_MODES = ("I", "I;16", "I;16B", "I;16L", "F")
+JPEG_QUALITIES = (85, 75, 65, 50)
+
+# Max per-pixel channel difference for an RGB image to count as grayscale
+GRAY_TOLERANCE = 3
+
+# b64 is a memory.Base64Data over data, encoded only as the request is sent
+Preprocessed = namedtuple(
+    "Preprocessed",
+    ["image", "data", "b64", "mime", "passthrough", "original_size", "size", "seconds"],
+)
+
+# Bytes per pixel PIL keeps for each mode while decoding
+MODE_BYTES = {"1": 1, "L": 1, "P": 1, "LA": 2, "I;16": 2, "I;16B": 2, "I;16L": 2,
+              "I": 4, "F": 4, "RGB": 3, "YCbCr": 3, "LAB": 3, "HSV": 3, "RGBA": 4, "CMYK": 4}
+
+
+def budget_for(model):
+    return MODEL_BUDGETS.get(model, DEFAULT_BUDGET)
+
+
+def is_grayscale(image):
+    """True for single-channel images and RGB images whose channels match"""
+    if image.mode in ("1", "L", "LA") + DEEP_MODES:
+        return True
+    if image.mode != "RGB":
+        return False
+    pixels = np.asarray(image, dtype=np.int16)
+    spread = pixels.max(axis=2) - pixels.min(axis=2)
+    return int(spread.max()) <= GRAY_TOLERANCE
+
+
+def downscale_blocks(pixels, max_side):
+    """Box-filter pixels by an integer factor, staying at or above max_side.
+
+    Works on 2-D (or HxWxC) arrays, including memory-mapped ones, using a
+    reshape view so the only full-size pass is the reduction itself. The
+    result is float32 so deep pixel values survive until windowing.
+    """
+    factor = max(pixels.shape[0], pixels.shape[1]) // max_side
+    if factor < 2:
+        return np.array(pixels, dtype=np.float32)
+    h = pixels.shape[0] // factor
+    w = pixels.shape[1] // factor
+    blocks = pixels[:h * factor, :w * factor].reshape((h, factor, w, factor) + pixels.shape[2:])
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def window_to_uint8(pixels, center=None, width=None, invert=False):
+    """Map float pixels to 8 bits with a window/level, in place where possible.
+
+    Without a usable window the 0.5-99.5 percentile range is used, which
+    ignores burned-in labels and collimator edges.
+    """
+    if center is None or not width or width <= 1:
+        low, high = (float(v) for v in np.percentile(pixels, (0.5, 99.5)))
+    else:
+        # DICOM PS3.3 C.11.2.1.2 linear window
+        low = center - 0.5 - (width - 1) / 2
+        high = center - 0.5 + (width - 1) / 2
+    if high <= low:
+        return np.zeros(pixels.shape, dtype=np.uint8)
+
+    pixels -= low
+    pixels *= 255.0 / (high - low)
+    np.clip(pixels, 0, 255, out=pixels)
+    if invert:
+        np.subtract(255.0, pixels, out=pixels)
+    return pixels.astype(np.uint8)
+
+
+def _dicom_image(source, max_side, frame=None):
+    """Decode one DICOM frame to an 8-bit PIL image near max_side"""
+    pixels, header = read_dicom_frame(source, frame)
+    small = downscale_blocks(pixels, max_side)
+    del pixels
+
+    if header["samples"] > 1:
+        mode = "YCbCr" if header["photometric"].startswith("YBR") else "RGB"
+        image = Image.fromarray(np.clip(small, 0, 255).astype(np.uint8), mode)
+        return image.convert("RGB"), (header["columns"], header["rows"])
+
+    # Modality LUT first: window values are given in rescaled units
+    small *= header["slope"]
+    small += header["intercept"]
+    gray = window_to_uint8(
+        small, header["window_center"], header["window_width"],
+        invert=header["photometric"] == "MONOCHROME1",
+    )
+    return Image.fromarray(gray, "L"), (header["columns"], header["rows"])
+
+
+def _encode_jpeg(image, max_bytes):
+    """Encode at the highest quality that fits max_bytes, shrinking as a last resort"""
+    while True:
+        for quality in JPEG_QUALITIES:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=True)
+            if buffer.tell() <= max_bytes:
+                return buffer.getvalue()
+        if max(image.size) <= 256:
+            return buffer.getvalue()
+        image = image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.Resampling.BILINEAR)
+
+
+def preprocess_image(image_bytes, budget=DEFAULT_BUDGET, frame=None):
+    """Prepare an upload for a vision model within the given budget.
+
+    Originals that are already JPEG/PNG, 8-bit and within budget are sent
+    untouched. Everything else is decoded at reduced size where the format
+    allows it (JPEG DCT scaling via draft, DICOM frames mapped lazily),
+    downscaled before any 16-bit data is windowed to 8 bits, kept
+    single-channel when it is grayscale, resized to budget.max_side and
+    JPEG-encoded under budget.max_bytes.
+    """
+    started = time.perf_counter()
+    if is_dicom(image_bytes):
+        with metrics.timed("decode"):
+            image, original_size = _dicom_image(image_bytes, budget.max_side, frame)
+        return _finish(image, original_size, budget, started)
+
+    return _preprocess_pil(Image.open(io.BytesIO(image_bytes)), lambda: image_bytes, len(image_bytes),
+                           budget, started)
+
+
+def _preprocess_pil(image, read, nbytes, budget, started):
+    """preprocess_image for an opened, not yet decoded PIL image; read() returns the original bytes"""
+    original_size = image.size
+
+    if (
+        image.format in PASSTHROUGH_FORMATS
+        and image.mode in ("L", "RGB")
+        and max(image.size) <= budget.max_side
+        and nbytes <= budget.max_bytes
+    ):
+        data = read()
+        # Small enough to keep decoded; the file or buffer it came from can go
+        image.load()
+        return Preprocessed(
+            image, data, Base64Data(data),
+            PASSTHROUGH_FORMATS[image.format], True, original_size, image.size,
+            time.perf_counter() - started,
+        )
+
+    if image.format == "JPEG":
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full resolution
+        image.draft("L" if image.mode == "L" else "RGB", _target_size(original_size, budget))
+
+    with metrics.timed("decode"):
+        # PIL decodes lazily; load here so the decode is timed on its own
+        image.load()
+        if image.mode in DEEP_MODES:
+            # Shrink while still 16-bit, then window once on the small array;
+            # the full-size decode is freed before the small copy is windowed
+            small = downscale_blocks(np.asarray(image), budget.max_side)
+            image.close()
+            image = Image.fromarray(window_to_uint8(small), "L")
+            del small
+        elif image.mode not in ("L", "RGB"):
+            image = image.convert("RGB")
+    return _finish(image, original_size, budget, started)
+
+
+def preprocess_file(path, budget=DEFAULT_BUDGET, frame=None):
+    """Like preprocess_image, but reads from disk as it decodes and memory-maps DICOM pixel data"""
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        preamble = f.read(132)
+    if not is_dicom(preamble):
+        def read():
+            with open(path, "rb") as f:
+                return f.read()
+        # PIL pulls the compressed data from the file as it decodes, so it is never held whole
+        with Image.open(path) as image:
+            return _preprocess_pil(image, read, os.path.getsize(path), budget, started)
+
+    with metrics.timed("decode"):
+        image, original_size = _dicom_image(path, budget.max_side, frame)
+    return _finish(image, original_size, budget, started)
+
+
+def estimate_memory(source, budget=DEFAULT_BUDGET):
+    """Rough peak bytes preprocessing source (bytes or a path) needs, from its header only.
+
+    Counts the decoded pixels (after JPEG draft scaling), the numpy copy
+    16-bit images are shrunk from, the resize and the encoded result.
+    """
+    is_path = isinstance(source, (str, os.PathLike))
+    if is_path:
+        with open(source, "rb") as f:
+            dicom = is_dicom(f.read(132))
+        nbytes = os.path.getsize(source)
+    else:
+        dicom = is_dicom(source)
+        nbytes = len(source)
+    if dicom:
+        # Uncompressed pixels are mapped, not copied; compressed ones decode to a
+        # few times their stored size. Either way the file size is the right scale
+        return (1 if is_path else 2) * nbytes + budget.max_bytes
+    try:
+        with Image.open(source if is_path else io.BytesIO(source)) as image:
+            width, height = image.size
+            mode, kind = image.mode, image.format
+    except (OSError, ValueError):
+        return nbytes + budget.max_bytes
+    pixels = width * height
+    if kind == "JPEG":
+        target = _target_size((width, height), budget)
+        scale = 1
+        while scale < 8 and width // (scale * 2) >= target[0] and height // (scale * 2) >= target[1]:
+            scale *= 2
+        pixels //= scale * scale
+    decoded = pixels * MODE_BYTES.get(mode, 4)
+    if mode in DEEP_MODES:
+        decoded *= 2
+    # The encoded original stays in memory next to its decode, resizing adds a quarter
+    return nbytes + decoded + decoded // 4 + budget.max_bytes
+
+
+def _target_size(size, budget):
+    scale = min(1.0, budget.max_side / max(size))
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def _finish(image, original_size, budget, started):
+    """Resize an 8-bit L/RGB image to budget and encode it"""
+    target = _target_size(original_size, budget)
+    with metrics.timed("resize"):
+        if image.size != target:
+            resized = image.resize(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            # Free the full-size decode now rather than when the caller returns
+            image.close()
+            image = resized
+        if image.mode == "RGB" and is_grayscale(image):
+            image = image.convert("L")
+
+    with metrics.timed("jpeg_encode"):
+        data = _encode_jpeg(image, budget.max_bytes)
+    return Preprocessed(
+        image, data, Base64Data(data), "image/jpeg", False,
+        original_size, image.size, time.perf_counter() - started,
+    )
+
+
+def describe(prepared):
+    """One-line payload summary for the UI"""
+    kind = "original" if prepared.passthrough else prepared.mime.split("/")[1].upper()
+    mode = "gray" if prepared.image.mode == "L" else prepared.image.mode
+    line = f"{len(prepared.data) / 1024:.0f} KB {kind}, {mode}"
+    if prepared.size != prepared.original_size:
+        line += f", {prepared.original_size[0]}×{prepared.original_size[1]} → {prepared.size[0]}×{prepared.size[1]}"
+    return f"{line}, prepared in {prepared.seconds * 1000:.0f} ms"
@@ -0,0 +1,212 @@
+"""In-process job queue that keeps analyses running across Streamlit reruns.
+
+Work is submitted once and gets a job ID. Preprocessing and inference run
+on the queue's own thread pools, so a rerun, a reload or a dropped
+websocket only stops the script that was watching; the next run looks the
+jobs up again by ID and picks up their progress.
+"""
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import metrics
+from .imaging import describe
+
+# How far back utilization and wait-time figures look
+STATS_WINDOW = 300.0
+
+
+class Job:
+    """One image's trip through the queue; read by the UI, written by workers"""
+
+    def __init__(self, name, data, key, options):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.key = key
+        self.options = options
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.image = None
+        self.summary = None
+        self.prepared = None
+        self.text = None
+        self.error = None
+        # memory.Reservation held from preprocessing until the request is done
+        self.reservation = None
+        self._data = data
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    @property
+    def live_text(self):
+        """Text streamed so far while the job is running"""
+        prepared = self.prepared
+        return "".join(prepared.live) if prepared is not None else ""
+
+    @property
+    def wait_seconds(self):
+        """Time from submission until a worker picked the job up"""
+        if self.started is None:
+            return time.time() - self.submitted
+        return self.started - self.submitted
+
+
+class JobQueue:
+    """Preprocess and analyze submitted images on background worker pools.
+
+    prepare(data) runs on preprocess_workers threads and analyze(prepared,
+    **options) on workers threads, which also caps concurrent model
+    requests for the whole process. Submitting a key that is already
+    queued, running or recently finished returns the existing job, so
+    reruns and reloads never start the same analysis twice. Finished jobs
+    are forgotten after retention seconds.
+
+    With a memory.MemoryBudget (one per session, say) a job is only
+    prepared once its estimated cost fits; until then it stays queued.
+    """
+
+    def __init__(self, prepare, analyze, workers=2, preprocess_workers=4,
+                 retention=3600.0, max_jobs=1000):
+        self.prepare = prepare
+        self.analyze = analyze
+        self.workers = workers
+        self.retention = retention
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+        self._busy = {}
+        self._intervals = deque(maxlen=4096)
+        self._waits = deque(maxlen=1024)
+        self.counts = {"submitted": 0, "done": 0, "failed": 0, "deduplicated": 0}
+        self.created = time.time()
+        self._prep_pool = ThreadPoolExecutor(max_workers=max(1, preprocess_workers),
+                                             thread_name_prefix="medai-prep")
+        self._infer_pool = ThreadPoolExecutor(max_workers=max(1, workers),
+                                              thread_name_prefix="medai-job")
+        metrics.register("job_queue", {}, lambda: {
+            key: value for key, value in self.stats().items() if value is not None
+        })
+
+    def submit(self, name, data, key=None, memory=None, cost=0, **options):
+        """Queue data for analysis and return its job ID; memory and cost bound its preprocessing"""
+        with self._lock:
+            self._forget_old()
+            if key is not None and key in self._by_key:
+                existing = self._jobs.get(self._by_key[key])
+                if existing is not None and existing.status != "failed":
+                    self.counts["deduplicated"] += 1
+                    return existing.id
+            job = Job(name, data, key, options)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._by_key[key] = job.id
+            self.counts["submitted"] += 1
+        if memory is None:
+            self._prep_pool.submit(self._prepare, job)
+        else:
+            memory.reserve(cost, lambda reservation: self._admit(job, reservation))
+        return job.id
+
+    def _admit(self, job, reservation):
+        job.reservation = reservation
+        self._prep_pool.submit(self._prepare, job)
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _prepare(self, job):
+        job.status = "preparing"
+        try:
+            job.prepared = self.prepare(job._data)
+            job.image = job.prepared.image
+            payload = job.prepared.payload
+            # A study carries one payload per view
+            job.summary = " · ".join(map(describe, payload)) if isinstance(payload, list) else describe(payload)
+            if job.reservation is not None:
+                # Only the encoded images stay in memory until the request is sent
+                payloads = payload if isinstance(payload, list) else [payload]
+                job.reservation.shrink(sum(len(view.data) for view in payloads))
+        except Exception as e:
+            self._finish(job, error=e)
+            return
+        finally:
+            job._data = None
+        job.status = "waiting"
+        self._infer_pool.submit(self._analyze, job)
+
+    def _analyze(self, job):
+        job.started = time.time()
+        job.status = "running"
+        with self._lock:
+            self._busy[job.id] = job.started
+            self._waits.append((job.started, job.wait_seconds))
+        metrics.observe("queue_wait", job.wait_seconds)
+        try:
+            text = self.analyze(job.prepared, **job.options)
+        except Exception as e:
+            self._finish(job, error=e)
+        else:
+            self._finish(job, text=text)
+
+    def _finish(self, job, text=None, error=None):
+        job.finished = time.time()
+        job.text = text
+        job.error = error
+        job.status = "failed" if error is not None else "done"
+        with self._lock:
+            started = self._busy.pop(job.id, None)
+            if started is not None:
+                self._intervals.append((started, job.finished))
+            self.counts[job.status] += 1
+        # Keep what the UI shows (image, stats), not the encoded payload
+        if job.prepared is not None:
+            job.prepared = job.prepared._replace(img_b64=None, payload=None)
+        if job.reservation is not None:
+            job.reservation.release()
+
+    def _forget_old(self):
+        """Drop finished jobs past retention, oldest first beyond max_jobs"""
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.done]
+        finished.sort(key=lambda job: job.finished)
+        excess = len(self._jobs) - self.max_jobs
+        for job in finished:
+            if now - job.finished < self.retention and excess <= 0:
+                break
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) == job.id:
+                del self._by_key[job.key]
+            excess -= 1
+
+    def stats(self):
+        """Queue depth, recent wait times and worker utilization"""
+        now = time.time()
+        window = max(1e-6, min(STATS_WINDOW, now - self.created))
+        since = now - window
+        with self._lock:
+            jobs = list(self._jobs.values())
+            busy_starts = list(self._busy.values())
+            intervals = [(start, end) for start, end in self._intervals if end > since]
+            waits = sorted(wait for started, wait in self._waits if started > since)
+        busy_seconds = sum(end - max(start, since) for start, end in intervals)
+        busy_seconds += sum(now - max(start, since) for start in busy_starts)
+        return {
+            "queued": sum(job.status in ("queued", "preparing", "waiting") for job in jobs),
+            "running": len(busy_starts),
+            "workers": self.workers,
+            "utilization": min(1.0, busy_seconds / (self.workers * window)),
+            "wait_p50_seconds": waits[len(waits) // 2] if waits else None,
+            "wait_max_seconds": waits[-1] if waits else None,
+            **self.counts,
+        }
+
+    def shutdown(self, wait=True):
+        self._prep_pool.shutdown(wait=wait)
+        self._infer_pool.shutdown(wait=wait)
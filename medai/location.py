@@ -0,0 +1,84 @@
+"""Where the user is, for the specialist advice in reports, without holding up the page.
+
+The location comes from MEDAI_LOCATION when set. Otherwise an IP lookup
+runs in a background thread with a short timeout, and the machine's time
+zone is used when that fails. On air-gapped hosts set MEDAI_LOCATION, or
+set MEDAI_LOCATION_LOOKUP=0 to skip the network entirely.
+"""
+import os
+import threading
+
+import requests
+
+LOOKUP_URL = "https://ipinfo.io/json"
+# Connect and read timeouts: a missing route should fail in seconds, not minutes
+LOOKUP_TIMEOUT = (1.5, 2.0)
+UNKNOWN_LOCATION = "Unknown Location"
+
+
+def configured_location(environ=os.environ):
+    return environ.get("MEDAI_LOCATION", "").strip() or None
+
+
+def lookup_location(timeout=LOOKUP_TIMEOUT):
+    """'City, Region' from an IP geolocation service, or None"""
+    try:
+        response = requests.get(LOOKUP_URL, timeout=timeout)
+        response.raise_for_status()
+        geo = response.json()
+    except (requests.RequestException, ValueError):
+        return None
+    parts = [geo.get("city"), geo.get("region")]
+    return ", ".join(part for part in parts if part) or None
+
+
+def timezone_location(environ=os.environ):
+    """Offline guess from the IANA time zone name, e.g. 'Europe/Berlin' -> 'Berlin, Europe'"""
+    name = environ.get("TZ", "").lstrip(":")
+    if "/" not in name:
+        try:
+            with open("/etc/timezone") as f:
+                name = f.read().strip()
+        except OSError:
+            link = os.path.realpath("/etc/localtime")
+            name = link.split("zoneinfo/", 1)[1] if "zoneinfo/" in link else ""
+    area, _, city = name.partition("/")
+    if not city or area in ("Etc", "UTC", "GMT"):
+        return None
+    return f"{city.rsplit('/', 1)[-1].replace('_', ' ')}, {area}"
+
+
+class LocationResolver:
+    """Resolve the location once, in the background; get() never waits longer than asked"""
+
+    def __init__(self, environ=os.environ):
+        self.environ = environ
+        self.location = configured_location(environ)
+        self.source = "config" if self.location else None
+        self._done = threading.Event()
+        if self.location:
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def start(self):
+        if not self.ready:
+            threading.Thread(target=self._resolve, name="medai-location", daemon=True).start()
+        return self
+
+    def _resolve(self):
+        if self.environ.get("MEDAI_LOCATION_LOOKUP", "1") != "0":
+            self.location = lookup_location()
+            self.source = "lookup" if self.location else None
+        if self.location is None:
+            self.location = timezone_location(self.environ)
+            self.source = "timezone" if self.location else None
+        self._done.set()
+
+    def get(self, wait=0.0):
+        """The location, UNKNOWN_LOCATION if none was found, or None while still resolving"""
+        if not self._done.wait(wait):
+            return None
+        return self.location or UNKNOWN_LOCATION
@@ -0,0 +1,243 @@
+"""Keep memory bounded while large uploads are decoded, encoded and sent.
+
+MemoryBudget admits work against a byte limit and queues what does not
+fit, so a batch of large radiographs waits its turn instead of getting the
+Streamlit worker OOM-killed. Base64Data and JSONBody let request bodies be
+produced while they are sent: the base64 text of an image is encoded a
+chunk at a time from its JPEG bytes, so neither it nor the serialized JSON
+ever exists as a whole.
+"""
+import base64
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from . import metrics
+
+# Bytes of raw data per base64 chunk (a multiple of 3, so chunks concatenate)
+CHUNK_SIZE = 3 * 16 * 1024
+# Per-session cap in the Ollama app unless MEDAI_SESSION_MEMORY_MB says otherwise
+DEFAULT_SESSION_MEMORY_MB = 1024
+
+
+def limit_from_env(name="MEDAI_SESSION_MEMORY_MB", default=DEFAULT_SESSION_MEMORY_MB, environ=os.environ):
+    """Byte limit from a megabyte setting; 0 or less means no limit (None)"""
+    megabytes = float(environ.get(name, "").strip() or default)
+    return int(megabytes * 1024 * 1024) if megabytes > 0 else None
+
+
+def rss_bytes():
+    """Resident set size of this process, or None where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Reservation:
+    """Bytes held in a MemoryBudget by one piece of work"""
+
+    def __init__(self, budget, nbytes, on_admit=None):
+        self.budget = budget
+        self.nbytes = nbytes
+        self.on_admit = on_admit
+        self.admitted = False
+        self.decoding = True
+        self.released = False
+
+    def shrink(self, nbytes):
+        """Decoding is over: keep only nbytes (e.g. the encoded payload) until release()"""
+        self.budget._shrink(self, nbytes)
+
+    def release(self):
+        self.budget._release(self)
+
+
+class MemoryBudget:
+    """Admit work against a byte limit, first come first served.
+
+    reserve(nbytes, on_admit) calls on_admit(reservation) once the bytes fit:
+    right away, or later on the thread whose release() made room. Work
+    larger than the whole limit is admitted once nothing else is held, so
+    it runs alone rather than never. max_decoding caps how many admitted
+    reservations may still be decoding (1 prepares one image at a time).
+    """
+
+    def __init__(self, limit=None, max_decoding=None):
+        self.limit = limit
+        self._max_decoding = max_decoding
+        self.in_use = 0
+        self.peak = 0
+        self.decoding = 0
+        self._waiting = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self):
+        return len(self._waiting)
+
+    @property
+    def max_decoding(self):
+        return self._max_decoding
+
+    @max_decoding.setter
+    def max_decoding(self, value):
+        # Raising the cap can admit work that was waiting for it
+        with self._lock:
+            self._max_decoding = value
+            admitted = self._admit()
+        self._notify(admitted)
+
+    def reserve(self, nbytes, on_admit=None):
+        reservation = Reservation(self, max(0, int(nbytes)), on_admit)
+        with self._lock:
+            self._waiting.append(reservation)
+            admitted = self._admit()
+        self._notify(admitted)
+        return reservation
+
+    def try_reserve(self, nbytes):
+        """An admitted Reservation if nbytes fit now (and nobody is waiting), else None"""
+        reservation = Reservation(self, max(0, int(nbytes)))
+        with self._lock:
+            if self._waiting or not self._fits(reservation):
+                return None
+            self._take(reservation)
+        return reservation
+
+    def _fits(self, reservation):
+        if self._max_decoding is not None and self.decoding >= self._max_decoding:
+            return False
+        return self.limit is None or self.in_use == 0 or self.in_use + reservation.nbytes <= self.limit
+
+    def _take(self, reservation):
+        reservation.admitted = True
+        self.in_use += reservation.nbytes
+        self.decoding += 1
+        self.peak = max(self.peak, self.in_use)
+
+    def _admit(self):
+        """Admit waiting reservations in order while they fit; call with the lock held"""
+        admitted = []
+        while self._waiting and self._fits(self._waiting[0]):
+            reservation = self._waiting.popleft()
+            self._take(reservation)
+            admitted.append(reservation)
+        return admitted
+
+    def _notify(self, admitted):
+        # Outside the lock: callbacks may reserve or release themselves
+        for reservation in admitted:
+            if reservation.on_admit is not None:
+                reservation.on_admit(reservation)
+
+    def _shrink(self, reservation, nbytes):
+        with self._lock:
+            if reservation.released or not reservation.admitted:
+                return
+            nbytes = max(0, min(int(nbytes), reservation.nbytes))
+            self.in_use -= reservation.nbytes - nbytes
+            reservation.nbytes = nbytes
+            if reservation.decoding:
+                reservation.decoding = False
+                self.decoding -= 1
+            admitted = self._admit()
+        self._notify(admitted)
+
+    def _release(self, reservation):
+        with self._lock:
+            if reservation.released:
+                return
+            reservation.released = True
+            if not reservation.admitted:
+                # Given up before it ran
+                self._waiting.remove(reservation)
+                return
+            self.in_use -= reservation.nbytes
+            if reservation.decoding:
+                reservation.decoding = False
+                self.decoding -= 1
+            admitted = self._admit()
+        self._notify(admitted)
+
+    def stats(self):
+        with self._lock:
+            return {"limit": self.limit, "in_use": self.in_use, "peak": self.peak,
+                    "decoding": self.decoding, "waiting": len(self._waiting)}
+
+
+class Base64Data:
+    """The base64 text of some bytes, produced only when it is sent.
+
+    str() gives the whole text; chunks() yields it piece by piece as
+    ASCII bytes. prefix is put in front, e.g. "data:image/jpeg;base64,".
+    """
+
+    __slots__ = ("data", "prefix")
+
+    def __init__(self, data, prefix=""):
+        self.data = data
+        self.prefix = prefix
+
+    def __len__(self):
+        return len(self.prefix) + (len(self.data) + 2) // 3 * 4
+
+    def __str__(self):
+        return self.prefix + base64.b64encode(self.data).decode()
+
+    def chunks(self, size=CHUNK_SIZE):
+        if self.prefix:
+            yield self.prefix.encode()
+        view = memoryview(self.data)
+        if not metrics.is_enabled():
+            for start in range(0, len(view), size):
+                yield base64.b64encode(view[start:start + size])
+            return
+        # The "base64" stage is the encoding alone, not the sending in between chunks
+        seconds = 0.0
+        for start in range(0, len(view), size):
+            started = time.perf_counter()
+            chunk = base64.b64encode(view[start:start + size])
+            seconds += time.perf_counter() - started
+            yield chunk
+        metrics.observe("base64", seconds)
+
+
+class JSONBody:
+    """A JSON request body serialized while it is sent.
+
+    Base64Data values anywhere in obj are streamed from their raw bytes;
+    everything else is serialized up front, which is small. The length is
+    known in advance, so requests sends a Content-Length rather than a
+    chunked body, and iterating again (on a retry) starts over.
+    """
+
+    def __init__(self, obj):
+        self._blobs = []
+        marker = "\x00blob\x00"
+
+        def default(value):
+            if isinstance(value, Base64Data):
+                self._blobs.append(value)
+                return marker
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+        # Same output as requests' json=: ASCII, no NaN; the marker comes out as "\u0000blob\u0000"
+        text = json.dumps(obj, default=default, allow_nan=False)
+        self._parts = [part.encode() for part in text.split(json.dumps(marker)[1:-1])]
+        self._length = sum(map(len, self._parts)) + sum(map(len, self._blobs))
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        yield self._parts[0]
+        for blob, part in zip(self._blobs, self._parts[1:]):
+            yield from blob.chunks()
+            yield part
+
+    def __bytes__(self):
+        return b"".join(self)
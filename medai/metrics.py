@@ -0,0 +1,215 @@
+"""Per-stage timers and counters with a Prometheus text export.
+
+Metrics are process-wide and off unless MEDAI_METRICS is set or enable()
+is called. While off, timed() hands back a shared no-op context manager
+and observe()/inc() return after one flag check, so instrumented code
+costs next to nothing.
+"""
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds, from JPEG encodes to slow generations
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Recent samples kept per stage for the percentiles in the diagnostics panel
+RECENT_SAMPLES = 256
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Stage:
+    """Histogram of one stage's durations plus a window of recent samples"""
+
+    __slots__ = ("buckets", "count", "total", "recent")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+
+class _Timer:
+    __slots__ = ("registry", "stage", "started")
+
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.stage, time.perf_counter() - self.started)
+        if exc_type is not None:
+            self.registry.inc(f"{self.stage}_errors")
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+
+class Registry:
+    """Stage histograms, counters and gauge collectors for one process"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._collectors = {}
+
+    def timed(self, stage):
+        """Context manager recording the duration of a stage"""
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, stage)
+
+    def observe(self, stage, seconds):
+        if not self.enabled or seconds is None:
+            return
+        with self._lock:
+            record = self._stages.get(stage)
+            if record is None:
+                record = self._stages[stage] = _Stage()
+            record.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+            record.count += 1
+            record.total += seconds
+            record.recent.append(seconds)
+
+    def inc(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def register(self, name, labels, collect):
+        """Export collect()'s {metric: value} dict as medai_<name>_<metric> gauges"""
+        with self._lock:
+            self._collectors[(name, tuple(sorted(labels.items())))] = collect
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """Plain-dict view for the diagnostics panel and JSON output"""
+        with self._lock:
+            stages = {name: (record.count, record.total, sorted(record.recent))
+                      for name, record in self._stages.items()}
+            counters = dict(self._counters)
+        return {
+            "stages": {
+                name: {
+                    "count": count,
+                    "total_seconds": total,
+                    "mean_seconds": total / count,
+                    "p50_seconds": _percentile(recent, 0.50),
+                    "p95_seconds": _percentile(recent, 0.95),
+                    "max_seconds": recent[-1],
+                }
+                for name, (count, total, recent) in stages.items()
+            },
+            "counters": counters,
+        }
+
+    def to_prometheus(self):
+        """Render everything in the Prometheus text exposition format"""
+        with self._lock:
+            stages = {name: (list(record.buckets), record.count, record.total)
+                      for name, record in self._stages.items()}
+            counters = dict(self._counters)
+            collectors = dict(self._collectors)
+
+        lines = [
+            "# HELP medai_stage_seconds Time spent in each analysis pipeline stage.",
+            "# TYPE medai_stage_seconds histogram",
+        ]
+        for name in sorted(stages):
+            buckets, count, total = stages[name]
+            cumulative = 0
+            for bound, hits in zip(BUCKETS + ("+Inf",), buckets):
+                cumulative += hits
+                lines.append(f'medai_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'medai_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'medai_stage_seconds_count{{stage="{name}"}} {count}')
+
+        for name in sorted(counters):
+            lines.append(f"# TYPE medai_{name}_total counter")
+            lines.append(f"medai_{name}_total {counters[name]}")
+
+        for (name, labels), collect in sorted(collectors.items(), key=lambda item: item[0]):
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for metric, value in sorted(values.items()):
+                lines.append(f"medai_{name}_{metric}{_labels(dict(labels))} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry(enabled=os.environ.get("MEDAI_METRICS", "") not in ("", "0"))
+
+timed = REGISTRY.timed
+observe = REGISTRY.observe
+inc = REGISTRY.inc
+register = REGISTRY.register
+snapshot = REGISTRY.snapshot
+to_prometheus = REGISTRY.to_prometheus
+
+
+def enable(on=True):
+    REGISTRY.enabled = on
+
+
+def is_enabled():
+    return REGISTRY.enabled
+
+
+def serve(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve /metrics for Prometheus on a daemon thread; returns the server"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
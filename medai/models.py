@@ -0,0 +1,110 @@
+"""Keep the Ollama model loaded, tuned and warmed between analyses.
+
+Ollama unloads an idle model after five minutes and reloads it whenever
+options such as num_ctx change, so the first request after a pause or a
+differently tuned request pays for loading the weights again. ModelManager
+sends every request with the same keep_alive and options, and pre-warms
+the model (and the constant report instructions, whose evaluated prefix
+Ollama can then reuse) before the first upload arrives.
+"""
+import os
+import threading
+import time
+
+from . import metrics
+from .analysis import OLLAMA_MODEL
+from .client import get_client
+from .prompts import REPORT_PROMPT, REPORT_REQUEST, ollama_payload
+
+OLLAMA_URL = "http://localhost:11434"
+# How long Ollama keeps the model after a request: a duration ("30m"),
+# seconds, or -1 to keep it loaded until the server stops
+KEEP_ALIVE = "30m"
+# Ollama options that can be tuned with MEDAI_NUM_CTX, MEDAI_NUM_PREDICT, MEDAI_NUM_THREAD
+TUNABLE_OPTIONS = ("num_ctx", "num_predict", "num_thread")
+
+
+def parse_keep_alive(value):
+    """Seconds as a number, anything else (e.g. '30m') as Ollama's duration string"""
+    value = str(value).strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def options_from_env(environ=os.environ):
+    """Ollama options set through MEDAI_NUM_CTX, MEDAI_NUM_PREDICT and MEDAI_NUM_THREAD"""
+    options = {}
+    for name in TUNABLE_OPTIONS:
+        value = environ.get(f"MEDAI_{name.upper()}", "").strip()
+        if value:
+            options[name] = int(value)
+    return options
+
+
+class ModelManager:
+    """One Ollama model on one server: request bodies, keep-alive and warm-up.
+
+    payload() builds every generate request with the manager's keep_alive
+    and options; prewarm() loads the model with those same options in the
+    background, since different ones would make Ollama reload it for the
+    first real request anyway.
+    """
+
+    def __init__(self, model=OLLAMA_MODEL, url=OLLAMA_URL, keep_alive=KEEP_ALIVE,
+                 options=None, client=None):
+        self.model = model
+        self.url = url.rstrip("/")
+        self.api = self.url + "/api/generate"
+        self.keep_alive = keep_alive
+        self.options = dict(options or {})
+        self.client = client or get_client("ollama")
+        self.warm_seconds = None
+        self.load_seconds = None
+        self.error = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def payload(self, image_b64, prompt=REPORT_PROMPT, request=REPORT_REQUEST):
+        return ollama_payload(self.model, image_b64, prompt, self.keep_alive, self.options, request)
+
+    @property
+    def warming(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def prewarm(self, prompt=REPORT_PROMPT, wait=False):
+        """Load the model and evaluate prompt in a background thread, once"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._prewarm, args=(prompt,),
+                                                name="medai-prewarm", daemon=True)
+                self._thread.start()
+        if wait:
+            self._thread.join()
+        return self
+
+    def _prewarm(self, prompt):
+        # One token is enough to load the weights and cache the instructions
+        body = ollama_payload(self.model, None, prompt, self.keep_alive,
+                              dict(self.options, num_predict=1))
+        started = time.perf_counter()
+        try:
+            response = self.client.post(self.api, json=dict(body, stream=False))
+            response.raise_for_status()
+            timings = response.json()
+        except Exception as e:
+            # The first analysis will load the model itself and report the real error
+            self.error = str(e)
+            return
+        self.warm_seconds = time.perf_counter() - started
+        self.error = None
+        if timings.get("load_duration"):
+            self.load_seconds = timings["load_duration"] / 1e9
+        metrics.observe("model_prewarm", self.warm_seconds)
+
+
+def manager_from_env(model=OLLAMA_MODEL, url=OLLAMA_URL, environ=os.environ, client=None):
+    """ModelManager with MEDAI_KEEP_ALIVE and the MEDAI_NUM_* options"""
+    keep_alive = parse_keep_alive(environ.get("MEDAI_KEEP_ALIVE", KEEP_ALIVE))
+    return ModelManager(model, url, keep_alive, options_from_env(environ), client)
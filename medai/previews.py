@@ -0,0 +1,71 @@
+"""Small JPEG previews of uploads, made once per content hash and shared by every rerun.
+
+st.image re-encodes a PIL image on every call (as a quality-100 JPEG), so
+each rerun re-sent every upload's pixels. Encoded JPEG bytes that already
+fit the display width pass straight through instead, under a
+content-addressed media URL the browser has cached from the last run.
+Streamlit transcodes any other format to JPEG, so previews are JPEG rather
+than WebP.
+"""
+import io
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+THUMBNAIL_SIDE = 320
+THUMBNAIL_QUALITY = 80
+# The click-to-expand view shows the prepared image at its own size
+FULL_VIEW_QUALITY = 90
+
+
+def encode_preview(image, max_side=None, quality=THUMBNAIL_QUALITY):
+    """JPEG bytes of image, shrunk so its longest side is at most max_side"""
+    if max_side and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+class PreviewCache:
+    """LRU of encoded previews keyed by upload content, bounded by total bytes"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def thumbnail(self, key, image):
+        return self._get((key, "thumbnail"), lambda: encode_preview(image, THUMBNAIL_SIDE, THUMBNAIL_QUALITY))
+
+    def full_view(self, key, image):
+        return self._get((key, "full"), lambda: encode_preview(image, None, FULL_VIEW_QUALITY))
+
+    def _get(self, key, make):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key]
+            self.stats["misses"] += 1
+        # Encoded outside the lock; two sessions racing on one upload both get valid bytes
+        data = make()
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = data
+                self._size += len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.stats["evictions"] += 1
+        return data
@@ -0,0 +1,117 @@
+"""Prompt templates and request bodies shared by both apps, the CLI and the router.
+
+Instructions go first and never change between images, as the system
+prompt for Ollama and LM Studio alike, so a backend that caches evaluated
+prompt prefixes only has to process the image and a short request per call.
+"""
+from .memory import Base64Data
+
+# Report instructions for LLaVA, sent as the Ollama system prompt
+REPORT_PROMPT = """
+You are a medical imaging assistant. Analyze this X-ray and generate a clinical report with:
+
+**Medical Analysis:**  
+<Your findings>
+
+**Suggested Treatment Plan:**  
+<Recommendations>
+
+**Possible Medications:**  
+<Generic drug names>
+
+**Emotional Healing Message:**  
+<Empathetic encouragement>
+
+in bullet points word wrapped.
+
+Use confident, medical language and respond only based on the image.
+"""
+
+# System and user prompts app.py sends to MedGemma through LM Studio
+SYSTEM_PROMPT = """
+You are a highly capable and specialized medical imaging assistant trained on radiological data, anatomy, and clinical decision-making. Your task is to analyze medical images, particularly X-rays, and provide a precise, confident response.
+
+When an X-ray image is uploaded:
+1. Carefully inspect the image and identify relevant anatomical features, injuries, or abnormalities such as fractures, dislocations, calcifications, or soft tissue anomalies.
+2. Based strictly on the image, generate a clear, clinical interpretation in confident medical language.
+3. Suggest a possible treatment plan based on your findings. This may include conservative options, surgical recommendations, medications, or supportive care.
+4. List any generic medications that may be typically prescribed in such conditions.
+5. Include a concise, empathetic message to emotionally support the user — without downplaying the situation or deferring unnecessarily to human practitioners.
+6. Never state that you are not a doctor or that an in-person consultation is required — unless the image is unreadable or missing.
+
+Format your response as follows:
+
+**🩻 Medical Analysis:**  
+<Your confident X-ray interpretation>
+
+**🩺 Suggested Treatment Plan:**  
+<Treatment course including clinical advice>
+
+**💊 Possible Medications:**  
+<Generic medication names or supportive agents>
+
+**💙 Emotional Healing Message:**  
+<A compassionate message encouraging recovery and emotional strength>
+"""
+
+USER_PROMPT = "Please analyze the uploaded X-ray and provide a medical interpretation, treatment plan, medications, and emotional healing message."
+
+# The per-image turn that follows REPORT_PROMPT
+REPORT_REQUEST = "Here is the X-ray. Write the report."
+# The turn for several views of one study sent together
+STUDY_REQUEST = (
+    "Here are {count} views of the same X-ray study ({views}). "
+    "Write one combined report that considers all views together."
+)
+STUDY_USER_PROMPT = (
+    "Please analyze these {count} views of one X-ray study ({views}) together and provide a single "
+    "medical interpretation, treatment plan, medications, and emotional healing message."
+)
+
+
+def study_request(views, template=STUDY_REQUEST):
+    """Per-study turn naming the views, in the order their images are attached"""
+    return template.format(count=len(views), views=", ".join(views))
+
+
+def prompt_key(prompt=REPORT_PROMPT, request=REPORT_REQUEST):
+    """Everything the model is told besides the images, as hashed into cache keys"""
+    return prompt + "\x00" + request
+
+
+def ollama_payload(model, image_b64, prompt=REPORT_PROMPT, keep_alive=None, options=None,
+                   request=REPORT_REQUEST):
+    """Ollama /api/generate body for one base64 image or a list of them.
+
+    image_b64=None only evaluates the instructions.
+    """
+    payload = {
+        "model": model,
+        "system": prompt,
+        "prompt": request,
+    }
+    if image_b64 is not None:
+        payload["images"] = image_b64 if isinstance(image_b64, list) else [image_b64]
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    if options:
+        payload["options"] = options
+    return payload
+
+
+def chat_payload(prepared, model, system_prompt=SYSTEM_PROMPT, user_prompt=USER_PROMPT):
+    """OpenAI-style chat request for LM Studio carrying one or more imaging.Preprocessed images"""
+    images = prepared if isinstance(prepared, list) else [prepared]
+    return {
+        "model": model,
+        "messages": [
+            { "role": "system", "content": system_prompt },
+            { "role": "user", "content": [{ "type": "text", "text": user_prompt }] + [
+                { "type": "image_url", "image_url": { "url": Base64Data(image.data, f"data:{image.mime};base64,") } }
+                for image in images
+            ]}
+        ],
+        "temperature": 0.7,
+        "max_tokens": 1024,
+        "stream": False
+    }
@@ -0,0 +1,564 @@
+import copy
+import io
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from fontTools import ttLib
+from fpdf import FPDF
+
+from . import metrics
+from .sections import clean_text, parse_report
+
+logger = logging.getLogger(__name__)
+
+# Fonts and the hospital logo ship next to the Streamlit apps
+ASSETS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Last-resort character filter when the font still rejects a cell
+FALLBACK_RE = re.compile(r'[^\w\s\-.,;:()!?]')
+
+class SafePDF(FPDF):
+    """Custom PDF class with better error handling"""
+    
+    def __init__(self):
+        super().__init__()
+        self.set_auto_page_break(auto=True, margin=15)
+        self.set_margins(20, 20, 20)  # Left, Top, Right margins
+        self.font_styles = {
+            'regular': '',
+            'bold': 'B',
+            'italic': 'I',
+            'bold_italic': 'BI'
+        }
+        
+    def safe_cell(self, w, h, txt='', border=0, ln=0, align='', fill=False, style='regular', clean=True):
+        """Safe cell method with text cleaning and style support"""
+        # Clean text and handle encoding (parsed reports arrive already cleaned)
+        clean_txt = self.clean_text(txt) if clean else txt
+        
+        # Set font style
+        current_font = self.font_family
+        self.set_font(current_font, self.font_styles.get(style, ''), self.font_size_pt)
+        
+        try:
+            self.cell(w, h, clean_txt, border, ln, align, fill)
+        except Exception as e:
+            # Fallback: use simplified text
+            fallback_txt = FALLBACK_RE.sub('', clean_txt)[:50]
+            self.cell(w, h, fallback_txt, border, ln, align, fill)
+    
+    def safe_multi_cell(self, w, h, txt, border=0, align='L', fill=False, style='regular', clean=True):
+        """Safe multi_cell method with better text handling and style support"""
+        # Clean and prepare text
+        clean_txt = self.clean_text(txt) if clean else txt
+        if not clean_txt.strip():
+            return
+        
+        # Set font style
+        current_font = self.font_family
+        self.set_font(current_font, self.font_styles.get(style, ''), self.font_size_pt)
+        
+        # Use proper text wrapping with multi_cell
+        try:
+            self.multi_cell(w, h, clean_txt, border, align, fill)
+        except Exception as e:
+            # Fallback: split text manually
+            lines = clean_txt.split('\n')
+            for line in lines:
+                if line.strip():
+                    try:
+                        self.multi_cell(w, h, line.strip(), border, align, fill)
+                    except:
+                        # Last resort: truncate and continue
+                        self.multi_cell(w, h, line[:100] + "...", border, align, fill)
+                    
+    def add_logo(self, logo_path, x=None, y=None, w=50, h=50):
+        """Add hospital logo to PDF"""
+        try:
+            if os.path.exists(logo_path):
+                # Center the logo if x,y not provided
+                if x is None:
+                    x = (self.w - w) / 2
+                if y is None:
+                    y = 30
+                
+                self.image(logo_path, x, y, w, h)
+                return True
+            else:
+                # Create a simple text logo if image not found
+                self.set_font('Arial', 'B', 20)
+                self.safe_cell(0, 10, "🏥 MEDICAL CENTER", ln=True, align='C', style='bold')
+                return False
+        except Exception as e:
+            # Fallback to text logo
+            self.set_font('Arial', 'B', 20)
+            self.safe_cell(0, 10, "🏥 MEDICAL CENTER", ln=True, align='C', style='bold')
+            return False
+    
+    def clean_text(self, text):
+        """Clean text for PDF compatibility"""
+        return clean_text(text)
+
+    def write_report(self, parsed):
+        """Lay out a sections.ParsedReport: dark blue headers, body paragraphs"""
+        for section in parsed.sections:
+            if section.title is not None:
+                # Output header in dark blue and bold
+                self.set_font_size(12)
+                self.set_text_color(0, 51, 102)  # Dark blue color
+                self.safe_cell(0, 8, section.title, ln=True, style='bold', clean=False)
+                self.set_text_color(0, 0, 0)  # Reset to black
+                self.ln(2)
+
+            for paragraph in section.paragraphs:
+                self.set_font_size(10)
+                self.safe_multi_cell(0, 5, paragraph.text, style='regular', clean=False)
+                # A little more space between blank-line separated blocks
+                self.ln(4 if paragraph.ends_block else 3)
+
+FONT_FAMILY = "CustomFont"
+
+# Reports per chunk laid out by one worker process in parallel mode. Each
+# chunk subsets its fonts again (about 0.2 s), so chunks stay large; the size
+# is fixed rather than derived from the worker count, so the same reports
+# give the same document on any machine
+PAGES_PER_CHUNK = 50
+# Below this a process pool costs more than it saves
+PARALLEL_MIN_REPORTS = 2 * PAGES_PER_CHUNK
+
+# Parsed fonts are shared by every report built in this process, see _install_fonts
+_font_templates = None
+_font_lock = threading.Lock()
+
+
+def _find_fonts():
+    """Return {style: font path} for the first usable font, or None"""
+    # Try common font paths
+    font_paths = [
+        os.path.join(ASSETS_DIR, "DejaVuSans.ttf"),
+        "/System/Library/Fonts/Helvetica.ttc",  # macOS
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux
+        "C:/Windows/Fonts/arial.ttf"  # Windows
+    ]
+    for font_path in font_paths:
+        if os.path.exists(font_path):
+            # Use the real bold face when it ships alongside the regular one
+            bold_path = font_path.replace("DejaVuSans.ttf", "DejaVuSans-Bold.ttf")
+            if not os.path.exists(bold_path):
+                bold_path = font_path
+            return {"": font_path, "B": bold_path, "I": font_path, "BI": bold_path}
+    return None
+
+
+def _load_font_templates():
+    """Parse the report fonts once per process"""
+    global _font_templates
+    with _font_lock:
+        if _font_templates is None:
+            templates = {}
+            try:
+                styles = _find_fonts()
+                if styles:
+                    loader = FPDF()
+                    for style, path in styles.items():
+                        loader.add_font(FONT_FAMILY, style, path)
+                    templates = dict(loader.fonts)
+            except Exception as e:
+                logger.warning("Font loading issue: %s. Using default font.", e)
+                templates = {}
+            _font_templates = templates
+    return _font_templates
+
+
+def preload():
+    """Parse the report fonts ahead of the first PDF, e.g. from a background thread"""
+    _load_font_templates()
+
+
+def _install_fonts(pdf):
+    """Give pdf its own copy of the cached fonts; False if none are available.
+
+    Parsing a TTF (cmap and metrics for every glyph) dominates small reports.
+    The per-glyph tables are shared read-only between documents; each copy
+    gets its own subset map and a fresh lazily-loaded fontTools handle,
+    because fpdf subsets that handle in place when the document is written.
+    """
+    templates = _load_font_templates()
+    if not templates:
+        return False
+    for fontkey, template in templates.items():
+        shared = {id(template.cw): template.cw, id(template.glyph_ids): template.glyph_ids}
+        font = copy.deepcopy(template, shared)
+        font.ttfont = ttLib.TTFont(template.ttffile, recalcTimestamp=False, lazy=True)
+        font.i = len(pdf.fonts) + 1
+        pdf.fonts[fontkey] = font
+    return True
+
+
+class ReportBuilder:
+    """Lays out a report page by page as analyses arrive.
+
+    Pages are added in index order even when results finish out of order;
+    early arrivals wait until the gap before them is filled. A report for
+    several views of one study is added with their names as views. The title page
+    is reserved up front and drawn at the end, once the image count is
+    known. Adding an index twice is a no-op, so a builder kept in session
+    state survives Streamlit reruns without duplicating pages.
+
+    With pages_only the builder lays out just the analysis pages, numbered
+    from first, for one chunk of a parallel report. generated_at pins the
+    timestamps so the same reports give byte-identical PDFs.
+    """
+
+    def __init__(self, location, first=1, pages_only=False, generated_at=None):
+        self.location = location
+        self.first = first
+        self.pages_only = pages_only
+        self.generated_at = generated_at
+        self._pdf_bytes = None
+        self._start()
+
+    def _start(self):
+        """Begin an empty document"""
+        self.count = 0
+        self.image_count = 0
+        self.entries = []
+        self._pending = {}
+        self.closed = False
+        self._closed_location = None
+        self.pdf = SafePDF()
+        if _install_fonts(self.pdf):
+            self.pdf.set_font(FONT_FAMILY, "", 12)
+        else:
+            # Use built-in fonts
+            self.pdf.set_font("Arial", "", 12)
+        if self.generated_at is not None:
+            self.pdf.set_creation_date(self.generated_at)
+
+        if self.pages_only:
+            self._fresh_page = False
+            return
+        self.pdf.add_page()
+        self.pdf.insert_toc_placeholder(self._render_title_page)
+        # The placeholder already broke to a fresh page for the first analysis
+        self._fresh_page = True
+
+    def add(self, index, name, report, views=None):
+        """Queue the report for upload position index and render what is ready"""
+        if self.closed or index < self.count or index in self._pending:
+            return
+        self._pending[index] = (name, report, views)
+        while self.count in self._pending:
+            name, report, views = self._pending.pop(self.count)
+            self.entries.append((name, report) if views is None else (name, report, views))
+            self.count += 1
+            self.image_count += len(views) if views else 1
+            with metrics.timed("pdf_page"):
+                self._new_page()
+                self._render_analysis_page(self.first + self.count - 1, name, report, views)
+
+    def close(self):
+        """Finish the document and return the SafePDF, ready for output()"""
+        if self.closed and self.location != self._closed_location:
+            # The specialist page already names the old location, so lay the pages out again
+            entries = self.entries
+            self._start()
+            for index, (name, report, *views) in enumerate(entries):
+                self.add(index, name, report, *views)
+        if not self.closed and not self.pages_only:
+            with metrics.timed("pdf_finish"):
+                self._new_page()
+                self._render_specialist_page()
+        self.closed = True
+        self._closed_location = self.location
+        return self.pdf
+
+    def to_bytes(self):
+        """Finish the document and return the PDF bytes, rendered once per location"""
+        if self._pdf_bytes is None or self._pdf_bytes[0] != self.location:
+            pdf = self.close()
+            # output() lays out the deferred title page, subsets fonts and compresses
+            with metrics.timed("pdf_output"):
+                self._pdf_bytes = (self.location, bytes(pdf.output()))
+        return self._pdf_bytes[1]
+
+    def _new_page(self):
+        if self._fresh_page:
+            self._fresh_page = False
+        else:
+            self.pdf.add_page()
+
+    def _render_title_page(self, pdf, outline):
+        location = self.location
+        count = self.image_count
+
+        # Try to add hospital logo (place logo.png in the same directory)
+        logo_added = pdf.add_logo(os.path.join(ASSETS_DIR, "logo.png"), w=60, h=60)
+    
+        if logo_added:
+            pdf.ln(70)  # Space after logo
+        else:
+            pdf.ln(20)  # Space after text logo
+    
+        # Title
+        pdf.set_font_size(18)
+        pdf.safe_cell(0, 12, "X-RAY MEDICAL ANALYSIS REPORT", ln=True, align='C', style='bold')
+        pdf.ln(10)
+    
+        # Subtitle
+        pdf.set_font_size(12)
+        pdf.safe_cell(0, 8, f"Generated for location: {location}", ln=True, align='C', style='italic')
+        pdf.safe_cell(0, 8, f"Total images analyzed: {count}", ln=True, align='C', style='italic')
+        if self.image_count != self.count:
+            pdf.safe_cell(0, 8, f"Reports: {self.count}, multi-view studies combined", ln=True, align='C', style='italic')
+    
+        # Add timestamp
+        timestamp = (self.generated_at or datetime.now()).strftime("%B %d, %Y at %I:%M %p")
+        pdf.safe_cell(0, 8, f"Report generated on: {timestamp}", ln=True, align='C', style='italic')
+    
+        pdf.ln(15)
+    
+        # Add disclaimer box
+        pdf.set_font_size(10)
+        pdf.safe_multi_cell(0, 6, "IMPORTANT DISCLAIMER: This AI-generated analysis is for educational and informational purposes only. It should not be used as a substitute for professional medical diagnosis, treatment, or advice. Always consult with qualified healthcare professionals for medical decisions.", style='italic')
+
+    def _render_analysis_page(self, i, name, report, views=None):
+        pdf = self.pdf
+
+        # Image header with decorative line
+        pdf.set_font_size(16)
+        pdf.safe_cell(0, 10, f"ANALYSIS REPORT {i}", ln=True, align='C', style='bold')
+        pdf.ln(3)
+        pdf.set_font_size(12)
+        if views:
+            pdf.safe_cell(0, 8, f"Study: {name}", ln=True, align='C', style='italic')
+            pdf.safe_multi_cell(0, 6, f"Views: {', '.join(views)}", align='C', style='italic')
+        else:
+            pdf.safe_cell(0, 8, f"Image: {name}", ln=True, align='C', style='italic')
+    
+        # Add a line separator
+        pdf.ln(8)
+        pdf.line(20, pdf.get_y(), pdf.w-20, pdf.get_y())
+        pdf.ln(8)
+    
+        # Reset font size for content
+        pdf.set_font_size(11)
+    
+        # Process report content
+        if report:
+            pdf.write_report(parse_report(report))
+
+    def _render_specialist_page(self):
+        pdf = self.pdf
+        location = self.location
+
+        pdf.set_font_size(16)
+        pdf.safe_cell(0, 10, "SPECIALIST RECOMMENDATIONS", ln=True, align='C', style='bold')
+        pdf.ln(10)
+    
+        # Add a line separator
+        pdf.line(20, pdf.get_y(), pdf.w-20, pdf.get_y())
+        pdf.ln(10)
+    
+        pdf.set_font_size(11)
+        pdf.set_text_color(0, 51, 102)  # Dark blue
+        pdf.safe_cell(0, 8, "Recommended Next Steps:", ln=True, style='bold')
+        pdf.set_text_color(0, 0, 0)  # Reset to black
+        pdf.ln(3)
+    
+        pdf.set_font_size(10)
+    
+        # Format the specialist advice with better structure
+        location_text = f"Based on your location: {location}, we recommend consulting with:"
+        pdf.safe_multi_cell(0, 5, location_text, style='regular')
+        pdf.ln(3)
+    
+        specialists = [
+            "• Orthopedic specialists for bone-related findings",
+            "• Radiologists for detailed image interpretation",
+            "• General practitioners for initial consultation",
+            "• Pulmonologists for chest X-ray findings"
+        ]
+    
+        for specialist in specialists:
+            pdf.safe_multi_cell(0, 5, specialist, style='regular')
+            pdf.ln(1)
+    
+        pdf.ln(4)
+    
+        # How to find specialists section
+        pdf.set_text_color(0, 51, 102)  # Dark blue
+        pdf.safe_cell(0, 7, "How to Find Specialists:", ln=True, style='bold')
+        pdf.set_text_color(0, 0, 0)  # Reset to black
+        pdf.ln(2)
+    
+        find_methods = [
+            "• Search 'specialist name + near me' in Google Maps",
+            "• Use healthcare provider directories",
+            "• Contact your insurance provider for in-network specialists",
+            "• Consider telemedicine options for initial consultations"
+        ]
+    
+        for method in find_methods:
+            pdf.safe_multi_cell(0, 5, method, style='regular')
+            pdf.ln(1)
+    
+        pdf.ln(4)
+    
+        # Emergency signs section
+        pdf.set_text_color(0, 51, 102)  # Dark blue
+        pdf.safe_cell(0, 7, "Emergency Signs to Watch For:", ln=True, style='bold')
+        pdf.set_text_color(0, 0, 0)  # Reset to black
+        pdf.ln(2)
+    
+        emergency_signs = [
+            "• Severe or worsening pain",
+            "• Difficulty breathing",
+            "• Signs of infection (fever, redness, swelling)",
+            "• Any concerning symptoms mentioned in the analysis above"
+        ]
+    
+        for sign in emergency_signs:
+            pdf.safe_multi_cell(0, 5, sign, style='regular')
+            pdf.ln(1)
+    
+        pdf.ln(4)
+    
+        final_note = "Remember: Early consultation with healthcare professionals leads to better outcomes."
+        pdf.safe_multi_cell(0, 5, final_note, style='regular')
+    
+        # Add footer
+        pdf.ln(15)
+        pdf.set_font_size(8)
+        pdf.safe_cell(0, 5, "This report was generated using AI analysis and should be reviewed by medical professionals.", ln=True, align='C', style='italic')
+
+
+def create_pdf_report(results, location, generated_at=None):
+    """Create PDF report with better error handling.
+
+    results holds (name, report) pairs, or (name, report, views) for one
+    combined report over the views of a study.
+    """
+    builder = ReportBuilder(location, generated_at=generated_at)
+    for index, (name, report, *views) in enumerate(results):
+        builder.add(index, name, report, *views)
+    return builder.close()
+
+
+def _pypdf():
+    """pypdf merges the chunks of a parallel report; without it reports are laid out serially"""
+    try:
+        import pypdf
+    except ImportError:
+        return None
+    return pypdf
+
+
+def pdf_workers(count, workers=None):
+    """Processes create_pdf_bytes would use for count reports; 1 means the serial path"""
+    if count < PARALLEL_MIN_REPORTS or _pypdf() is None:
+        return 1
+    chunks = -(-count // PAGES_PER_CHUNK)
+    return max(1, min(workers or os.cpu_count() or 1, chunks))
+
+
+# One pool per worker count, kept for the life of the process so later
+# reports skip the interpreter start-up and font parsing
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    with _pool_lock:
+        if workers not in _pools:
+            # spawn, not fork: the apps and the CLI run threads, and a forked
+            # child would inherit any lock they held at that moment
+            _pools[workers] = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                                  initializer=preload)
+        return _pools[workers]
+
+
+def _discard_pool(workers, pool):
+    # A pool with a dead worker refuses all further work; the next call starts a new one
+    with _pool_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _render_chunk(location, first, entries, generated_at):
+    """PDF bytes of the analysis pages for entries, numbered from first (runs in a worker)"""
+    builder = ReportBuilder(location, first=first, pages_only=True, generated_at=generated_at)
+    for index, (name, report, *views) in enumerate(entries):
+        builder.add(index, name, report, *views)
+    return bytes(builder.close().output())
+
+
+def create_pdf_bytes(results, location, workers=None, on_progress=None, generated_at=None):
+    """The bytes of create_pdf_report(results, location), laid out in parallel for large batches.
+
+    Chunks of PAGES_PER_CHUNK reports are laid out by a process pool while
+    this process draws the title and specialist pages; the pages are then
+    merged in report order, so the result does not depend on the worker
+    count or on which chunk finishes first. on_progress(done, total) is
+    called in this thread as reports are laid out. Each chunk embeds its
+    own font subset, so the file is somewhat larger than a serial one.
+    """
+    total = len(results)
+    workers = pdf_workers(total, workers)
+    generated_at = generated_at or datetime.now()
+    if workers > 1:
+        pool = _get_pool(workers)
+        try:
+            return _create_pdf_parallel(pool, results, location, on_progress, generated_at)
+        except BrokenProcessPool:
+            # A worker was killed (e.g. out of memory) or could not start
+            _discard_pool(workers, pool)
+            metrics.inc("pdf_pool_failures")
+    data = bytes(create_pdf_report(results, location, generated_at).output())
+    if on_progress:
+        on_progress(total, total)
+    return data
+
+
+def _create_pdf_parallel(pool, results, location, on_progress, generated_at):
+    total = len(results)
+    with metrics.timed("pdf_parallel"):
+        futures = {}
+        for start in range(0, total, PAGES_PER_CHUNK):
+            chunk = results[start:start + PAGES_PER_CHUNK]
+            futures[pool.submit(_render_chunk, location, start + 1, chunk, generated_at)] = (start, len(chunk))
+
+        # Title and specialist pages, with the totals of the whole batch
+        frame = ReportBuilder(location, generated_at=generated_at)
+        frame.count = total
+        frame.image_count = sum(len(views[0]) if views and views[0] else 1 for _, _, *views in results)
+        frame_data = bytes(frame.close().output())
+
+        chunks = {}
+        done = 0
+        for future in as_completed(futures):
+            start, size = futures[future]
+            chunks[start] = future.result()
+            done += size
+            if on_progress:
+                on_progress(done, total)
+
+        pypdf = _pypdf()
+        writer = pypdf.PdfWriter()
+        frame_pages = pypdf.PdfReader(io.BytesIO(frame_data))
+        writer.add_page(frame_pages.pages[0])
+        for start in sorted(chunks):
+            for page in pypdf.PdfReader(io.BytesIO(chunks[start])).pages:
+                writer.add_page(page)
+        writer.add_page(frame_pages.pages[-1])
+        writer.add_metadata(frame_pages.metadata)
+        out = io.BytesIO()
+        writer.write(out)
+    return out.getvalue()
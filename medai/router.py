@@ -0,0 +1,289 @@
+"""Spread analyses over several Ollama / LM Studio servers.
+
+Endpoints come from a spec such as
+
+    MEDAI_BACKENDS="ollama=http://gpu1:11434, ollama=http://gpu2:11434, lmstudio=http://gpu3:1234"
+
+where each entry is kind[:model]=base_url. Requests go to the healthy
+endpoint of the wanted kind with the fewest requests in flight
+(or the best latency-weighted score), and fail over to the other kind,
+with its own prompt and model, when every endpoint of that kind is down
+or saturated.
+"""
+import os
+import threading
+import time
+
+import requests
+
+from . import metrics
+from .analysis import LMSTUDIO_MODEL, OLLAMA_MODEL
+from .client import BackendClient, BackendOverloaded, BackendUnavailable
+from .models import KEEP_ALIVE, ModelManager, options_from_env, parse_keep_alive
+from .prompts import (REPORT_PROMPT, REPORT_REQUEST, STUDY_USER_PROMPT, USER_PROMPT, chat_payload,
+                      study_request)
+from .streaming import StreamStats, stream_ollama, stream_openai_chat
+
+KINDS = {
+    # kind: (default model, generate path, health-check path)
+    "ollama": (OLLAMA_MODEL, "/api/generate", "/api/tags"),
+    "lmstudio": (LMSTUDIO_MODEL, "/v1/chat/completions", "/v1/models"),
+}
+STRATEGIES = ("least_outstanding", "latency")
+
+# Errors raised before any text arrives that another endpoint may not hit
+FAILOVER_ERRORS = (BackendOverloaded, BackendUnavailable, requests.ConnectionError,
+                   requests.HTTPError)
+
+# Weight of the newest request in an endpoint's latency average
+LATENCY_ALPHA = 0.3
+
+
+def parse_endpoints(spec):
+    """Parse 'kind[:model]=url, ...' into (kind, model, url) tuples"""
+    endpoints = []
+    for entry in spec.replace("\n", ",").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, sep, url = entry.partition("=")
+        if not sep:
+            raise ValueError(f"backend {entry!r} should look like kind[:model]=url")
+        kind, _, model = name.strip().partition(":")
+        if kind not in KINDS:
+            raise ValueError(f"unknown backend kind {kind!r}; expected one of {', '.join(KINDS)}")
+        endpoints.append((kind, model or KINDS[kind][0], url.strip().rstrip("/")))
+    return endpoints
+
+
+class Endpoint:
+    """One model server: its client, health and recent latency"""
+
+    def __init__(self, kind, model, url, keep_alive=KEEP_ALIVE, options=None, **client_config):
+        self.kind = kind
+        self.model = model
+        self.url = url
+        self.name = f"{kind}@{url}"
+        self.api = url + KINDS[kind][1]
+        self.health_url = url + KINDS[kind][2]
+        self.client = BackendClient(self.name, **client_config)
+        # Ollama servers keep their model loaded and tuned the same way as the local one
+        self.manager = ModelManager(model, url, keep_alive, options, self.client) if kind == "ollama" else None
+        self.healthy = True
+        self.latency = None
+        self.last_error = None
+
+    @property
+    def outstanding(self):
+        return self.client.outstanding
+
+    @property
+    def available(self):
+        return self.healthy and self.client.breaker.state != "open"
+
+    def check(self, timeout=2.0):
+        self.healthy = self.client.ping(self.health_url, timeout)
+        return self.healthy
+
+    def record_latency(self, seconds):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_ALPHA * (seconds - self.latency)
+
+    def generate(self, image, prompt=REPORT_PROMPT, stream=True, stats=None, views=None):
+        """Yield report text for an imaging.Preprocessed image from this server.
+
+        image may also be a list of the views (named by views) of one study.
+        """
+        if self.kind == "ollama":
+            request = study_request(views) if views else REPORT_REQUEST
+            b64 = [view.b64 for view in image] if views else image.b64
+            payload = self.manager.payload(b64, prompt, request)
+            if stream:
+                yield from stream_ollama(self.api, payload, stats=stats, client=self.client)
+                return
+            response = self.client.post(self.api, json=dict(payload, stream=False))
+            response.raise_for_status()
+            body = response.json()
+            if stats is not None:
+                stats.read_ollama_timings(body)
+            yield body["response"]
+        else:
+            # MedGemma gets its own system prompt; prompt is written for LLaVA
+            user_prompt = study_request(views, STUDY_USER_PROMPT) if views else USER_PROMPT
+            payload = chat_payload(image, self.model, user_prompt=user_prompt)
+            if stream:
+                yield from stream_openai_chat(self.api, payload, stats=stats, client=self.client)
+                return
+            response = self.client.post(self.api, json=payload)
+            response.raise_for_status()
+            yield response.json()["choices"][0]["message"]["content"]
+
+    def status(self):
+        return {
+            "name": self.name,
+            "model": self.model,
+            "healthy": self.healthy,
+            "breaker": self.client.breaker.state,
+            "outstanding": self.outstanding,
+            "latency": self.latency,
+        }
+
+
+class Router:
+    """Pick an endpoint per request, health-check them and fail over between kinds"""
+
+    def __init__(self, endpoints, strategy="least_outstanding", failover=True,
+                 health_interval=10.0, health_timeout=2.0, keep_alive=KEEP_ALIVE, options=None,
+                 **client_config):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"unknown routing strategy {strategy!r}; expected one of {', '.join(STRATEGIES)}")
+        if not endpoints:
+            raise ValueError("at least one backend endpoint is required")
+        self.strategy = strategy
+        self.failover = failover
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.endpoints = [Endpoint(kind, model, url, keep_alive, options, **client_config)
+                          for kind, model, url in endpoints]
+        self.stats = {"requests": 0, "failovers": 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Set once every endpoint has answered (or failed) its first probe
+        self._checked = threading.Event()
+        self._thread = None
+        for endpoint in self.endpoints:
+            metrics.register("endpoint", {"endpoint": endpoint.name}, lambda e=endpoint: {
+                "healthy": e.healthy,
+                "outstanding": e.outstanding,
+                "latency_seconds": e.latency or 0.0,
+            })
+
+    def check_health(self):
+        """Probe every endpoint once; failing ones are skipped until they recover"""
+        for endpoint in self.endpoints:
+            endpoint.check(self.health_timeout)
+
+    def start(self, wait=False):
+        """Check health in the background now and then every health_interval seconds.
+
+        Endpoints count as healthy until their first probe is in, so a page
+        never waits on a slow or unreachable server; wait=True blocks until
+        that first round is done, for batch runs.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._health_loop, name="medai-health", daemon=True)
+            self._thread.start()
+        if wait:
+            self._checked.wait()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def prewarm(self):
+        """Load the model on every healthy Ollama endpoint in the background"""
+        threading.Thread(target=self._prewarm, name="medai-router-prewarm", daemon=True).start()
+        return self
+
+    def _prewarm(self):
+        # Only servers that answered their first probe are worth loading
+        if self._thread is not None:
+            self._checked.wait()
+        for endpoint in self.endpoints:
+            if endpoint.manager is not None and endpoint.healthy:
+                endpoint.manager.prewarm()
+
+    def _health_loop(self):
+        self.check_health()
+        self._checked.set()
+        if not self.health_interval:
+            return
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    def _score(self, endpoint):
+        if self.strategy == "latency":
+            # Expected wait: everything queued ahead of us plus our own request
+            known = [e.latency for e in self.endpoints if e.latency is not None]
+            latency = endpoint.latency if endpoint.latency is not None else (
+                sum(known) / len(known) if known else 1.0)
+            return ((endpoint.outstanding + 1) * latency, endpoint.outstanding)
+        return (endpoint.outstanding, endpoint.latency or 0.0)
+
+    def pick(self, kind=None, exclude=()):
+        """Best endpoint for kind, falling back to the other kind when allowed"""
+        candidates = [e for e in self.endpoints if e.available and e not in exclude]
+        preferred = [e for e in candidates if kind is None or e.kind == kind]
+        # Saturated endpoints only get work when nothing else has a free slot
+        for pool in (
+            [e for e in preferred if not e.client.saturated],
+            [e for e in candidates if not e.client.saturated] if self.failover else [],
+            preferred,
+            candidates if self.failover else [],
+        ):
+            if pool:
+                return min(pool, key=self._score)
+        return None
+
+    def generate(self, image, kind=None, prompt=REPORT_PROMPT, stream=True, stats=None, views=None):
+        """Yield report text from the best endpoint, failing over until text arrives.
+
+        stats.served_by is set to the endpoint that answered, whose kind and
+        model may differ from the ones asked for after a failover. A study's
+        images are passed as a list together with their view names.
+        """
+        stats = stats if stats is not None else StreamStats()
+        tried = []
+        last_error = None
+        with self._lock:
+            self.stats["requests"] += 1
+        while True:
+            endpoint = self.pick(kind, exclude=tried)
+            if endpoint is None:
+                message = f"no {kind or 'model'} backend available"
+                raise BackendUnavailable(f"{message}: {last_error}" if last_error else message)
+            if tried:
+                with self._lock:
+                    self.stats["failovers"] += 1
+                metrics.inc("router_failovers")
+            tried.append(endpoint)
+            stats.served_by = endpoint
+
+            # Each attempt is timed on its own, from the moment it is sent
+            stats.start()
+            started = stats.started
+            produced = False
+            try:
+                for chunk in endpoint.generate(image, prompt, stream, stats, views):
+                    produced = True
+                    yield chunk
+            except FAILOVER_ERRORS as e:
+                endpoint.last_error = str(e)
+                if isinstance(e, requests.ConnectionError):
+                    # Drained until the next health check says otherwise
+                    endpoint.healthy = False
+                if produced:
+                    raise
+                last_error = e
+                continue
+            endpoint.record_latency(time.perf_counter() - started)
+            return
+
+    def status(self):
+        return [endpoint.status() for endpoint in self.endpoints]
+
+
+def router_from_env(environ=os.environ):
+    """Router for MEDAI_BACKENDS (routing from MEDAI_ROUTING), or None if unset.
+
+    Ollama endpoints get MEDAI_KEEP_ALIVE and the MEDAI_NUM_* options.
+    """
+    spec = environ.get("MEDAI_BACKENDS", "").strip()
+    if not spec:
+        return None
+    strategy = environ.get("MEDAI_ROUTING", "least_outstanding")
+    keep_alive = parse_keep_alive(environ.get("MEDAI_KEEP_ALIVE", KEEP_ALIVE))
+    return Router(parse_endpoints(spec), strategy=strategy, keep_alive=keep_alive,
+                  options=options_from_env(environ)).start()
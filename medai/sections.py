@@ -0,0 +1,135 @@
+"""Single-pass parser that splits model output into report sections."""
+import json
+import re
+from collections import namedtuple
+
+# A line is a section header if it is bold, ends with a colon, names a known
+# section or carries one of the prompt's section emojis. The first two are
+# plain string checks; HEADER_RE only runs on the lowercased remainder.
+HEADER_RE = re.compile(
+    r"[🩻🩺💊💙]|medical analysis:|treatment plan:|suggested treatment|medications:"
+    r"|possible medications|emotional healing|healing message:"
+)
+
+# Canonical section keys, checked in order against the header text
+SECTION_KEYS = (
+    ("medical_analysis", re.compile(r"analysis|findings|impression", re.IGNORECASE)),
+    ("treatment_plan", re.compile(r"treatment|plan|management", re.IGNORECASE)),
+    ("medications", re.compile(r"medication|drug|prescri", re.IGNORECASE)),
+    ("emotional_message", re.compile(r"emotional|healing|message|encourag", re.IGNORECASE)),
+)
+
+BOLD_RE = re.compile(r"\*\*([^*]+)\*\*")
+EMOJI_RE = re.compile(r"[🩻🩺💊💙]")
+# Characters the PDF fonts cannot be trusted with
+UNSUPPORTED_RE = re.compile(r"[^\w\s\-.,;:()!?\n\r\u00A0-\u017F\u0100-\u024F]")
+# Same filter as UNSUPPORTED_RE for pure-ASCII text, applied with str.translate
+ASCII_UNSUPPORTED = {
+    code: None
+    for code in range(128)
+    if not (chr(code).isalnum() or chr(code).isspace() or chr(code) in "_-.,;:()!?")
+}
+
+# ends_block marks the last paragraph of a blank-line separated block,
+# which the PDF follows with a little more space
+Paragraph = namedtuple("Paragraph", ["text", "ends_block"])
+
+
+def clean_text(text):
+    """Clean text for PDF compatibility"""
+    if not text:
+        return ""
+    text = str(text)
+    text = text.translate(ASCII_UNSUPPORTED) if text.isascii() else UNSUPPORTED_RE.sub("", text)
+    # Collapses whitespace runs and strips, like re.sub(r"\s+", " ", ...).strip()
+    return " ".join(text.split())
+
+
+def is_header(line):
+    """True if a stripped, non-empty line starts a new section"""
+    return line.endswith(":") or "**" in line or HEADER_RE.search(line.lower()) is not None
+
+
+def section_key(title):
+    """Map a header to one of SECTION_KEYS, or None if it is unrecognised"""
+    for key, pattern in SECTION_KEYS:
+        if pattern.search(title):
+            return key
+    return None
+
+
+class Section:
+    """A header (None for text before the first header) and its paragraphs"""
+
+    __slots__ = ("key", "title", "paragraphs")
+
+    def __init__(self, key, title):
+        self.key = key
+        self.title = title
+        self.paragraphs = []
+
+    @property
+    def text(self):
+        return "\n\n".join(paragraph.text for paragraph in self.paragraphs)
+
+    def to_dict(self):
+        return {"key": self.key, "title": self.title, "text": self.text}
+
+
+class ParsedReport:
+    """Sections of one model report, already cleaned for rendering"""
+
+    def __init__(self, sections):
+        self.sections = sections
+
+    def get(self, key):
+        """Text of all sections with the given canonical key"""
+        return "\n\n".join(s.text for s in self.sections if s.key == key and s.paragraphs)
+
+    def to_dict(self):
+        return {
+            "sections": [section.to_dict() for section in self.sections],
+            **{key: self.get(key) for key, _ in SECTION_KEYS},
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), ensure_ascii=False, **kwargs)
+
+
+def parse_report(report):
+    """Split a model report into sections in a single pass over its lines.
+
+    Consecutive body lines are joined into one paragraph until a header
+    or an empty line, matching how the PDF has always laid reports out;
+    a line of only spaces is skipped without ending the paragraph.
+    """
+    sections = [Section(None, None)]
+    paragraph = []
+
+    def flush(ends_block):
+        if paragraph:
+            text = clean_text(" ".join(paragraph))
+            if text:
+                sections[-1].paragraphs.append(Paragraph(text, ends_block))
+            paragraph.clear()
+
+    for raw_line in (report or "").strip().split("\n"):
+        if not raw_line:
+            flush(ends_block=True)
+            continue
+        line = raw_line.strip()
+        if not line:
+            continue
+        if is_header(line):
+            flush(ends_block=False)
+            title = BOLD_RE.sub(r"\1", line) if "**" in line else line
+            title = clean_text(EMOJI_RE.sub("", title))
+            # Unrecognised sub-headers ("Follow-up imaging:") stay in the current section
+            sections.append(Section(section_key(title) or sections[-1].key, title))
+        else:
+            paragraph.append(line)
+    flush(ends_block=True)
+
+    if not sections[0].paragraphs:
+        sections.pop(0)
+    return ParsedReport(sections)
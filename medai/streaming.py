@@ -0,0 +1,137 @@
+import json
+import time
+
+from .client import get_client
+
+
+class StreamStats:
+    """Timing collected while a completion streams in"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.chunks = 0
+        # Exact token count when the backend reports one (Ollama eval_count)
+        self.token_count = None
+        self.eval_seconds = None
+        # Ollama's own timings: prompt processing, model load and the whole call
+        self.prompt_tokens = None
+        self.prompt_eval_seconds = None
+        self.load_seconds = None
+        self.total_seconds = None
+        # router.Endpoint that answered, when requests go through a Router
+        self.served_by = None
+        # Hamming distance to the image whose report was reused, if any
+        self.near_duplicate = None
+
+    def start(self):
+        """Restart the clock as a request is sent; time spent queued before it is not the model's"""
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.chunks = 0
+
+    def mark_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.chunks += 1
+
+    def read_ollama_timings(self, body):
+        """Copy the counts and nanosecond durations from Ollama's final message"""
+        if "eval_count" in body:
+            self.token_count = body["eval_count"]
+        if "prompt_eval_count" in body:
+            self.prompt_tokens = body["prompt_eval_count"]
+        if body.get("eval_duration"):
+            self.eval_seconds = body["eval_duration"] / 1e9
+        if body.get("prompt_eval_duration"):
+            self.prompt_eval_seconds = body["prompt_eval_duration"] / 1e9
+        if body.get("load_duration"):
+            self.load_seconds = body["load_duration"] / 1e9
+        if body.get("total_duration"):
+            self.total_seconds = body["total_duration"] / 1e9
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started
+
+    @property
+    def tokens(self):
+        return self.token_count if self.token_count is not None else self.chunks
+
+    @property
+    def tokens_per_second(self):
+        if self.eval_seconds:
+            return self.tokens / self.eval_seconds
+        if self.first_token_at is None or self.finished_at is None:
+            return None
+        elapsed = self.finished_at - self.first_token_at
+        return self.tokens / elapsed if elapsed > 0 else None
+
+    def summary(self):
+        """Short human-readable line for the UI"""
+        parts = []
+        if self.prompt_eval_seconds is not None:
+            parts.append(f"prompt {self.prompt_eval_seconds:.1f}s")
+        if self.time_to_first_token is not None:
+            parts.append(f"first token {self.time_to_first_token:.1f}s")
+        if self.tokens_per_second is not None:
+            parts.append(f"{self.tokens_per_second:.1f} tokens/s")
+        parts.append(f"{self.tokens} tokens")
+        return " · ".join(parts)
+
+
+def stream_ollama(url, payload, stats=None, client=None):
+    """Yield response text chunks from Ollama's NDJSON /api/generate stream"""
+    stats = stats if stats is not None else StreamStats()
+    client = client or get_client("ollama")
+    body = dict(payload, stream=True)
+    with client.stream(url, json=body) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(chunk_size=None):
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            text = chunk.get("response", "")
+            if text:
+                stats.mark_token()
+                yield text
+            if chunk.get("done"):
+                stats.read_ollama_timings(chunk)
+                break
+    stats.finish()
+
+
+def stream_openai_chat(url, payload, headers=None, stats=None, client=None):
+    """Yield content deltas from an OpenAI-compatible SSE chat stream (LM Studio)"""
+    stats = stats if stats is not None else StreamStats()
+    client = client or get_client("lmstudio")
+    body = dict(payload, stream=True)
+    with client.stream(url, json=body, headers=headers) as response:
+        response.raise_for_status()
+        for raw_line in response.iter_lines(chunk_size=None):
+            # Decode ourselves: SSE is UTF-8 but often sent without a charset
+            line = raw_line.decode("utf-8")
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            usage = chunk.get("usage")
+            if usage and usage.get("completion_tokens"):
+                stats.token_count = usage["completion_tokens"]
+            for choice in chunk.get("choices", []):
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    stats.mark_token()
+                    yield text
+    stats.finish()
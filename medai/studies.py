@@ -0,0 +1,104 @@
+"""Group uploads into multi-view studies and size them for one model request.
+
+Views of the same study (PA + lateral chest, AP + lateral ankle) are found
+by DICOM StudyInstanceUID, or else by file name: the name minus any
+trailing view label (patient12_PA.png and patient12_LAT.png both belong to
+"patient12"), or the first group of a custom pattern. Each study is then
+split into requests that fit the model's image and context-token budget.
+"""
+import os
+import re
+from collections import namedtuple
+
+from .dicom import is_dicom, read_study_uid
+
+# View labels stripped from the end of a file name to find its study. Bare
+# numbers are left alone: scan_001 and scan_002 are usually different patients
+VIEW_SUFFIX_RE = re.compile(
+    r"[\s_.-]+(?:pa|ap|lat|lateral|obl|oblique|frontal|mortise|axial|view[\s_-]*\d+)$",
+    re.IGNORECASE,
+)
+
+# name: what reports and the PDF call the study; key: what grouped it;
+# members: (file name, data) pairs in upload order
+Study = namedtuple("Study", ["name", "key", "members"])
+
+# Images per request, prompt tokens one image costs and the context they share
+StudyBudget = namedtuple("StudyBudget", ["max_images", "image_tokens", "context_tokens"])
+
+DEFAULT_STUDY_BUDGET = StudyBudget(max_images=4, image_tokens=576, context_tokens=4096)
+STUDY_BUDGETS = {
+    # LLaVA 1.5 turns a 336 px image into 576 tokens; LLaVA 1.6 tiles larger
+    # images into up to 2880, so give it a bigger num_ctx or fewer images
+    "llava": StudyBudget(max_images=4, image_tokens=576, context_tokens=4096),
+    # Gemma 3's vision encoder always produces 256 tokens per image
+    "medgemma-4b-it": StudyBudget(max_images=6, image_tokens=256, context_tokens=8192),
+}
+# Room kept for the instructions and the report itself
+RESERVED_TOKENS = 1536
+
+
+def study_budget_for(model, options=None):
+    """Model's study budget, with the context size from Ollama num_ctx if set"""
+    budget = STUDY_BUDGETS.get(model, DEFAULT_STUDY_BUDGET)
+    if options and options.get("num_ctx"):
+        budget = budget._replace(context_tokens=options["num_ctx"])
+    return budget
+
+
+def images_per_request(budget, reserved_tokens=RESERVED_TOKENS):
+    """How many images fit one request, never fewer than one"""
+    fit = (budget.context_tokens - reserved_tokens) // budget.image_tokens
+    return max(1, min(budget.max_images, fit))
+
+
+def file_study_key(name, pattern=None):
+    """Study key from a file name: pattern's first group, or the name without its view label"""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    if pattern is not None:
+        match = re.search(pattern, stem)
+        # Names the pattern does not recognise stay studies of their own
+        return match.group(1) if match else stem
+    return VIEW_SUFFIX_RE.sub("", stem) or stem
+
+
+def study_key(name, data, pattern=None):
+    """DICOM StudyInstanceUID when data (bytes or a path) carries one, else file_study_key"""
+    if isinstance(data, bytes):
+        dicom = is_dicom(data)
+    else:
+        with open(data, "rb") as f:
+            dicom = is_dicom(f.read(132))
+    if dicom:
+        try:
+            uid = read_study_uid(data)
+        except (ImportError, ValueError, OSError):
+            uid = ""
+        if uid:
+            return "uid:" + uid
+    return "name:" + file_study_key(name, pattern)
+
+
+def group_studies(items, pattern=None, max_images=None):
+    """Group (name, data) items into Studies in upload order.
+
+    Studies with more than max_images views are split into consecutive
+    parts, each its own Study named "<study> (part i/n)".
+    """
+    groups = {}
+    for name, data in items:
+        groups.setdefault(study_key(name, data, pattern), []).append((name, data))
+
+    studies = []
+    for key, members in groups.items():
+        if key.startswith("uid:"):
+            # UIDs mean nothing to a reader; name the study after its first file
+            label = file_study_key(members[0][0])
+        else:
+            label = key[len("name:"):]
+        size = max_images or len(members)
+        parts = [members[i:i + size] for i in range(0, len(members), size)]
+        for number, part in enumerate(parts, 1):
+            name = label if len(parts) == 1 else f"{label} (part {number}/{len(parts)})"
+            studies.append(Study(name, key, part))
+    return studies